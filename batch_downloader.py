@@ -0,0 +1,379 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Iterable, Iterator, Optional
+
+from bookmark import Bookmark, get_video_id
+from metadata_cache import MetadataCache
+from metrics import Metrics, measure
+from session_pool import SessionPool, borrow_downloader, create_downloader
+
+if TYPE_CHECKING:
+    import yt_dlp
+
+
+def get_video_options(output_path='Downloads') -> dict:
+    """
+    :param output_path: str. The directory where the downloaded files are saved
+    :return: dict. The yt_dlp options for downloading a video as mkv
+    """
+
+    return {
+        'format': 'bestvideo[height<=2160]+bestaudio/best',  # Download the best video and audio separately
+        'outtmpl': output_path + '/%(title)s.%(ext)s',  # Template for output filename
+        'merge_output_format': 'mkv',  # Merge into mkv format
+        'postprocessors': [{
+            'key': 'FFmpegVideoConvertor',  # Ensures conversion if needed
+            'preferedformat': 'mkv',  # Preferred format for the output file
+        }],
+        'noplaylist': True,  # Do not download the entire playlist, only the video
+        'playlist_items': '1',  # Only download the first video if it's a playlist
+    }
+
+
+def get_mp3_options(output_path='Downloads') -> dict:
+    """
+    :param output_path: str. The directory where the downloaded files are saved
+    :return: dict. The yt_dlp options for downloading the audio of a video as mp3
+    """
+
+    return {
+        'format': 'bestaudio/best',
+        'outtmpl': output_path + '/%(title)s.%(ext)s',  # Save as original format first
+        'postprocessors': [{
+            'key': 'FFmpegExtractAudio',
+            'preferredcodec': 'mp3',
+            'preferredquality': '0',  # '0' ensures the best possible quality
+        }],
+        'noplaylist': True,  # Do not download the entire playlist, only the video
+        'playlist_items': '1',  # Only download the first video if it's a playlist
+    }
+
+
+def get_audio_options(output_path='Downloads') -> dict:
+    """
+    :param output_path: str. The directory where the downloaded files are saved
+    :return: dict. The yt_dlp options for downloading the audio of a video in its own codec. It is copied into the
+    container of the codec, e.g. m4a or opus, without re-encoding it
+    """
+
+    return {
+        'format': 'bestaudio/best',
+        'outtmpl': output_path + '/%(title)s.%(ext)s',
+        'postprocessors': [{
+            'key': 'FFmpegExtractAudio',
+            'preferredcodec': 'best',  # Keep the codec, so the stream is copied
+        }],
+        'noplaylist': True,  # Do not download the entire playlist, only the video
+        'playlist_items': '1',  # Only download the first video if it's a playlist
+    }
+
+
+def get_playlist_options() -> dict:
+    """
+    :return: dict. The yt_dlp options for listing the videos of a playlist or a channel, without their metadata
+    """
+
+    return {
+        'extract_flat': 'in_playlist',  # Only the ids and the titles of the entries, as listed on the page
+        'lazy_playlist': True,  # Yield the entries as the pages of the playlist are loaded
+        'quiet': True,
+    }
+
+
+def iter_playlist_entries(url: str, depth: int = 2) -> Iterator[Bookmark]:
+    """
+    Lists the videos of a playlist or a channel by flat extraction, page by page, so the first videos are yielded
+    before the whole playlist is loaded.
+
+    :param url: str. The url of the playlist or the channel
+    :param depth: int. The levels of nested playlists, which are listed, e.g. the tabs of a channel
+    :return: generator of Bookmark objects of the videos, in the order of the playlist
+    """
+
+    with create_downloader(get_playlist_options()) as ydl:
+        yield from _iter_entries(ydl, url, depth)
+
+
+def _iter_entries(ydl: 'yt_dlp.YoutubeDL', url: str, depth: int) -> Iterator[Bookmark]:
+    result = ydl.extract_info(url, download=False, process=False)
+
+    # A channel url may redirect to one of its tabs
+    if result.get('_type') in ('url', 'url_transparent') and not result.get('entries'):
+        if depth > 0 and result.get('url'):
+            yield from _iter_entries(ydl, result['url'], depth - 1)
+        return
+
+    for entry in result.get('entries') or []:
+        if not entry:
+            continue
+
+        entry_url = entry.get('url') or entry.get('webpage_url') or ''
+        video_id = get_video_id(entry_url) or (entry.get('id') if entry.get('ie_key') == 'Youtube' else None)
+
+        if video_id:
+            yield Bookmark(entry.get('title') or video_id, f'https://www.youtube.com/watch?v={video_id}', None)
+        elif depth > 0 and entry_url:
+            # A nested playlist, e.g. the videos or the shorts tab of a channel
+            yield from _iter_entries(ydl, entry_url, depth - 1)
+
+
+def extract_info(ydl: 'yt_dlp.YoutubeDL', url: str, cache: Optional[MetadataCache] = None,
+                 metrics: Optional[Metrics] = None) -> dict:
+    """
+    Downloads the video, reusing the cached metadata, if there is such.
+
+    :param ydl: yt_dlp.YoutubeDL. The configured downloader
+    :param url: str. The url of the YouTube video
+    :param cache: MetadataCache, optional. If it is not filled, the metadata is always extracted
+    :param metrics: Metrics, optional. If it is filled, the extraction and the download are recorded in it as the
+    'extract_info' and the 'download' stages
+    :return: dict. The info dictionary of the downloaded video, as returned by yt_dlp
+    """
+
+    video_id = get_video_id(url)
+
+    # Without a cache, or for urls which are not videos (e.g. playlists), extract and download in one step
+    if cache is None or video_id is None:
+        with measure(metrics, 'download', url) as record:
+            info_dict = ydl.extract_info(url, download=True)
+            record['bytes'] = get_downloaded_bytes(ydl, info_dict)
+
+        return info_dict
+
+    info_dict = cache.get(video_id)
+
+    if info_dict is not None:
+        try:
+            return download_info(ydl, info_dict, url, metrics)
+        except Exception:
+            # The cached format urls may have expired earlier than expected, so extract them again
+            cache.delete(video_id)
+
+    with measure(metrics, 'extract_info', url):
+        info_dict = ydl.sanitize_info(ydl.extract_info(url, download=False))
+
+    cache.put(video_id, info_dict)
+
+    return download_info(ydl, info_dict, url, metrics)
+
+
+def download_info(ydl: 'yt_dlp.YoutubeDL', info_dict: dict, url: str, metrics: Optional[Metrics] = None) -> dict:
+    """
+    Downloads the formats of the extracted video.
+
+    :param ydl: yt_dlp.YoutubeDL. The configured downloader
+    :param info_dict: dict. The sanitized info dictionary of the video, without downloading
+    :param url: str. The url of the video, which identifies the job in the metrics
+    :param metrics: Metrics, optional. If it is filled, the download is recorded in it
+    :return: dict. The info dictionary of the downloaded video, as returned by yt_dlp
+    """
+
+    with measure(metrics, 'download', url) as record:
+        info_dict = ydl.process_ie_result(info_dict, download=True)
+        record['bytes'] = get_downloaded_bytes(ydl, info_dict)
+
+    return info_dict
+
+
+def get_output_path(ydl: 'yt_dlp.YoutubeDL', info_dict: dict) -> str:
+    """
+    :param ydl: yt_dlp.YoutubeDL. The downloader, which downloaded the video
+    :param info_dict: dict. The info dictionary of the downloaded video
+    :return: str. The final path after merging, as reported by yt_dlp
+    """
+
+    requested_downloads = info_dict.get('requested_downloads') or [{}]
+    return requested_downloads[0].get('filepath') or ydl.prepare_filename(info_dict)
+
+
+def get_downloaded_bytes(ydl: 'yt_dlp.YoutubeDL', info_dict: dict) -> int:
+    """
+    :return: int. The size of the downloaded file, or 0 if it is not on the disk, e.g. for a playlist
+    """
+
+    try:
+        return os.path.getsize(get_output_path(ydl, info_dict))
+    except (OSError, TypeError, KeyError, ValueError):
+        return 0
+
+
+def resolve_info(ydl: 'yt_dlp.YoutubeDL', url: str, cache: Optional[MetadataCache] = None,
+                 metrics: Optional[Metrics] = None) -> dict:
+    """
+    Extracts the metadata of the video and chooses its formats without downloading it, reusing the cached metadata,
+    if there is such.
+
+    :param ydl: yt_dlp.YoutubeDL. The configured downloader
+    :param url: str. The url of the YouTube video
+    :param cache: MetadataCache, optional. If it is not filled, the metadata is always extracted
+    :param metrics: Metrics, optional. If it is filled, the extraction is recorded in it as the 'extract_info' stage
+    :return: dict. The sanitized info dictionary of the video
+    """
+
+    video_id = get_video_id(url)
+    info_dict = cache.get(video_id) if cache is not None and video_id is not None else None
+
+    if info_dict is None:
+        with measure(metrics, 'extract_info', url):
+            info_dict = ydl.sanitize_info(ydl.extract_info(url, download=False))
+
+        if cache is not None and video_id is not None:
+            cache.put(video_id, info_dict)
+
+    return info_dict
+
+
+def prefetch_metadata(bookmarks: Iterable[Bookmark], options: dict, cache: MetadataCache, max_workers: int = 4,
+                      pool: Optional[SessionPool] = None, metrics: Optional[Metrics] = None) -> int:
+    """
+    Resolves the metadata of all bookmarks, which are not cached yet, in parallel and without downloading them.
+
+    :param bookmarks: iterable of Bookmark objects
+    :param options: dict. The yt_dlp options of the following downloads, as they determine the chosen formats
+    :param cache: MetadataCache. The cache, where the metadata is stored
+    :param max_workers: int. The maximum number of extractions running at the same time
+    :param pool: SessionPool, optional. The sessions of yt_dlp, which are reused
+    :param metrics: Metrics, optional. If it is filled, every extraction is recorded in it
+    :return: int. The number of newly cached bookmarks
+    """
+
+    # Resolve every video only once, even if it is bookmarked more than once
+    video_ids = {}
+    for b in bookmarks:
+        video_id = get_video_id(b.url)
+        if video_id is not None and video_id not in cache:
+            video_ids[video_id] = b.url
+
+    def prefetch_single(video_id: str, url: str) -> bool:
+        # A failure is not reported here, the following download will fail and report it
+        try:
+            with borrow_downloader({**options, 'quiet': True}, pool) as ydl, \
+                    measure(metrics, 'extract_info', url, prefetch=True):
+                cache.put(video_id, ydl.sanitize_info(ydl.extract_info(url, download=False)))
+            return True
+        except Exception:
+            return False
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        return sum(executor.map(prefetch_single, video_ids.keys(), video_ids.values()))
+
+
+def download_video(url: str, output_path='Downloads', cache: Optional[MetadataCache] = None,
+                   pool: Optional[SessionPool] = None) -> dict:
+    """
+    :param url: str. The url of the YouTube video
+    :param output_path: str. The directory where the video is saved
+    :param cache: MetadataCache, optional. The cache of the extracted metadata
+    :param pool: SessionPool, optional. The sessions of yt_dlp, which are reused
+    :return: dict. The info dictionary of the downloaded video, as returned by yt_dlp
+    """
+
+    with borrow_downloader(get_video_options(output_path), pool) as ydl:
+        return extract_info(ydl, url, cache)
+
+
+def download_mp3(url: str, output_path='Downloads', cache: Optional[MetadataCache] = None,
+                 pool: Optional[SessionPool] = None) -> dict:
+    """
+    :param url: str. The url of the YouTube video
+    :param output_path: str. The directory where the mp3 is saved
+    :param cache: MetadataCache, optional. The cache of the extracted metadata
+    :param pool: SessionPool, optional. The sessions of yt_dlp, which are reused
+    :return: dict. The info dictionary of the downloaded video, as returned by yt_dlp
+    """
+
+    with borrow_downloader(get_mp3_options(output_path), pool) as ydl:
+        # Extract and download the first video only
+        return extract_info(ydl, url, cache)
+
+
+def download_audio(url: str, output_path='Downloads', cache: Optional[MetadataCache] = None,
+                   pool: Optional[SessionPool] = None) -> dict:
+    """
+    :param url: str. The url of the YouTube video
+    :param output_path: str. The directory where the audio is saved
+    :param cache: MetadataCache, optional. The cache of the extracted metadata
+    :param pool: SessionPool, optional. The sessions of yt_dlp, which are reused
+    :return: dict. The info dictionary of the downloaded video, as returned by yt_dlp
+    """
+
+    with borrow_downloader(get_audio_options(output_path), pool) as ydl:
+        return extract_info(ydl, url, cache)
+
+
+class DownloadResult:
+    def __init__(self, bookmark: Bookmark, title: Optional[str] = None, error: Optional[Exception] = None,
+                 path: Optional[str] = None, skipped=False, cpu_seconds: Optional[float] = None):
+        self.bookmark = bookmark
+        # The title as reported by yt_dlp, if the download succeeded
+        self.title = title
+        # The path to the output file, if it is known
+        self.path = path
+        # The exception raised by the download, if it failed
+        self.error = error
+        # True if the video was not downloaded, because it is already in the download archive
+        self.skipped = skipped
+        # True if the download failed, and it will be retried from the job queue
+        self.retrying = False
+        # The CPU seconds of the transcode, if they were measured
+        self.cpu_seconds = cpu_seconds
+
+    @property
+    def succeeded(self) -> bool:
+        return self.error is None
+
+    @property
+    def status(self) -> str:
+        if self.skipped:
+            return 'skipped'
+
+        if self.succeeded:
+            return 'downloaded'
+
+        return 'retrying' if self.retrying else 'failed'
+
+    def as_dict(self) -> dict:
+        """
+        :return: dict. A JSON serializable description of the result
+        """
+
+        return {
+            'url': self.bookmark.url,
+            'video_id': self.bookmark.video_id,
+            'status': self.status,
+            'title': self.title or self.bookmark.title,
+            'path': self.path,
+            'error': str(self.error) if self.error is not None else None,
+            'cpu_seconds': round(self.cpu_seconds, 3) if self.cpu_seconds is not None else None,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'DownloadResult':
+        """
+        :param data: dict. The result of as_dict, e.g. recorded in the job queue by another worker process
+        :return: DownloadResult. The error is a plain Exception with the recorded message
+        """
+
+        result = cls(
+            Bookmark(data.get('title') or data['url'], data['url'], None),
+            title=data.get('title'),
+            error=Exception(data['error']) if data.get('error') is not None else None,
+            path=data.get('path'),
+            skipped=data.get('status') == 'skipped',
+            cpu_seconds=data.get('cpu_seconds'),
+        )
+        result.retrying = data.get('status') == 'retrying'
+
+        return result
+
+    def __str__(self):
+        if self.skipped:
+            return f'"{self.title}" is already downloaded in {self.path}'
+
+        if self.succeeded:
+            return f'"{self.title}" was downloaded successfully'
+
+        if self.retrying:
+            return f'{self.error} (retrying later)'
+
+        return str(self.error)
@@ -0,0 +1,55 @@
+import argparse
+import gc
+import random
+import time
+import tracemalloc
+
+from benchmarks.synthetic import generate_title
+from bookmark import Bookmark
+from loaders import FirefoxLoader
+
+
+def generate_rows(count: int) -> list:
+    rng = random.Random(0)
+    return [
+        (generate_title(rng, i), f'https://www.youtube.com/watch?v={i:011d}', 1577836800000000 + i)
+        for i in range(count)
+    ]
+
+
+def construct(rows: list) -> list:
+    # Create the bookmarks, as the loaders do, with the dates still in the browser's format
+    return [Bookmark.from_raw(title, url, date_added, FirefoxLoader._convert_date) for title, url, date_added in rows]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the memory and the construction time of Bookmark objects')
+    parser.add_argument('--count', type=int, default=1000000, help='the number of bookmarks')
+    args = parser.parse_args()
+
+    rows = generate_rows(args.count)
+    gc.collect()
+
+    started_at = time.perf_counter()
+    bookmarks = construct(rows)
+    elapsed = time.perf_counter() - started_at
+    print(f'construction: {args.count / elapsed:,.0f} bookmarks/s')
+
+    started_at = time.perf_counter()
+    for b in bookmarks:
+        b.title
+    print(f'first title access: {args.count / (time.perf_counter() - started_at):,.0f} bookmarks/s')
+
+    del bookmarks
+    gc.collect()
+
+    # The strings of the rows are shared with the bookmarks, so only the bookmarks themselves are measured
+    tracemalloc.start()
+    bookmarks = construct(rows)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f'memory: {size / len(bookmarks):.0f} bytes/bookmark')
+
+
+if __name__ == '__main__':
+    main()
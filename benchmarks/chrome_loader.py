@@ -0,0 +1,108 @@
+import argparse
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, List
+
+from benchmarks.synthetic import generate_chrome_bookmarks
+from bookmark import Bookmark
+from loaders import ChromeLoader
+
+
+def load_with_json(directory: str, search: str = '', ascending=False, limit: int = None) -> List[Bookmark]:
+    """
+    The loading before the Bookmarks file was streamed: the whole file is parsed with json.load, the tree is walked
+    recursively, and all matching bookmarks are sorted before the limit is applied.
+
+    :param directory: str. The directory of the Bookmarks file
+    :return: list of Bookmark objects, the same as ChromeLoader.load_bookmarks
+    """
+
+    with open(os.path.join(directory, 'Bookmarks'), encoding='utf-8') as file:
+        data = json.load(file)
+
+    bookmarks = walk_json([], data['roots'], search)
+    bookmarks = sorted(bookmarks, key=lambda x: x.time_created, reverse=not ascending)
+
+    if limit:
+        bookmarks = bookmarks[:limit]
+
+    return bookmarks
+
+
+def walk_json(bookmarks: List[Bookmark], dictionary: dict, search: str) -> List[Bookmark]:
+    for key, value in dictionary.items():
+        if key in ['bookmark_bar', 'other', 'synced']:
+            bookmarks = walk_json(bookmarks, value, search)
+
+        elif key == 'children':
+            for child in value:
+                if child['type'] == 'folder':
+                    bookmarks = walk_json(bookmarks, child, search)
+                elif child['type'] == 'url':
+                    title = child['name']
+                    url = child['url']
+                    time_created = ChromeLoader._convert_date(int(child['date_added']))
+
+                    if 'youtube.com' not in url.lower():
+                        continue
+
+                    if search.lower() not in title.lower():
+                        continue
+
+                    bookmarks.append(Bookmark(title, url, time_created))
+
+    return bookmarks
+
+
+def measure(load: Callable[[], List[Bookmark]]) -> dict:
+    """
+    :param load: function, which loads the bookmarks
+    :return: dict. The time in seconds, the peak of the allocated memory in MiB and the number of loaded bookmarks
+    """
+
+    started_at = time.perf_counter()
+    bookmarks = load()
+    elapsed = time.perf_counter() - started_at
+
+    # Measure the memory in a separate run, as tracing the allocations slows the loading down
+    del bookmarks
+    tracemalloc.start()
+    bookmarks = load()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {'seconds': round(elapsed, 3), 'peak_mib': round(peak / 2 ** 20, 1), 'bookmarks': len(bookmarks)}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark ChromeLoader.load_bookmarks on a synthetic Bookmarks file, before (json.load) and '
+                    'after (streaming)'
+    )
+    parser.add_argument('--nodes', type=int, default=500000, help='the number of url nodes')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = generate_chrome_bookmarks(directory, args.nodes)
+        print(f'Bookmarks file: {args.nodes} nodes, {os.path.getsize(path) / 2 ** 20:.1f} MiB')
+
+        loader = ChromeLoader()
+        loader.path_to_bookmarks = directory
+        # Every run parses the file, instead of answering from the bookmarks kept in memory by the previous run
+        loader.use_cache = False
+
+        for name, kwargs in (
+                ('all', {}),
+                ('limit 100', {'limit': 100}),
+                ('search', {'search': 'bookmark 12'}),
+        ):
+            before = measure(lambda: load_with_json(directory, **kwargs))
+            after = measure(lambda: loader.load_bookmarks(**kwargs))
+            print(f'{name}: before {before}, after {after}')
+
+
+if __name__ == '__main__':
+    main()
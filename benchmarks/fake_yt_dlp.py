@@ -0,0 +1,151 @@
+import os
+import stat
+import sys
+import time
+from typing import Optional
+
+from bookmark import get_video_id
+
+# The script, which stands in for ffmpeg. It spends the given CPU time and writes the output file
+FAKE_FFMPEG = '''#!{python}
+import os
+import sys
+import time
+
+# A stream copy only remuxes, so it takes almost no CPU time
+copy = sys.argv[sys.argv.index('-codec:a') + 1] == 'copy' if '-codec:a' in sys.argv else False
+cpu_seconds = 0 if copy else float(os.environ.get('FAKE_FFMPEG_CPU_SECONDS', '0'))
+started_at = time.process_time()
+while time.process_time() - started_at < cpu_seconds:
+    pass
+
+source_path = sys.argv[sys.argv.index('-i') + 1]
+with open(source_path, 'rb') as source, open(sys.argv[-1], 'wb') as target:
+    target.write(source.read())
+'''
+
+
+class FakeYoutubeDL:
+    """
+    A stand-in for yt_dlp.YoutubeDL with the methods the downloaders call. Every extraction waits for the latency of
+    a request, and every download for the size of the file divided by the bandwidth, so the batches can be benchmarked
+    without network access.
+    """
+
+    # Seconds of a metadata request
+    latency = 0.2
+    # Bytes per second of a single download
+    bandwidth = 20 * 2 ** 20
+    # Bytes of every downloaded file. Only a small placeholder is written to the disk
+    file_size = 10 * 2 ** 20
+    # Seconds of the creation, like the setup of the extractors, the cookies and the HTTP handlers of yt_dlp
+    setup_seconds = 0.0
+    # Seconds of the first request of a session, like the TLS handshake and the player JavaScript of YouTube
+    warm_up_seconds = 0.0
+
+    def __init__(self, params: Optional[dict] = None):
+        self.params = params or {}
+        self._warm = False
+        time.sleep(self.setup_seconds)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        pass
+
+    def get_info_extractor(self, ie_key: str):
+        self._warm_up()
+
+    def _warm_up(self):
+        if not self._warm:
+            time.sleep(self.warm_up_seconds)
+            self._warm = True
+
+    def extract_info(self, url: str, download=True, process=True) -> dict:
+        self._warm_up()
+        time.sleep(self.latency)
+
+        video_id = get_video_id(url) or url
+        info_dict = {
+            'id': video_id,
+            'title': f'Video {video_id}',
+            # The merged videos are in their final container, and the audio is transcoded afterwards
+            'ext': self.params.get('merge_output_format', 'webm'),
+            'format_id': '251',
+            # The audio of the format 251 is Opus
+            'acodec': 'opus',
+            'webpage_url': url,
+        }
+
+        if download:
+            return self.process_ie_result(info_dict, download=True)
+
+        return info_dict
+
+    def process_ie_result(self, info_dict: dict, download=True) -> dict:
+        if not download:
+            return info_dict
+
+        path = self.prepare_filename(info_dict)
+        hooks = self.params.get('progress_hooks', [])
+        duration = self.file_size / self.bandwidth
+
+        # Report the progress ten times during the download, as yt_dlp does many times per second
+        for step in range(1, 11):
+            time.sleep(duration / 10)
+
+            for hook in hooks:
+                hook({
+                    'status': 'downloading' if step < 10 else 'finished',
+                    'downloaded_bytes': self.file_size * step // 10,
+                    'total_bytes': self.file_size,
+                    'speed': self.bandwidth,
+                    'eta': duration * (10 - step) / 10,
+                    'info_dict': info_dict,
+                })
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'wb') as file:
+            file.write(b'\0' * 1024)
+
+        return dict(info_dict, requested_downloads=[{'filepath': path}])
+
+    @staticmethod
+    def sanitize_info(info_dict: dict) -> dict:
+        return dict(info_dict)
+
+    def prepare_filename(self, info_dict: dict) -> str:
+        return self.params.get('outtmpl', '%(title)s.%(ext)s') % info_dict
+
+
+def install(directory: str, ffmpeg_cpu_seconds: float = 0.5):
+    """
+    Makes 'import yt_dlp' return this module and puts a fake ffmpeg first on the PATH, in this process and in the
+    processes started by it.
+
+    :param directory: str. A temporary directory for the shims
+    :param ffmpeg_cpu_seconds: float. The CPU time of every fake ffmpeg run
+    :return: None
+    """
+
+    package = os.path.join(directory, 'yt_dlp')
+    os.makedirs(package, exist_ok=True)
+
+    with open(os.path.join(package, '__init__.py'), 'w') as file:
+        file.write('from benchmarks.fake_yt_dlp import FakeYoutubeDL as YoutubeDL\n')
+
+    ffmpeg_path = os.path.join(directory, 'ffmpeg')
+    with open(ffmpeg_path, 'w') as file:
+        file.write(FAKE_FFMPEG.format(python=sys.executable))
+    os.chmod(ffmpeg_path, os.stat(ffmpeg_path).st_mode | stat.S_IEXEC)
+
+    sys.path.insert(0, directory)
+    os.environ['PATH'] = directory + os.pathsep + os.environ.get('PATH', '')
+    os.environ['FAKE_FFMPEG_CPU_SECONDS'] = str(ffmpeg_cpu_seconds)
+
+    # A real yt_dlp, which was imported before, is replaced too
+    sys.modules.pop('yt_dlp', None)
@@ -0,0 +1,127 @@
+import argparse
+import hashlib
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from range_downloader import RangeDownloader
+
+CHUNK_SIZE = 64 * 1024
+RANGE_PATTERN = re.compile(r'bytes=(\d+)-(\d*)')
+
+
+class RangeServer(ThreadingHTTPServer):
+    """
+    A local server of a single file, which limits the speed of every connection, as the video servers do, so a file
+    is downloaded faster over more connections.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, content: bytes, connection_speed: float, ranges=True):
+        """
+        :param content: bytes. The file
+        :param connection_speed: float. The bytes per second of a single response
+        :param ranges: boolean. If it is False, the Range header is ignored, and the whole file is sent
+        """
+
+        super().__init__(('127.0.0.1', 0), RangeHandler)
+        self.content = content
+        self.connection_speed = connection_speed
+        self.ranges = ranges
+        self.requests = 0
+        self.lock = threading.Lock()
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    server: RangeServer
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        size = len(server.content)
+        match = RANGE_PATTERN.match(self.headers.get('Range', ''))
+
+        with server.lock:
+            server.requests += 1
+
+        if server.ranges and match:
+            start = int(match.group(1))
+            end = min(int(match.group(2)) if match.group(2) else size - 1, size - 1)
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        else:
+            start, end = 0, size - 1
+            self.send_response(200)
+
+        self.send_header('Content-Length', str(end - start + 1))
+        self.end_headers()
+
+        sent = start
+        while sent <= end:
+            chunk = server.content[sent:min(sent + CHUNK_SIZE, end + 1)]
+            time.sleep(len(chunk) / server.connection_speed)
+
+            try:
+                self.wfile.write(chunk)
+            except (BrokenPipeError, ConnectionResetError):
+                return
+
+            sent += len(chunk)
+
+    def log_message(self, *args):
+        pass
+
+
+def run(content: bytes, connection_speed: float, connections: int, ranges: bool, directory: str) -> dict:
+    server = RangeServer(content, connection_speed, ranges)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    url = f'http://127.0.0.1:{server.server_address[1]}/video.mp4'
+    path = os.path.join(directory, f'video-{connections}-{ranges}.mp4')
+
+    started_at = time.perf_counter()
+    RangeDownloader(connections, min_part_size=2 ** 20).download(url, path)
+    seconds = time.perf_counter() - started_at
+
+    server.shutdown()
+    server.server_close()
+
+    with open(path, 'rb') as file:
+        correct = hashlib.sha256(file.read()).digest() == hashlib.sha256(content).digest()
+
+    os.remove(path)
+
+    return {
+        'seconds': round(seconds, 2),
+        'MiB/s': round(len(content) / seconds / 2 ** 20, 2),
+        'requests': server.requests,
+        'correct': correct,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark RangeDownloader against a local range-capable server')
+    parser.add_argument('--file-size', type=float, default=32, help='MiB of the file')
+    parser.add_argument('--connection-speed', type=float, default=8, help='MiB/s of a single connection')
+    parser.add_argument('--connections', type=int, nargs='+', default=[1, 2, 4, 8], help='connections per file')
+    args = parser.parse_args()
+
+    content = random.Random(0).randbytes(int(args.file_size * 2 ** 20))
+    connection_speed = args.connection_speed * 2 ** 20
+
+    with tempfile.TemporaryDirectory() as directory:
+        for connections in args.connections:
+            print(f'{connections} connections: {run(content, connection_speed, connections, True, directory)}')
+
+        # The server ignores the Range header, so the downloader falls back to a single connection
+        result = run(content, connection_speed, max(args.connections), False, directory)
+        print(f'{max(args.connections)} connections, no ranges: {result}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+import argparse
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+from scheduler import AdaptiveScheduler
+
+CHUNK_SIZE = 64 * 1024
+
+
+class ThrottlingServer(ThreadingHTTPServer):
+    """
+    A local server with a shared uplink and a limited speed of every connection, as the video servers have, which
+    answers 429 when too many downloads run at the same time.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, uplink: float, connection_speed: float, max_connections: int, file_size: int):
+        """
+        :param uplink: float. The total bytes per second of all responses
+        :param connection_speed: float. The bytes per second of a single response
+        :param max_connections: int. The number of concurrent downloads, above which the server throttles
+        :param file_size: int. The bytes of every response
+        """
+
+        super().__init__(('127.0.0.1', 0), ThrottlingHandler)
+        self.uplink = uplink
+        self.connection_speed = connection_speed
+        self.max_connections = max_connections
+        self.file_size = file_size
+        self.active = 0
+        self.throttled = 0
+        self.lock = threading.Lock()
+
+
+class ThrottlingHandler(BaseHTTPRequestHandler):
+    server: ThrottlingServer
+
+    def do_GET(self):
+        server = self.server
+
+        with server.lock:
+            if server.active >= server.max_connections:
+                server.throttled += 1
+                throttled = True
+            else:
+                server.active += 1
+                throttled = False
+
+        if throttled:
+            self.send_error(429, 'Too Many Requests')
+            return
+
+        try:
+            self.send_response(200)
+            self.send_header('Content-Length', str(server.file_size))
+            self.end_headers()
+
+            sent = 0
+            while sent < server.file_size:
+                chunk = min(CHUNK_SIZE, server.file_size - sent)
+                # Every running download gets an equal share of the uplink, up to the speed of a connection
+                time.sleep(chunk / min(server.connection_speed, server.uplink / max(server.active, 1)))
+                self.wfile.write(b'\0' * chunk)
+                sent += chunk
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+def download(url: str, ratelimit: Optional[int]) -> int:
+    """
+    :return: int. The number of downloaded bytes
+    """
+
+    received = 0
+    started_at = time.monotonic()
+
+    with urllib.request.urlopen(url) as response:
+        while True:
+            chunk = response.read(CHUNK_SIZE)
+            if not chunk:
+                break
+
+            received += len(chunk)
+
+            # Limit the rate, as yt_dlp does with the ratelimit option
+            if ratelimit:
+                delay = received / ratelimit - (time.monotonic() - started_at)
+                if delay > 0:
+                    time.sleep(delay)
+
+    return received
+
+
+def run_batch(url: str, jobs: int, scheduler: AdaptiveScheduler) -> dict:
+    limits = []
+
+    def job():
+        scheduler.acquire()
+        scheduler.wait_for_host(url)
+
+        try:
+            size = download(url, scheduler.get_ratelimit())
+        except urllib.error.HTTPError as e:
+            scheduler.release(error=e)
+            return False
+
+        scheduler.release(size)
+        limits.append(scheduler.limit)
+
+        return True
+
+    started_at = time.perf_counter()
+
+    # Retry the throttled downloads, until all of them succeed
+    remaining = jobs
+    with ThreadPoolExecutor(max_workers=scheduler.max_workers) as executor:
+        while remaining:
+            remaining -= sum(executor.map(lambda _: job(), range(remaining)))
+
+    return {
+        'seconds': round(time.perf_counter() - started_at, 2),
+        'final_limit': scheduler.limit,
+        'max_limit': max(limits),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark AdaptiveScheduler against a local throttling server')
+    parser.add_argument('--jobs', type=int, default=200, help='the number of downloads')
+    parser.add_argument('--uplink', type=float, default=50, help='MiB/s of the server')
+    parser.add_argument('--connection-speed', type=float, default=5, help='MiB/s of a single download')
+    parser.add_argument('--max-connections', type=int, default=8, help='concurrent downloads before throttling')
+    parser.add_argument('--file-size', type=float, default=1, help='MiB of every download')
+    parser.add_argument('--bandwidth-limit', type=float, help='MiB/s of all downloads together')
+    args = parser.parse_args()
+
+    bandwidth_limit = args.bandwidth_limit * 2 ** 20 if args.bandwidth_limit else None
+
+    for name, scheduler in (
+            ('fixed 2', AdaptiveScheduler(2, min_workers=2, max_workers=2, bandwidth_limit=bandwidth_limit)),
+            ('fixed 16', AdaptiveScheduler(16, min_workers=16, max_workers=16, bandwidth_limit=bandwidth_limit)),
+            ('adaptive', AdaptiveScheduler(2, max_workers=16, bandwidth_limit=bandwidth_limit)),
+    ):
+        server = ThrottlingServer(
+            args.uplink * 2 ** 20, args.connection_speed * 2 ** 20, args.max_connections, int(args.file_size * 2 ** 20)
+        )
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        url = f'http://127.0.0.1:{server.server_address[1]}/video'
+        result = run_batch(url, args.jobs, scheduler)
+        result['throttled'] = server.throttled
+
+        server.shutdown()
+        server.server_close()
+
+        print(f'{name}: {result}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+import argparse
+import random
+import time
+
+from search_index import TitleIndex
+
+WORDS = ('music', 'live', 'official', 'video', 'remix', 'tutorial', 'python', 'guitar', 'lesson', 'review', 'trailer',
+         'concert', 'piano', 'cover', 'lyrics', 'podcast', 'interview', 'documentary', 'highlights', 'episode')
+
+
+def generate_titles(count: int) -> list:
+    rng = random.Random(0)
+    return [' '.join(rng.choice(WORDS) for _ in range(rng.randint(3, 7))) + f' {i}' for i in range(count)]
+
+
+def measure_query(function, query: str, limit, repeat: int = 5) -> float:
+    """
+    :return: float. The median time of the query in milliseconds
+    """
+
+    times = []
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        function(query, limit)
+        times.append(time.perf_counter() - started_at)
+
+    return sorted(times)[len(times) // 2] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the title search index')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        titles = generate_titles(size)
+
+        started_at = time.perf_counter()
+        index = TitleIndex(titles, get_text=str)
+        build = time.perf_counter() - started_at
+
+        started_at = time.perf_counter()
+        index.fuzzy_search('warmup')
+        fuzzy_build = time.perf_counter() - started_at
+
+        print(f'{size} titles: index built in {build * 1000:.0f} ms, fuzzy index in {fuzzy_build * 1000:.0f} ms')
+
+        for name, function, query, limit in (
+                ('substring, rare', index.search, 'ic 12345', None),
+                ('substring, common', index.search, 'piano cover', None),
+                ('substring, common, limit 100', index.search, 'piano cover', 100),
+                ('linear scan, common', lambda q, l: [t for t in titles if q in t.lower()], 'piano cover', None),
+                ('fuzzy, typo', index.fuzzy_search, 'pyhton tutorail', 100),
+        ):
+            print(f'  {name}: {measure_query(function, query, limit):.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+import argparse
+import importlib.util
+import os
+import tempfile
+import time
+from typing import Optional
+
+from benchmarks import fake_yt_dlp
+from session_pool import SessionPool, borrow_downloader
+
+
+def run_batch(urls: list, options: dict, pool: Optional[SessionPool], metadata: bool) -> dict:
+    """
+    :param urls: list of str. The videos of the batch
+    :param options: dict. The yt_dlp options
+    :param pool: SessionPool, optional. If it is not filled, every video creates its own yt_dlp.YoutubeDL
+    :param metadata: boolean. If it is True, the metadata of every video is extracted, otherwise only the YouTube
+    extractor is created, so the real yt_dlp is measured without network access
+    :return: dict. The seconds of the batch and the overhead per video
+    """
+
+    started_at = time.perf_counter()
+
+    for url in urls:
+        with borrow_downloader(options, pool) as ydl:
+            if metadata:
+                ydl.extract_info(url, download=False)
+            else:
+                ydl.get_info_extractor('Youtube')
+
+    seconds = time.perf_counter() - started_at
+
+    return {
+        'seconds': round(seconds, 3),
+        'milliseconds_per_video': round(seconds / len(urls) * 1000, 2),
+        **(pool.stats() if pool is not None else {}),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the per-video overhead of yt_dlp with and without sessions')
+    parser.add_argument('--videos', type=int, default=50, help='the number of videos in the batch')
+    parser.add_argument('--fake', action='store_true', help='use the local stand-in even if yt_dlp is installed')
+    parser.add_argument('--latency', type=float, default=0.02, help='seconds of a metadata request of the stand-in')
+    parser.add_argument('--setup', type=float, default=0.1, help='seconds of the creation of the stand-in')
+    parser.add_argument('--warm-up', type=float, default=0.2, help='seconds of the first request of the stand-in')
+    args = parser.parse_args()
+
+    fake = args.fake or importlib.util.find_spec('yt_dlp') is None
+
+    with tempfile.TemporaryDirectory() as directory:
+        if fake:
+            fake_yt_dlp.install(os.path.join(directory, 'shims'))
+            fake_yt_dlp.FakeYoutubeDL.latency = args.latency
+            fake_yt_dlp.FakeYoutubeDL.setup_seconds = args.setup
+            fake_yt_dlp.FakeYoutubeDL.warm_up_seconds = args.warm_up
+
+        # Imported after the fake yt_dlp is installed
+        from pipeline import get_fetch_options
+
+        options = get_fetch_options('mkv', directory)
+        urls = [f'https://www.youtube.com/watch?v={index:011d}' for index in range(args.videos)]
+
+        print(f'yt_dlp: {"stand-in" if fake else "installed"}, {args.videos} videos')
+        print(f'New YoutubeDL per video: {run_batch(urls, options, None, fake)}')
+
+        pool = SessionPool()
+        print(f'Session pool: {run_batch(urls, options, pool, fake)}')
+        pool.close()
+
+        pool = SessionPool()
+        started_at = time.perf_counter()
+        pool.prewarm(options)
+        prewarm_seconds = round(time.perf_counter() - started_at, 3)
+        print(f'Prewarmed session pool: {run_batch(urls, options, pool, fake)}, prewarm seconds: {prewarm_seconds}')
+        pool.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from typing import Dict, List, Optional
+
+# The root of the repository, where the measured modules are
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The modules, which should not be imported at startup, as they are only needed by the first load or download
+DEFERRED_MODULES = ('yt_dlp', 'loaders')
+
+# Measures the time from the start of the interpreter to the first drawn window
+FIRST_WINDOW_SCRIPT = '''
+import time
+started_at = time.perf_counter()
+from youtube_downloader import YoutubeDownloader
+app = YoutubeDownloader()
+app.root.update()
+print(time.perf_counter() - started_at)
+app.root.destroy()
+'''
+
+
+def run_python(arguments: List[str], directory: str) -> subprocess.CompletedProcess:
+    # The measured modules create their settings and databases in the working directory, so it is a temporary one
+    environment = {**os.environ, 'PYTHONPATH': REPOSITORY, 'PYTHONDONTWRITEBYTECODE': '1'}
+
+    return subprocess.run([sys.executable, *arguments], cwd=directory, env=environment, capture_output=True, text=True)
+
+
+def parse_importtime(output: str) -> Dict[str, int]:
+    """
+    :param output: str. The stderr of python -X importtime
+    :return: dict. The cumulative microseconds of every imported module
+    """
+
+    cumulative = {}
+
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+
+        # The columns are the own microseconds, the cumulative microseconds and the indented name of the module
+        _, total, name = line[len('import time:'):].split('|')
+        cumulative[name.strip()] = int(total)
+
+    return cumulative
+
+
+def benchmark_import(module: str, directory: str, repeat: int = 5) -> Optional[dict]:
+    """
+    :param module: str. The imported module
+    :param directory: str. The working directory
+    :param repeat: int. The number of runs. The best one is reported, as the others are slowed down by the system
+    :return: dict. The milliseconds of the import, the slowest imported modules and the deferred modules, which were
+    imported anyway. None if the module can't be imported
+    """
+
+    runs = []
+
+    for _ in range(repeat):
+        process = run_python(['-X', 'importtime', '-c', f'import {module}'], directory)
+
+        if process.returncode != 0:
+            return None
+
+        runs.append(parse_importtime(process.stderr))
+
+    best = min(runs, key=lambda run: run.get(module, 0))
+
+    own_modules = [name for name in best if name != module and '.' not in name]
+    slowest = sorted(own_modules, key=best.get, reverse=True)[:5]
+
+    return {
+        'milliseconds': round(best.get(module, 0) / 1000, 1),
+        'slowest': {name: round(best[name] / 1000, 1) for name in slowest},
+        'deferred_imported': [name for name in DEFERRED_MODULES if name in best],
+    }
+
+
+def benchmark_first_window(directory: str, repeat: int = 5) -> Optional[float]:
+    """
+    :return: float. The best milliseconds to the first window, or None if there is no display
+    """
+
+    timings = []
+
+    for _ in range(repeat):
+        process = run_python(['-c', FIRST_WINDOW_SCRIPT], directory)
+
+        if process.returncode != 0:
+            return None
+
+        timings.append(float(process.stdout.strip().splitlines()[-1]))
+
+    return round(min(timings) * 1000, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the startup of the GUI and the command line')
+    parser.add_argument('--repeat', type=int, default=5, help='the number of runs of every measurement')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        results = {
+            'import_youtube_downloader': benchmark_import('youtube_downloader', directory, args.repeat),
+            'import_cli': benchmark_import('cli', directory, args.repeat),
+            # The cost, which is deferred to the first download. None if yt_dlp is not installed
+            'import_yt_dlp': benchmark_import('yt_dlp', directory, args.repeat),
+            'first_window_milliseconds': benchmark_first_window(directory, args.repeat),
+        }
+
+    print(json.dumps(results, indent=2))
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
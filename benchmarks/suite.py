@@ -0,0 +1,190 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from typing import Callable, Dict, Optional
+
+from benchmarks import fake_yt_dlp
+from benchmarks.bookmark import construct, generate_rows
+from benchmarks.synthetic import generate_chrome_bookmarks, generate_places_sqlite
+from bookmark import Bookmark
+from loaders import ChromeLoader, FirefoxLoader
+
+
+def measure(function: Callable[[], object], repeat: int = 3) -> dict:
+    """
+    :param function: The measured function
+    :param repeat: int. The number of runs. The first one is reported separately, as it fills the caches
+    :return: dict. The seconds of the first run and the best of the rest
+    """
+
+    timings = []
+
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started_at)
+
+    return {'first_seconds': round(timings[0], 4), 'best_seconds': round(min(timings[1:] or timings), 4)}
+
+
+def benchmark_loader(loader_class, directory: str) -> Dict[str, dict]:
+    loader = loader_class()
+    loader.path_to_bookmarks = directory
+    results = {}
+
+    for name, kwargs in (
+            ('all', {}),
+            ('limit 100', {'limit': 100}),
+            ('search', {'search': 'bookmark 12'}),
+    ):
+        results[name] = measure(lambda: loader.load_bookmarks(**kwargs))
+
+    # The first page of the lazy listing, which the GUI shows before it loads the rest
+    results['first page'] = measure(lambda: next(loader.iter_pages(page_size=100)))
+
+    return results
+
+
+def benchmark_bookmarks(count: int) -> dict:
+    rows = generate_rows(count)
+
+    result = measure(lambda: construct(rows))
+    result['bookmarks_per_second'] = round(count / result['best_seconds'])
+
+    return result
+
+
+def benchmark_render(count: int) -> Optional[dict]:
+    """
+    Measures rendering the bookmarks in the virtualized list of the GUI.
+
+    :return: dict, or None if there is no display
+    """
+
+    try:
+        import tkinter as tk
+        root = tk.Tk()
+    except Exception:
+        return None
+
+    from scrollable_frame import VirtualScrollableFrame
+
+    bookmarks = [Bookmark(f'Synthetic bookmark {i} - YouTube', f'https://www.youtube.com/watch?v={i:011d}', None)
+                 for i in range(count)]
+    frame = VirtualScrollableFrame(root)
+    frame.pack()
+
+    def render():
+        frame.set_items(bookmarks, get_text=lambda bookmark: bookmark.title)
+        root.update_idletasks()
+
+    result = measure(render)
+    root.destroy()
+
+    return result
+
+
+def benchmark_batch(jobs: int, target_format: str, concurrency: int, directory: str,
+                    transcode_threads: Optional[int] = None) -> dict:
+    # Imported after the fake yt_dlp is installed
+    from metadata_cache import MetadataCache
+    from pipeline import DownloadPipeline
+
+    bookmarks = [Bookmark(f'Video {i}', f'https://www.youtube.com/watch?v={i:011d}', None) for i in range(jobs)]
+    output_path = os.path.join(directory, f'Downloads {target_format}')
+    cache = MetadataCache(os.path.join(directory, f'metadata_cache_{target_format}.sqlite'))
+    pipeline = DownloadPipeline(network_workers=concurrency, cache=cache, transcode_threads=transcode_threads)
+
+    started_at = time.perf_counter()
+    results = pipeline.run(bookmarks, target_format, lambda result: None, output_path)
+    elapsed = time.perf_counter() - started_at
+    cache.close()
+
+    return {
+        'seconds': round(elapsed, 3),
+        'jobs_per_second': round(jobs / elapsed, 2),
+        'failed': sum(not r.succeeded for r in results),
+        'stages': pipeline.stats(),
+    }
+
+
+def get_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: dict, previous: dict, prefix=''):
+    # Print the relative change of every timing, which is in both results
+    for key, value in results.items():
+        if isinstance(value, dict):
+            compare(value, previous.get(key) or {}, f'{prefix}{key} / ')
+        elif key.endswith('seconds') and isinstance(previous.get(key), (int, float)) and previous[key] > 0:
+            change = 100 * (value - previous[key]) / previous[key]
+            print(f'{prefix}{key}: {previous[key]} -> {value} ({change:+.1f}%)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run all benchmarks on synthetic data and save the results as JSON')
+    parser.add_argument('--bookmarks', type=int, default=100000, help='the number of bookmarks in the browser files')
+    parser.add_argument('--jobs', type=int, default=50, help='the number of videos in the batch downloads')
+    parser.add_argument('--concurrency', type=int, default=4, help='the number of downloads at the same time')
+    parser.add_argument('--latency', type=float, default=0.2, help='seconds of a metadata request')
+    parser.add_argument('--bandwidth', type=float, default=20, help='MiB/s of a single download')
+    parser.add_argument('--file-size', type=float, default=10, help='MiB of a downloaded file')
+    parser.add_argument('--ffmpeg-cpu', type=float, default=0.5, help='CPU seconds of a transcode')
+    parser.add_argument('--transcode-threads', type=int, help='threads of every ffmpeg process')
+    parser.add_argument('--output', default='benchmark_results.json', help='the file where the results are saved')
+    parser.add_argument('--compare', help='a previous results file to compare with')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        fake_yt_dlp.install(os.path.join(directory, 'shims'), args.ffmpeg_cpu)
+        fake_yt_dlp.FakeYoutubeDL.latency = args.latency
+        fake_yt_dlp.FakeYoutubeDL.bandwidth = args.bandwidth * 2 ** 20
+        fake_yt_dlp.FakeYoutubeDL.file_size = args.file_size * 2 ** 20
+
+        firefox_directory = os.path.join(directory, 'firefox')
+        chrome_directory = os.path.join(directory, 'chrome')
+        generate_places_sqlite(firefox_directory, args.bookmarks)
+        generate_chrome_bookmarks(chrome_directory, args.bookmarks)
+
+        results = {
+            'firefox_load_bookmarks': benchmark_loader(FirefoxLoader, firefox_directory),
+            'chrome_load_bookmarks': benchmark_loader(ChromeLoader, chrome_directory),
+            'bookmark_construction': benchmark_bookmarks(args.bookmarks),
+            'render_bookmarks': benchmark_render(args.bookmarks),
+            'batch_video': benchmark_batch(args.jobs, 'mkv', args.concurrency, directory, args.transcode_threads),
+            'batch_mp3': benchmark_batch(args.jobs, 'mp3', args.concurrency, directory, args.transcode_threads),
+            # The audio is copied into its own container, so the CPU stage has almost nothing to do
+            'batch_audio': benchmark_batch(args.jobs, 'audio', args.concurrency, directory, args.transcode_threads),
+        }
+
+    report = {
+        'commit': get_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'parameters': vars(args),
+        'results': results,
+    }
+
+    print(json.dumps(results, indent=2))
+
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2)
+
+    if args.compare:
+        with open(args.compare) as file:
+            compare(results, json.load(file)['results'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+import json
+import os
+import random
+import sqlite3
+from typing import Optional
+from urllib.parse import urlparse
+
+# Microseconds between 1601.01.01 and 1970.01.01, the epochs of Chrome and Firefox
+CHROME_EPOCH_OFFSET = 11644473600 * 1000000
+# 2020.01.01 in microseconds since 1970.01.01, the time of Firefox
+START_TIME = 1577836800 * 1000000
+# The share of the generated bookmarks, which lead to YouTube
+YOUTUBE_SHARE = 0.5
+
+
+def generate_url(rng: random.Random, index: int) -> str:
+    if rng.random() < YOUTUBE_SHARE:
+        return f'https://www.youtube.com/watch?v={index:011d}'
+
+    return f'https://example.com/articles/{index}'
+
+
+def generate_title(rng: random.Random, index: int) -> str:
+    # Some titles have the notification count and the suffix, which Bookmark cleans
+    prefix = f'({rng.randint(1, 99)}) ' if rng.random() < 0.2 else ''
+    return f'{prefix}Synthetic bookmark {index} - YouTube'
+
+
+def generate_chrome_bookmarks(directory: str, nodes: int, folder_size: int = 50, seed: Optional[int] = 0) -> str:
+    """
+    :param directory: str. The directory where the Bookmarks file is written
+    :param nodes: int. The number of url nodes
+    :param folder_size: int. The number of url nodes in every folder. The folders are nested two levels deep
+    :param seed: int, optional. The seed of the random generator, so the files are reproducible
+    :return: str. The path to the Bookmarks file
+    """
+
+    rng = random.Random(seed)
+    # 2020.01.01 in Chrome time
+    start_time = CHROME_EPOCH_OFFSET + START_TIME
+
+    def url_node(index: int) -> dict:
+        return {
+            'date_added': str(start_time + rng.randint(0, 10 ** 14)),
+            'guid': f'{index:08x}-0000-4000-8000-000000000000',
+            'id': str(index),
+            'name': generate_title(rng, index),
+            'type': 'url',
+            'url': generate_url(rng, index),
+        }
+
+    def folder_node(name: str, children: list) -> dict:
+        return {
+            'children': children,
+            'date_added': str(start_time),
+            'id': name,
+            'name': name,
+            'type': 'folder',
+        }
+
+    folders = []
+    for start in range(0, nodes, folder_size):
+        children = [url_node(i) for i in range(start, min(start + folder_size, nodes))]
+        folders.append(folder_node(f'folder {start // folder_size}', children))
+
+    # Nest the folders in groups, so the tree is more than one level deep
+    groups = [folder_node(f'group {i}', folders[i:i + folder_size]) for i in range(0, len(folders), folder_size)]
+
+    data = {
+        'checksum': '0' * 32,
+        'roots': {
+            'bookmark_bar': folder_node('bookmark_bar', groups),
+            'other': folder_node('other', []),
+            'synced': folder_node('synced', []),
+        },
+        'version': 1,
+    }
+
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, 'Bookmarks')
+
+    # Chrome writes the file indented with three spaces
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(data, file, indent=3)
+
+    return path
+
+
+def get_rev_host(url: str) -> str:
+    # The reversed host with a trailing dot, as Firefox stores it, e.g. 'moc.ebutuoy.www.'
+    return urlparse(url).hostname[::-1] + '.'
+
+
+def generate_places_sqlite(directory: str, bookmarks: int, folder_size: int = 50, seed: Optional[int] = 0) -> str:
+    """
+    :param directory: str. The directory where the places.sqlite file is written
+    :param bookmarks: int. The number of url bookmarks
+    :param folder_size: int. The number of bookmarks in every folder
+    :param seed: int, optional. The seed of the random generator, so the files are reproducible
+    :return: str. The path to the places.sqlite file
+    """
+
+    rng = random.Random(seed)
+
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, 'places.sqlite')
+
+    if os.path.exists(path):
+        os.remove(path)
+
+    # The columns of the Firefox schema, which are read by the loader, and a few more of the real ones
+    connection = sqlite3.connect(path)
+    connection.executescript("""
+        PRAGMA journal_mode = WAL;
+        CREATE TABLE moz_places (
+            id INTEGER PRIMARY KEY, url LONGVARCHAR, title LONGVARCHAR, rev_host LONGVARCHAR,
+            visit_count INTEGER DEFAULT 0, last_visit_date INTEGER, guid TEXT UNIQUE
+        );
+        CREATE TABLE moz_bookmarks (
+            id INTEGER PRIMARY KEY, type INTEGER, fk INTEGER DEFAULT NULL, parent INTEGER, position INTEGER,
+            title LONGVARCHAR, dateAdded INTEGER, lastModified INTEGER, guid TEXT UNIQUE
+        );
+        CREATE INDEX moz_places_hostindex ON moz_places (rev_host);
+        CREATE INDEX moz_bookmarks_itemindex ON moz_bookmarks (fk, type);
+        CREATE INDEX moz_bookmarks_parentindex ON moz_bookmarks (parent, position);
+    """)
+
+    places = []
+    items = []
+
+    for index in range(bookmarks):
+        # The ids of the folders follow the ids of the bookmarks
+        folder_id = bookmarks + 1 + index // folder_size
+
+        if index % folder_size == 0:
+            items.append((folder_id, 2, None, 1, index // folder_size, f'folder {index // folder_size}',
+                          START_TIME, START_TIME, f'f{folder_id:011d}'))
+
+        url = generate_url(rng, index)
+        date_added = START_TIME + rng.randint(0, 10 ** 14)
+
+        places.append((index + 1, url, None, get_rev_host(url), 0, None, f'p{index:011d}'))
+        items.append((index + 1, 1, index + 1, folder_id, index % folder_size, generate_title(rng, index),
+                      date_added, date_added, f'b{index:011d}'))
+
+    connection.executemany('INSERT INTO moz_places VALUES (?, ?, ?, ?, ?, ?, ?)', places)
+    connection.executemany('INSERT INTO moz_bookmarks VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', items)
+    connection.commit()
+    connection.close()
+
+    return path
@@ -1,21 +1,173 @@
 import re
 from datetime import datetime
+from typing import Callable, Iterable, List, Optional
+from urllib.parse import urlparse, parse_qs
+
+# The ids of the YouTube videos are 11 characters long
+VIDEO_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{11}$')
+# The count of the notifications, which YouTube adds to the beginning of the page title, e.g. '(3) '
+NOTIFICATION_COUNT_PATTERN = re.compile(r'^(\(\d+\)\s).+')
+# The url paths, which are followed by the id of the video, e.g. youtube.com/shorts/<id>
+VIDEO_ID_PATH_PREFIXES = ('shorts', 'embed', 'live', 'v')
+# The url paths of the playlists and the channels, e.g. youtube.com/playlist?list=<id> or youtube.com/channel/<id>
+COLLECTION_PATH_PREFIXES = ('playlist', 'channel', 'c', 'user')
+# The hosts of YouTube. Their subdomains, e.g. www.youtube.com or m.youtube.com, are YouTube hosts too
+YOUTUBE_HOSTS = ('youtube.com', 'youtu.be')
+# Matches the urls, whose host is one of YOUTUBE_HOSTS or their subdomains, after the scheme and the user info. It is
+# matched against every bookmark of the browsers, so it doesn't parse the whole url
+YOUTUBE_URL_PATTERN = re.compile(
+    r'^\s*[a-z][a-z0-9+.-]*://(?:[^/?#@]*@)?(?:[^/?#:@]*\.)?(?:' + '|'.join(map(re.escape, YOUTUBE_HOSTS)) +
+    r')\.?(?::\d*)?(?:[/?#]|\s*$)',
+    re.IGNORECASE
+)
+
+
+def is_youtube_url(url: str) -> bool:
+    """
+    :param url: str
+    :return: boolean. True if the host of the url is one of YOUTUBE_HOSTS or their subdomains. The loaders of all
+    browsers keep the same bookmarks
+    """
+
+    return YOUTUBE_URL_PATTERN.match(url) is not None
+
+
+def get_video_id(url: str) -> Optional[str]:
+    """
+    :param url: str. Any url variant of a YouTube video, e.g. youtu.be/<id>, youtube.com/watch?v=<id>&t=10s,
+    m.youtube.com/shorts/<id>
+    :return: str. The id of the video, or None if the url doesn't lead to a YouTube video
+    """
+
+    parsed = urlparse(url.strip())
+    host = parsed.netloc.lower().split(':')[0]
+    path_parts = [p for p in parsed.path.split('/') if p]
+    video_id = None
+
+    if host == 'youtu.be' or host.endswith('.youtu.be'):
+        video_id = path_parts[0] if path_parts else None
+    elif host == 'youtube.com' or host.endswith('.youtube.com'):
+        if path_parts[:1] == ['watch']:
+            video_id = parse_qs(parsed.query).get('v', [None])[0]
+        elif len(path_parts) >= 2 and path_parts[0] in VIDEO_ID_PATH_PREFIXES:
+            video_id = path_parts[1]
+
+    if video_id and VIDEO_ID_PATTERN.match(video_id):
+        return video_id
+
+    return None
+
+
+def is_collection_url(url: str) -> bool:
+    """
+    :param url: str
+    :return: boolean. True if the url leads to a YouTube playlist or channel, e.g. youtube.com/playlist?list=<id>,
+    youtube.com/@<handle>/videos. A video in a playlist, e.g. youtube.com/watch?v=<id>&list=<id>, is a video
+    """
+
+    if get_video_id(url) is not None:
+        return False
+
+    parsed = urlparse(url.strip())
+    host = parsed.netloc.lower().split(':')[0]
+    path_parts = [p for p in parsed.path.split('/') if p]
+
+    if not path_parts or not (host == 'youtube.com' or host.endswith('.youtube.com')):
+        return False
+
+    return path_parts[0] in COLLECTION_PATH_PREFIXES or path_parts[0].startswith('@')
+
+
+def deduplicate_bookmarks(bookmarks: Iterable['Bookmark']) -> List['Bookmark']:
+    """
+    :param bookmarks: iterable of Bookmark objects, e.g. loaded from more than one browser
+    :return: list of Bookmark objects, where every video is present once, regardless of the url variant.
+    The first occurrence is kept, so the order of the bookmarks is preserved
+    """
+
+    seen = set()
+    unique = []
+
+    for b in bookmarks:
+        # Bookmarks which are not videos (e.g. playlists) are compared by url
+        key = b.video_id or b.url
+
+        if key not in seen:
+            seen.add(key)
+            unique.append(b)
+
+    return unique
 
 
 class Bookmark:
-    def __init__(self, title: str, url: str, time_created: datetime):
+    # No instance dictionary, as up to millions of bookmarks can be loaded at once
+    __slots__ = ('_raw_title', '_title', 'url', '_time_created', '_raw_date', '_convert_date', 'is_selected')
+
+    def __init__(self, title: str, url: str, time_created: Optional[datetime]):
         self.title = title
         self.url = url
-        self.time_created = time_created
+        self._time_created = time_created
+        self._raw_date = None
+        self._convert_date = None
         self.is_selected = False
 
+    @classmethod
+    def from_raw(cls, title: str, url: str, raw_date: int, convert_date: Callable[[int], datetime]) -> 'Bookmark':
+        """
+        Creates a bookmark with the date in the browser's format. It is converted only if time_created is accessed.
+
+        :param title: str. The title, as saved in the browser
+        :param url: str
+        :param raw_date: int. The date and time of the creation of the bookmark, as saved in the browser
+        :param convert_date: function, which converts the browser's date to datetime
+        :return: Bookmark
+        """
+
+        bookmark = cls(title, url, None)
+        bookmark._raw_date = raw_date
+        bookmark._convert_date = convert_date
+
+        return bookmark
+
+    @property
+    def video_id(self) -> Optional[str]:
+        return get_video_id(self.url)
+
     @property
-    def title(self):
-        return self.__title
+    def canonical_url(self) -> str:
+        """
+        :return: str. The url of the video without any additional parameters, e.g. the start time or the playlist.
+        If the bookmark is not a video, the original url
+        """
+
+        video_id = self.video_id
+        return f'https://www.youtube.com/watch?v={video_id}' if video_id else self.url
+
+    @property
+    def title(self) -> str:
+        # The title is cleaned the first time it is accessed, as most of the loaded bookmarks are never shown
+        if self._title is None:
+            self._title = self._clean_title(self._raw_title)
+
+        return self._title
 
     @title.setter
-    def title(self, value):
-        self.__title = self._clean_title(value)
+    def title(self, value: str):
+        self._raw_title = value
+        self._title = None
+
+    @property
+    def time_created(self) -> datetime:
+        if self._time_created is None and self._convert_date is not None:
+            self._time_created = self._convert_date(self._raw_date)
+
+        return self._time_created
+
+    @time_created.setter
+    def time_created(self, value: datetime):
+        self._time_created = value
+        self._raw_date = None
+        self._convert_date = None
 
     @staticmethod
     def _clean_title(value: str) -> str:
@@ -24,13 +176,12 @@ class Bookmark:
         :return: 'str' Cleans the title of the bookmark from redundant text
         """
 
-        pattern = r'^(\(\d+\)\s).+'
-        match = re.search(pattern, value)
+        match = NOTIFICATION_COUNT_PATTERN.search(value)
 
         if match:
             redundant = match.group(1)
-            value = ''.join(value.split(redundant))
+            value = value.replace(redundant, '')
 
-        value = ''.join(value.split(' - YouTube'))
+        value = value.replace(' - YouTube', '')
 
         return value
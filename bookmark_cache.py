@@ -0,0 +1,165 @@
+import bisect
+import heapq
+import os
+import threading
+from datetime import datetime
+from operator import itemgetter
+from typing import Callable, Dict, List, Optional, Tuple
+
+from bookmark import Bookmark
+
+# The raw data of a bookmark: (date_added, title, url). The date is kept in the browser's format
+Row = Tuple[int, str, str]
+# The position of a bookmark in the pages: (date_added, node id). The id breaks the ties between equal dates
+PageKey = Tuple[int, str]
+
+
+def get_file_state(path: str) -> Optional[Tuple[int, int]]:
+    """
+    :param path: str. The path to the file
+    :return: tuple of the modification time in nanoseconds and the size of the file, or None if it doesn't exist
+    """
+
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+
+    return stat.st_mtime_ns, stat.st_size
+
+
+def select_rows(rows: List[Row], search: str, ascending: bool, limit: Optional[int]) -> List[Row]:
+    """
+    :param rows: list of rows in any order
+    :param search: str. Search by a keyword case insensitively. If not filled, all rows are returned
+    :param ascending: boolean. Sets the ordering of the rows by creation date
+    :param limit: int, optional. Sets the number of rows returned
+    :return: list of rows, sorted by creation date
+    """
+
+    if search:
+        search = search.lower()
+        rows = (r for r in rows if search in r[1].lower())
+
+    # With a limit, only the top of the rows are kept in a heap
+    if limit:
+        select = heapq.nsmallest if ascending else heapq.nlargest
+        return select(limit, rows, key=itemgetter(0))
+
+    return sorted(rows, key=itemgetter(0), reverse=not ascending)
+
+
+def sort_rows(rows: Dict[str, Row]) -> Tuple[List[PageKey], List[Row]]:
+    """
+    :param rows: dict of the rows by the browser's node id
+    :return: tuple of the keys of the rows and the rows, both in ascending order of the keys
+    """
+
+    items = sorted(((row[0], node_id or ''), row) for node_id, row in rows.items())
+
+    return [key for key, _ in items], [row for _, row in items]
+
+
+def select_page(keys: List[PageKey], rows: List[Row], search: str, ascending: bool, page_size: int,
+                after: Optional[PageKey] = None) -> Tuple[List[Row], Optional[PageKey]]:
+    """
+    Finds the position after the previous page by a binary search, and reads only the rows of the page from there.
+
+    :param keys: list of the keys of the rows, in ascending order
+    :param rows: list of the rows, in the order of the keys
+    :param search: str. Search by a keyword case insensitively. If not filled, all rows match
+    :param ascending: boolean. Sets the ordering of the rows by creation date
+    :param page_size: int. The maximum number of rows in the page
+    :param after: tuple, optional. The key of the last row of the previous page. If not filled, the first page is
+    returned
+    :return: tuple of the rows of the page and the key of its last row, or None if it is the last page
+    """
+
+    search = search.lower()
+
+    if ascending:
+        indexes = range(bisect.bisect_right(keys, after) if after is not None else 0, len(rows))
+    else:
+        indexes = range((bisect.bisect_left(keys, after) if after is not None else len(rows)) - 1, -1, -1)
+
+    page = []
+    last_index = None
+
+    for index in indexes:
+        if search in rows[index][1].lower():
+            page.append(rows[index])
+            last_index = index
+
+            if len(page) == page_size:
+                break
+
+    # A page shorter than the page size is the last one
+    if len(page) < page_size:
+        return page, None
+
+    return page, keys[last_index]
+
+
+class BookmarkCache:
+    """
+    The parsed YouTube bookmarks of a single bookmarks file, with the state of the file they were parsed from.
+    """
+
+    def __init__(self):
+        self.file_state: Optional[Tuple[int, int]] = None
+        # The checksum of the content, as written by the browser, if there is such
+        self.content_hash: Optional[str] = None
+        # The rows of the YouTube bookmarks by the browser's node id
+        self.rows: Dict[str, Row] = {}
+        # The keys and the rows in the order of the pages. They are sorted on the first page after an update
+        self._sorted: Optional[Tuple[List[PageKey], List[Row]]] = None
+        self.lock = threading.Lock()
+
+    def update(self, file_state: Optional[Tuple[int, int]], content_hash: Optional[str], rows: Dict[str, Row]) -> \
+            Tuple[int, int]:
+        """
+        Replaces the cached rows with the newly parsed ones.
+
+        :return: tuple of the numbers of added and removed node ids
+        """
+
+        added = len(rows.keys() - self.rows.keys())
+        removed = len(self.rows.keys() - rows.keys())
+
+        self.file_state = file_state
+        self.content_hash = content_hash
+        self.rows = rows
+        self._sorted = None
+
+        return added, removed
+
+    def select(self, search: str, ascending: bool, limit: Optional[int],
+               convert_date: Callable[[int], datetime]) -> List[Bookmark]:
+        """
+        Answers a search from the cached rows, without reading the bookmarks file.
+
+        :param convert_date: function, which converts the browser's date to datetime
+        :return: list of Bookmark objects
+        """
+
+        rows = select_rows(list(self.rows.values()), search, ascending, limit)
+
+        # Create the Bookmark objects only for the returned bookmarks. Their dates are converted on first access
+        return [Bookmark.from_raw(title, url, date_added, convert_date) for date_added, title, url in rows]
+
+    def select_page(self, search: str, ascending: bool, page_size: int, after: Optional[PageKey],
+                    convert_date: Callable[[int], datetime]) -> Tuple[List[Bookmark], Optional[PageKey]]:
+        """
+        Answers a page of a search from the cached rows, see select_page.
+
+        :param convert_date: function, which converts the browser's date to datetime
+        :return: tuple of the list of Bookmark objects and the cursor of the next page, or None if it is the last page
+        """
+
+        # The rows are sorted once, and every following page is found by a binary search
+        if self._sorted is None:
+            self._sorted = sort_rows(self.rows)
+
+        rows, cursor = select_page(*self._sorted, search, ascending, page_size, after)
+
+        return [Bookmark.from_raw(title, url, date_added, convert_date) for date_added, title, url in rows], cursor
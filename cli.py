@@ -0,0 +1,246 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+from typing import List, Optional, TextIO
+
+from batch_downloader import DownloadResult
+from bookmark import Bookmark
+from download_manager import DownloadManager
+
+# The short names of the supported browsers on the command line
+BROWSERS = {
+    'firefox': 'Mozilla Firefox',
+    'chrome': 'Google Chrome',
+    'chromium': 'Chromium',
+    'edge': 'Microsoft Edge',
+    'brave': 'Brave',
+    'all': DownloadManager.all_profiles,
+}
+# The target format of every --format choice
+TARGET_FORMATS = {
+    'mp3': 'mp3',
+    'audio': 'audio',
+    'video': 'mkv',
+}
+
+# Exit codes
+EXIT_OK = 0
+EXIT_FAILED_DOWNLOADS = 1
+EXIT_USAGE = 2
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description='Download YouTube videos from urls or browser bookmarks without the GUI. '
+                    'Prints one JSON line per finished job.'
+    )
+    parser.add_argument('urls', nargs='*', help='urls of YouTube videos')
+    parser.add_argument('--urls-file', help="file with one url per line, '-' for stdin")
+    parser.add_argument('--browser', choices=BROWSERS,
+                        help="load the YouTube bookmarks of the browser, or of all browsers with 'all'")
+    parser.add_argument('--bookmarks-path',
+                        help='directory of the bookmarks file. Defaults to the one in the settings, or to all profiles '
+                             'of the browser')
+    parser.add_argument('--search', default='', help='only the bookmarks, whose title contains it')
+    parser.add_argument('--limit', type=int, help='the maximum number of bookmarks')
+    parser.add_argument('--ascending', action='store_true', help='take the oldest bookmarks first')
+    parser.add_argument('--format', choices=TARGET_FORMATS, default='video',
+                        help='mp3, audio in its own codec (m4a or opus, copied without re-encoding) or video (mkv)')
+    parser.add_argument('--concurrency', type=int, help='downloads running at the same time')
+    parser.add_argument('--adaptive', action='store_true',
+                        help='adapt the number of concurrent downloads to the throughput and the throttling')
+    parser.add_argument('--bandwidth-limit', type=float, help='MiB/s of all downloads together')
+    parser.add_argument('--connections', type=int,
+                        help='connections per file, downloading its ranges or fragments in parallel')
+    parser.add_argument('--playlists', action='store_true',
+                        help='download all videos of the playlists and channels, instead of their first video')
+    parser.add_argument('--transcode-threads', type=int, help='threads of every ffmpeg process')
+    parser.add_argument('--metrics', help='append the timings of every stage of every job to this JSON lines file')
+    parser.add_argument('--prometheus', help='write the totals of the stages to this file for the textfile collector')
+    parser.add_argument('--profile', help='profile the batch with cProfile and save the statistics to this file')
+    parser.add_argument('--output', default='Downloads', help='the directory where the files are saved')
+    parser.add_argument('--settings', default='settings.txt', help='the path to the settings file')
+    parser.add_argument('--data-dir',
+                        help='the directory of the state files: the job queue, the metadata cache, the download '
+                             'archive and the metrics. Defaults to the one in the settings, or a directory of the user')
+    parser.add_argument('--queue', action='store_true',
+                        help='add the jobs to the durable job queue and download all of its unfinished jobs, retrying '
+                             'the failed ones. Without urls or --browser, only the unfinished jobs are resumed')
+    parser.add_argument('--queue-path',
+                        help='the database of the job queue, which can be shared by processes on several computers '
+                             'through a shared filesystem. Defaults to the one in the settings, or job_queue.sqlite '
+                             'in the data directory')
+    parser.add_argument('--shared-filesystem', action='store_true',
+                        help='the job queue is shared with workers on other computers, so it is opened without the '
+                             'write-ahead log, which needs a local filesystem')
+    parser.add_argument('--idle-timeout', type=float, default=0.0,
+                        help='with --queue, keep waiting that many seconds for new jobs after the queue is finished, '
+                             'e.g. in a worker started before the jobs are added')
+    parser.add_argument('--workers', type=int,
+                        help='add the jobs to the job queue, start that many worker processes, which download them '
+                             'with --queue, and print the results of all workers, including the ones started '
+                             'separately. With 0, only the separately started workers download the jobs')
+
+    return parser.parse_args(argv)
+
+
+def read_urls(file: TextIO) -> List[str]:
+    """
+    :param file: text file with one url per line. Empty lines and lines starting with '#' are skipped
+    :return: list of str
+    """
+
+    urls = []
+
+    for line in file:
+        line = line.strip()
+
+        if line and not line.startswith('#'):
+            urls.append(line)
+
+    return urls
+
+
+def collect_bookmarks(manager: DownloadManager, args: argparse.Namespace) -> List[Bookmark]:
+    """
+    :return: list of Bookmark objects of the urls and of the loaded browser bookmarks
+    :raises ValueError: if the bookmarks can't be loaded
+    """
+
+    urls = list(args.urls)
+
+    if args.urls_file == '-':
+        urls.extend(read_urls(sys.stdin))
+    elif args.urls_file:
+        with open(args.urls_file) as file:
+            urls.extend(read_urls(file))
+
+    # The title of a url is not known before it is downloaded
+    bookmarks = [Bookmark(url, url, None) for url in urls]
+
+    if args.browser:
+        loader = manager.get_loader(BROWSERS[args.browser], args.bookmarks_path)
+
+        if not loader.path_to_bookmarks:
+            raise ValueError(
+                f'The path to the {loader} bookmarks is not set, and no profile was found. Pass it with --bookmarks-path'
+            )
+
+        bookmarks.extend(manager.load_bookmarks(loader, args.search, args.ascending, args.limit))
+
+    return bookmarks
+
+
+def start_workers(count: int, manager: DownloadManager, args: argparse.Namespace) -> List[subprocess.Popen]:
+    """
+    :param count: int. The number of worker processes
+    :param manager: DownloadManager. Its job queue is shared with the workers
+    :param args: the parsed arguments of the coordinator. The download options are passed to the workers
+    :return: list of the started processes
+    """
+
+    command = [
+        sys.executable, os.path.abspath(__file__), '--queue', '--queue-path', manager.job_queue_path,
+        '--settings', args.settings, '--data-dir', manager.data_dir, '--idle-timeout', str(args.idle_timeout),
+    ]
+
+    for option, value in (
+            ('--concurrency', args.concurrency),
+            ('--bandwidth-limit', args.bandwidth_limit),
+            ('--connections', args.connections),
+            ('--transcode-threads', args.transcode_threads),
+            ('--metrics', args.metrics),
+    ):
+        if value:
+            command.extend([option, str(value)])
+
+    if args.adaptive:
+        command.append('--adaptive')
+    if args.playlists:
+        command.append('--playlists')
+    if args.shared_filesystem:
+        command.append('--shared-filesystem')
+
+    # The results of the workers are read from the queue, so their own output is not printed twice
+    return [subprocess.Popen(command, stdout=subprocess.DEVNULL) for _ in range(count)]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    :param argv: list of the command line arguments, without the program name. Defaults to sys.argv
+    :return: int. 0 if all jobs succeeded, 1 if any of them failed, 2 if the batch couldn't be started
+    """
+
+    args = parse_args(argv)
+
+    if not args.urls and not args.urls_file and not args.browser and not args.queue and args.workers is None:
+        print('Nothing to download. Pass urls, --urls-file or --browser', file=sys.stderr)
+        return EXIT_USAGE
+
+    manager = DownloadManager(args.settings, args.queue_path, args.shared_filesystem or None, args.data_dir)
+
+    # The arguments override the settings for this run only
+    if args.adaptive:
+        manager.settings['adaptive'] = True
+    if args.bandwidth_limit:
+        manager.settings['bandwidth_limit'] = args.bandwidth_limit
+    if args.connections:
+        manager.settings['connections_per_file'] = args.connections
+    if args.playlists:
+        manager.settings['expand_playlists'] = True
+    if args.transcode_threads:
+        manager.settings['transcode_threads'] = args.transcode_threads
+    if args.metrics:
+        manager.metrics.jsonl_path = args.metrics
+    if args.prometheus:
+        manager.metrics.prometheus_path = args.prometheus
+
+    output_lock = threading.Lock()
+
+    def on_result(result: DownloadResult):
+        # Called from the worker threads, so the lines are not interleaved
+        with output_lock:
+            sys.stdout.write(json.dumps(result.as_dict()) + '\n')
+            sys.stdout.flush()
+
+    try:
+        bookmarks = collect_bookmarks(manager, args)
+    except Exception as e:
+        print(str(e), file=sys.stderr)
+        manager.close()
+        return EXIT_USAGE
+
+    try:
+        if args.workers is not None:
+            # Only the results recorded from now on belong to this batch
+            after = manager.job_queue.last_result_id()
+            manager.job_queue.add(bookmarks, TARGET_FORMATS[args.format], args.output)
+            workers = start_workers(args.workers, manager, args)
+
+            try:
+                results = manager.follow_queued(on_result, after)
+            finally:
+                for worker in workers:
+                    worker.wait()
+        elif args.queue:
+            manager.job_queue.add(bookmarks, TARGET_FORMATS[args.format], args.output)
+            results = manager.download_queued(on_result, args.concurrency, args.profile, args.idle_timeout)
+        else:
+            results = manager.download(
+                bookmarks, TARGET_FORMATS[args.format], on_result, args.output, args.concurrency, args.profile
+            )
+    finally:
+        manager.close()
+
+    # The attempts, which are retried later, are not failures of the batch
+    if any(r.status == 'failed' for r in results):
+        return EXIT_FAILED_DOWNLOADS
+
+    return EXIT_OK
+
+
+if __name__ == '__main__':
+    sys.exit(main())
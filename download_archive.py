@@ -0,0 +1,99 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+
+class ArchiveEntry:
+    def __init__(self, video_id: str, target_format: str, path: str, size: int):
+        self.video_id = video_id
+        # 'mp3', 'audio' or 'mkv'. The same video can be archived once in every format
+        self.target_format = target_format
+        self.path = path
+        # The size of the file in bytes when it was archived
+        self.size = size
+
+
+class DownloadArchive:
+    def __init__(self, path='download_archive.sqlite'):
+        """
+        :param path: str. The path to the SQLite database file
+        """
+
+        self._lock = threading.Lock()
+
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS archive (
+                video_id TEXT NOT NULL,
+                format TEXT NOT NULL,
+                path TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                downloaded_at REAL NOT NULL,
+                PRIMARY KEY (video_id, format)
+            )
+        """)
+        self._connection.commit()
+
+        # The whole archive is kept in memory, so every lookup is a dictionary lookup
+        self._entries: Dict[Tuple[str, str], ArchiveEntry] = {
+            (video_id, target_format): ArchiveEntry(video_id, target_format, path, size)
+            for video_id, target_format, path, size in
+            self._connection.execute('SELECT video_id, format, path, size FROM archive')
+        }
+
+    def get(self, video_id: str, target_format: str) -> Optional[ArchiveEntry]:
+        with self._lock:
+            return self._entries.get((video_id, target_format))
+
+    def is_downloaded(self, video_id: Optional[str], target_format: str) -> bool:
+        """
+        :param video_id: str. The id of the YouTube video
+        :param target_format: str. 'mp3', 'audio' or 'mkv'
+        :return: boolean. True if the video was downloaded in the format, and the file still exists with the same size
+        """
+
+        if video_id is None:
+            return False
+
+        entry = self.get(video_id, target_format)
+
+        if entry is None:
+            return False
+
+        # A single stat call, so a deleted or truncated file is downloaded again
+        try:
+            return os.stat(entry.path).st_size == entry.size
+        except OSError:
+            return False
+
+    def add(self, video_id: Optional[str], target_format: str, path: Optional[str]):
+        """
+        :param video_id: str. The id of the YouTube video
+        :param target_format: str. 'mp3', 'audio' or 'mkv'
+        :param path: str. The path to the downloaded file
+        :return: None
+        """
+
+        # Only videos with a known id and output file can be archived
+        if video_id is None or not path or not os.path.isfile(path):
+            return
+
+        entry = ArchiveEntry(video_id, target_format, path, os.path.getsize(path))
+
+        with self._lock:
+            self._entries[(video_id, target_format)] = entry
+            self._connection.execute(
+                'INSERT OR REPLACE INTO archive (video_id, format, path, size, downloaded_at) VALUES (?, ?, ?, ?, ?)',
+                (video_id, target_format, entry.path, entry.size, time.time())
+            )
+            self._connection.commit()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
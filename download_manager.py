@@ -0,0 +1,357 @@
+import importlib
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, Iterator, List, Optional, Type
+
+from batch_downloader import DownloadResult
+from bookmark import Bookmark
+from download_archive import DownloadArchive
+from job_queue import JobQueue
+from message_bus import MessageBus
+from metadata_cache import MetadataCache
+from metrics import Metrics, profile_batch
+from scheduler import AdaptiveScheduler
+from session_pool import SessionPool
+
+if TYPE_CHECKING:
+    from loaders import BookmarkLoader
+    from pipeline import DownloadPipeline
+
+
+def get_default_data_dir() -> str:
+    """
+    :return: str. The directory of the state files of the current user, e.g. the job queue and the download archive
+    """
+
+    if sys.platform.startswith('win'):
+        return os.path.join(os.environ.get('LOCALAPPDATA') or os.path.expanduser('~'), 'youtube-downloader')
+
+    if sys.platform == 'darwin':
+        return os.path.expanduser('~/Library/Application Support/youtube-downloader')
+
+    return os.path.join(os.environ.get('XDG_DATA_HOME') or os.path.expanduser('~/.local/share'), 'youtube-downloader')
+
+
+class DownloadManager:
+    """
+    The download core, shared by the Tk application and the headless command line. It owns the settings, the metadata
+    cache and the download archive, and it doesn't depend on any GUI.
+    """
+
+    # The names of the loader classes of the supported browsers. The loaders module is imported with the first
+    # loaded bookmarks, not at startup
+    supported_browsers: Dict[str, str] = {
+        'Mozilla Firefox': 'FirefoxLoader',
+        'Google Chrome': 'ChromeLoader',
+        'Chromium': 'ChromiumLoader',
+        'Microsoft Edge': 'EdgeLoader',
+        'Brave': 'BraveLoader',
+    }
+    # The choice, which loads the profiles of all supported browsers found on this computer
+    all_profiles = 'All browser profiles'
+    default_concurrency = 4
+    # The upper bound of the adaptive concurrency
+    max_concurrency = 16
+    # The connections of a single download, each one downloading a range or the fragments of the file
+    default_connections = 4
+
+    def __init__(self, settings_path='settings.txt', job_queue_path: Optional[str] = None,
+                 shared_filesystem: Optional[bool] = None, data_dir: Optional[str] = None):
+        """
+        :param settings_path: str. The path to the JSON settings file
+        :param job_queue_path: str, optional. The database of the job queue, which may be shared with worker
+        processes. Defaults to the settings, or to job_queue.sqlite in the data directory
+        :param shared_filesystem: boolean, optional. True if the job queue is shared with worker processes on other
+        computers. Defaults to the settings
+        :param data_dir: str, optional. The directory of the state files. Defaults to the settings, or to the
+        directory of the current user, see get_default_data_dir
+        """
+
+        self.settings_path = settings_path
+        self.settings = self.load_settings(settings_path)
+        self.data_dir = data_dir or self.settings.get('data_dir') or get_default_data_dir()
+        os.makedirs(self.data_dir, exist_ok=True)
+
+        # The extracted metadata of the videos, shared by all downloads
+        self.metadata_cache = MetadataCache(self.get_data_path('metadata_cache.sqlite'))
+        # The videos which are already downloaded, so they are not downloaded again
+        self.download_archive = DownloadArchive(self.get_data_path('download_archive.sqlite'))
+        # The durable queue of the batch downloads is opened with its first use, so the batches, which don't use it,
+        # don't create it
+        self.job_queue_path = job_queue_path or self.settings.get('job_queue_path') or self.get_data_path(
+            'job_queue.sqlite'
+        )
+        self.shared_filesystem = shared_filesystem or self.settings.get('job_queue_shared_filesystem', False)
+        self._job_queue: Optional[JobQueue] = None
+        self._job_queue_lock = threading.Lock()
+        # The long-lived sessions of yt_dlp, shared by all batches
+        self.session_pool = SessionPool()
+        # The timings of the stages of every job, written to metrics.jsonl and metrics.prom by default
+        self.metrics = Metrics(
+            self.settings.get('metrics_path') or self.get_data_path('metrics.jsonl'),
+            self.settings.get('prometheus_path') or self.get_data_path('metrics.prom'),
+        )
+
+    @property
+    def job_queue(self) -> JobQueue:
+        """
+        :return: JobQueue. The durable queue of the batch downloads, which are resumed after a restart
+        """
+
+        with self._job_queue_lock:
+            if self._job_queue is None:
+                self._job_queue = JobQueue(self.job_queue_path, shared_filesystem=self.shared_filesystem)
+
+            return self._job_queue
+
+    def get_data_path(self, name: str) -> str:
+        """
+        :param name: str. The name of a state file, e.g. 'job_queue.sqlite'
+        :return: str. The path to the file in the data directory
+        """
+
+        return os.path.join(self.data_dir, name)
+
+    @staticmethod
+    def load_settings(path='settings.txt') -> dict:
+        try:
+            with open(path) as file:
+                # Parse the JSON data as dictionary
+                return json.loads(file.read())
+        except FileNotFoundError:
+            return {}
+
+    def save_settings(self):
+        with open(self.settings_path, 'w') as file:
+            # Write the dictionary as JSON
+            file.write(json.dumps(self.settings))
+
+    @classmethod
+    def get_loader_class(cls, browser: str) -> Optional[Type['BookmarkLoader']]:
+        """
+        :param browser: str. A key of supported_browsers, e.g. 'Google Chrome'
+        :return: the inheritor of BookmarkLoader, or None if the browser is not supported
+        """
+
+        class_name = cls.supported_browsers.get(browser)
+
+        if class_name is None:
+            return None
+
+        return getattr(importlib.import_module('loaders'), class_name)
+
+    def get_loader(self, browser: str, path_to_bookmarks: Optional[str] = None) -> Optional['BookmarkLoader']:
+        """
+        :param browser: str. A key of supported_browsers, e.g. 'Google Chrome', or all_profiles
+        :param path_to_bookmarks: str, optional. The directory of the bookmarks file. Defaults to the one in the
+        settings. If neither is set, all profiles of the browser, which are found on this computer, are loaded
+        :return: BookmarkLoader, or None if the browser is not supported
+        """
+
+        loaders = importlib.import_module('loaders')
+
+        if browser == self.all_profiles:
+            return loaders.MultiProfileLoader.discover(self.get_loader_class(b) for b in self.supported_browsers)
+
+        loader_class = self.get_loader_class(browser)
+
+        if loader_class is None:
+            return None
+
+        loader = loader_class()
+        loader.path_to_bookmarks = path_to_bookmarks or self.settings.get(str(loader))
+
+        if not loader.path_to_bookmarks:
+            profiles = loaders.MultiProfileLoader.discover([loader_class])
+
+            # Keep the loader without a path, so the caller reports the missing path
+            if profiles.loaders:
+                return profiles
+
+        return loader
+
+    def load_bookmarks(self, loader: 'BookmarkLoader', search: str = '', ascending=False,
+                       limit: Optional[int] = None) -> List[Bookmark]:
+        """
+        Loads the bookmarks and records the time in the 'load_bookmarks' stage of the metrics.
+
+        :param loader: BookmarkLoader
+        :param search: str. The same as in BookmarkLoader.load_bookmarks
+        :param ascending: boolean. The same as in BookmarkLoader.load_bookmarks
+        :param limit: int, optional. The same as in BookmarkLoader.load_bookmarks
+        :return: list of Bookmark objects
+        """
+
+        with self.metrics.measure('load_bookmarks', str(loader)) as record:
+            bookmarks = loader.load_bookmarks(search, ascending, limit)
+            record['items'] = len(bookmarks)
+
+        return bookmarks
+
+    def iter_pages(self, loader: 'BookmarkLoader', search: str = '', ascending=False,
+                   page_size: int = 100) -> Iterator[List[Bookmark]]:
+        """
+        Loads the bookmarks page by page and records the time of every page in the 'load_bookmarks' stage of the
+        metrics.
+
+        :param loader: BookmarkLoader
+        :param search: str. The same as in BookmarkLoader.load_bookmarks
+        :param ascending: boolean. The same as in BookmarkLoader.load_bookmarks
+        :param page_size: int. The maximum number of bookmarks in a page
+        :return: generator of the pages of Bookmark objects, see BookmarkLoader.iter_pages
+        """
+
+        pages = loader.iter_pages(search, ascending, page_size)
+
+        for index in itertools.count():
+            started_at = time.perf_counter()
+            page = next(pages, None)
+
+            if page is None:
+                return
+
+            self.metrics.record('load_bookmarks', time.perf_counter() - started_at, str(loader), items=len(page),
+                                page=index)
+            yield page
+
+    def create_pipeline(self, concurrency: Optional[int] = None, prefetch: Optional[bool] = None,
+                        bus: Optional[MessageBus] = None) -> 'DownloadPipeline':
+        """
+        :param concurrency: int, optional. The number of downloads running at the same time. Defaults to the settings
+        :param prefetch: boolean, optional. Resolve the metadata of the batch before downloading. Defaults to the
+        settings
+        :param bus: MessageBus, optional. Receives the progress of the downloads
+        :return: DownloadPipeline
+        """
+
+        # The pipeline imports the process pool and the network modules, so it is imported with the first download
+        from pipeline import DownloadPipeline
+
+        concurrency = concurrency or self.settings.get('concurrency', self.default_concurrency)
+
+        return DownloadPipeline(
+            network_workers=concurrency,
+            cache=self.metadata_cache,
+            prefetch=self.settings.get('prefetch', False) if prefetch is None else prefetch,
+            archive=self.download_archive,
+            bus=bus,
+            scheduler=self.create_scheduler(concurrency),
+            connections=self.settings.get('connections_per_file', self.default_connections),
+            expand_playlists=self.settings.get('expand_playlists', False),
+            pool=self.session_pool,
+            transcode_threads=self.settings.get('transcode_threads'),
+            metrics=self.metrics,
+        )
+
+    def create_scheduler(self, concurrency: int) -> Optional[AdaptiveScheduler]:
+        """
+        :param concurrency: int. The number of downloads running at the same time, or at the start if it is adaptive
+        :return: AdaptiveScheduler, or None if neither the adaptive concurrency nor the bandwidth limit is set
+        """
+
+        adaptive = self.settings.get('adaptive', False)
+        # The limit of all downloads together in MiB/s
+        bandwidth_limit = self.settings.get('bandwidth_limit')
+
+        if not adaptive and not bandwidth_limit:
+            return None
+
+        return AdaptiveScheduler(
+            initial_workers=concurrency,
+            # Without the adaptive concurrency, the scheduler only splits the bandwidth
+            min_workers=1 if adaptive else concurrency,
+            max_workers=max(concurrency, self.max_concurrency) if adaptive else concurrency,
+            bandwidth_limit=bandwidth_limit * 2 ** 20 if bandwidth_limit else None,
+            host_rate=self.settings.get('host_rate'),
+        )
+
+    def download(self, bookmarks: Iterable[Bookmark], target_format: str,
+                 on_result: Callable[[DownloadResult], None] = lambda result: None, output_path='Downloads',
+                 concurrency: Optional[int] = None, profile_path: Optional[str] = None) -> List[DownloadResult]:
+        """
+        Downloads a batch in the calling thread and blocks until all of it is done.
+
+        :param bookmarks: iterable of Bookmark objects to download
+        :param target_format: str. 'mp3', 'audio' or 'mkv'
+        :param on_result: function, called from a worker thread with the DownloadResult of every job as it finishes
+        :param output_path: str. The directory where the downloaded files are saved
+        :param concurrency: int, optional. The number of downloads running at the same time. Defaults to the settings
+        :param profile_path: str, optional. If it is filled, the batch is profiled with cProfile, and the statistics
+        are saved to this file
+        :return: list of DownloadResult objects in order of completion
+        """
+
+        pipeline = self.create_pipeline(concurrency)
+
+        if profile_path is None:
+            return pipeline.run(bookmarks, target_format, on_result, output_path)
+
+        with profile_batch(profile_path):
+            return pipeline.run(bookmarks, target_format, on_result, output_path)
+
+    def download_queued(self, on_result: Callable[[DownloadResult], None] = lambda result: None,
+                        concurrency: Optional[int] = None, profile_path: Optional[str] = None,
+                        idle_timeout: float = 0.0) -> List[DownloadResult]:
+        """
+        Downloads the jobs of the durable queue, including the ones left from a previous run, and blocks until all
+        of them are done or failed too many times. Other processes may download from the same queue at the same time.
+
+        :param on_result: function, called from a worker thread with the DownloadResult of every attempt, including
+        the attempts of the other processes
+        :param concurrency: int, optional. The number of downloads running at the same time. Defaults to the settings
+        :param profile_path: str, optional. If it is filled, the batch is profiled with cProfile, see download
+        :param idle_timeout: float. The seconds to wait for new jobs after the queue is finished
+        :return: list of DownloadResult objects of this process in order of completion
+        """
+
+        pipeline = self.create_pipeline(concurrency)
+
+        if profile_path is None:
+            return pipeline.run_queue(self.job_queue, on_result, idle_timeout=idle_timeout)
+
+        with profile_batch(profile_path):
+            return pipeline.run_queue(self.job_queue, on_result, idle_timeout=idle_timeout)
+
+    def follow_queued(self, on_result: Callable[[DownloadResult], None] = lambda result: None, after: int = 0,
+                      poll_interval: float = 1.0) -> List[DownloadResult]:
+        """
+        Waits for the jobs of the queue, which are downloaded by the worker processes, without downloading any of
+        them, and blocks until all of them are done or failed too many times.
+
+        :param on_result: function, called with the DownloadResult of every attempt of every worker as it is recorded
+        :param after: int. The id of the last result, which is not reported, see JobQueue.last_result_id
+        :param poll_interval: float. The seconds between two reads of the queue
+        :return: list of DownloadResult objects in order of completion
+        """
+
+        results = []
+
+        while True:
+            finished = self.job_queue.is_finished()
+
+            for result_id, worker, data in self.job_queue.results(after):
+                after = result_id
+                result = DownloadResult.from_dict(data)
+                results.append(result)
+                on_result(result)
+
+            # The results are read once more after the last job, so none of them is missed
+            if finished:
+                return results
+
+            # Return the jobs of the workers, which stopped, so the other workers take them over
+            self.job_queue.recover()
+            time.sleep(poll_interval)
+
+    def close(self):
+        self.session_pool.close()
+        self.metrics.close()
+        self.metadata_cache.close()
+        self.download_archive.close()
+
+        if self._job_queue is not None:
+            self._job_queue.close()
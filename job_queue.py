@@ -0,0 +1,440 @@
+import json
+import os
+import random
+import socket
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from bookmark import Bookmark
+
+# The states of a job
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+def get_worker_id() -> str:
+    """
+    :return: str. Identifies this process among the workers of a shared queue, e.g. 'host-1:4242'
+    """
+
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+class Job:
+    def __init__(self, job_id: int, url: str, title: str, target_format: str, output_path: str, attempts: int):
+        self.id = job_id
+        self.url = url
+        self.title = title
+        # 'mp3', 'audio' or 'mkv'
+        self.target_format = target_format
+        self.output_path = output_path
+        # The number of times the job was claimed, including the current one
+        self.attempts = attempts
+        # True if the lease of the job expired before it was finished, and another worker took it over
+        self.lease_lost = False
+
+    def to_bookmark(self) -> Bookmark:
+        return Bookmark(self.title, self.url, None)
+
+
+class JobQueue:
+    """
+    A durable queue of download jobs in SQLite, so a batch survives a crash or a restart of the application.
+
+    The queue can be shared by several processes, on this computer or on other ones, which open the same database
+    file on a shared filesystem. Every claimed job is leased to the claiming worker, which renews the leases of its
+    jobs with heartbeats. The jobs of a worker, which stopped sending heartbeats, return to the queue when their leases
+    expire, and the results of all workers are recorded, so the process which added the jobs can follow them.
+    """
+
+    def __init__(self, path='job_queue.sqlite', max_attempts: int = 5, base_delay: float = 5.0,
+                 max_delay: float = 600.0, lease_seconds: float = 30.0, worker_id: Optional[str] = None,
+                 shared_filesystem=False):
+        """
+        :param path: str. The path to the SQLite database file
+        :param max_attempts: int. A job, which failed that many times, is not retried any more
+        :param base_delay: float. The seconds before the first retry. The delay doubles after every failed attempt
+        :param max_delay: float. The maximum seconds between two attempts
+        :param lease_seconds: float. The seconds a claimed job stays with its worker without a heartbeat
+        :param worker_id: str, optional. Identifies this worker. Defaults to the host name and the process id
+        :param shared_filesystem: boolean. True if the database is opened by processes on other computers too
+        """
+
+        self.path = path
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.lease_seconds = lease_seconds
+        self.worker_id = worker_id or get_worker_id()
+        self._lock = threading.Lock()
+
+        # Autocommit mode, so the claims are explicit IMMEDIATE transactions
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        if shared_filesystem:
+            # The write-ahead log needs memory shared by all processes, which the computers don't have, so the
+            # rollback journal is used, with the file locks of the shared filesystem
+            self._connection.execute('PRAGMA journal_mode = DELETE')
+        else:
+            # The write-ahead log lets the readers run while a job is claimed, and every commit is a single append
+            self._connection.execute('PRAGMA journal_mode = WAL')
+            self._connection.execute('PRAGMA synchronous = NORMAL')
+        self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY,
+                url TEXT NOT NULL,
+                title TEXT NOT NULL,
+                format TEXT NOT NULL,
+                output_path TEXT NOT NULL,
+                state TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                next_attempt_at REAL NOT NULL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                UNIQUE (url, format)
+            )
+        """)
+        self._connection.execute('CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, next_attempt_at)')
+
+        # The queues created before the leases have no lease columns
+        columns = {row[1] for row in self._connection.execute('PRAGMA table_info(jobs)')}
+
+        if 'worker' not in columns:
+            self._connection.execute('ALTER TABLE jobs ADD COLUMN worker TEXT')
+        if 'lease_expires_at' not in columns:
+            self._connection.execute('ALTER TABLE jobs ADD COLUMN lease_expires_at REAL')
+
+        # Every attempt of every worker, in the order they finished
+        self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS results (
+                id INTEGER PRIMARY KEY,
+                job_id INTEGER NOT NULL,
+                worker TEXT NOT NULL,
+                result TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+        self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS workers (
+                id TEXT PRIMARY KEY,
+                started_at REAL NOT NULL,
+                heartbeat_at REAL NOT NULL,
+                running INTEGER NOT NULL DEFAULT 0,
+                completed INTEGER NOT NULL DEFAULT 0,
+                failed INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+
+        self.recover()
+
+    def recover(self) -> int:
+        """
+        Returns the running jobs, whose leases expired, to the queue, e.g. the jobs of a worker, which crashed or lost
+        the connection to the shared filesystem. A job, which was claimed max_attempts times, is failed instead, so a
+        video, which crashes its workers, is not retried forever.
+
+        :return: int. The number of recovered jobs
+        """
+
+        now = time.time()
+
+        with self._lock:
+            return self._recover(now)
+
+    def _recover(self, now: float) -> int:
+        # The jobs running before the leases were added have no lease, and they are recovered at once
+        return self._connection.execute("""
+            UPDATE jobs SET
+                state = CASE WHEN attempts >= ? THEN ? ELSE ? END,
+                last_error = CASE WHEN attempts >= ? THEN 'The worker stopped while downloading' ELSE last_error END,
+                worker = NULL,
+                lease_expires_at = NULL,
+                updated_at = ?
+            WHERE state = ? AND (lease_expires_at IS NULL OR lease_expires_at < ?)
+        """, (self.max_attempts, FAILED, PENDING, self.max_attempts, now, RUNNING, now)).rowcount
+
+    def add(self, bookmarks: Iterable[Bookmark], target_format: str, output_path='Downloads') -> int:
+        """
+        :param bookmarks: iterable of Bookmark objects
+        :param target_format: str. 'mp3', 'audio' or 'mkv'
+        :param output_path: str. The directory where the downloaded files are saved
+        :return: int. The number of queued jobs. The jobs, which are already queued, are not added again, and the
+        failed ones are retried from the start
+        """
+
+        now = time.time()
+        rows = [
+            (b.canonical_url, b.title or b.url, target_format, output_path, PENDING, now, now, now) for b in bookmarks
+        ]
+
+        with self._lock:
+            self._connection.execute('BEGIN IMMEDIATE')
+            before = self._connection.total_changes
+
+            try:
+                self._connection.executemany("""
+                    INSERT INTO jobs (url, title, format, output_path, state, next_attempt_at, created_at, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (url, format) DO UPDATE SET
+                        state = excluded.state,
+                        attempts = 0,
+                        last_error = NULL,
+                        next_attempt_at = excluded.next_attempt_at,
+                        updated_at = excluded.updated_at
+                    WHERE state IN ('done', 'failed')
+                """, rows)
+            except Exception:
+                self._connection.execute('ROLLBACK')
+                raise
+
+            added = self._connection.total_changes - before
+            self._connection.execute('COMMIT')
+
+        return added
+
+    def claim(self) -> Optional[Job]:
+        """
+        Takes the next job, which is due, and leases it to this worker. The claim is atomic, so every job is taken by
+        a single worker, even if the queue is shared by several processes.
+
+        :return: Job, or None if no job is due
+        """
+
+        now = time.time()
+
+        with self._lock:
+            self._connection.execute('BEGIN IMMEDIATE')
+
+            try:
+                # Take over the jobs of the workers, which stopped
+                self._recover(now)
+
+                row = self._connection.execute("""
+                    SELECT id, url, title, format, output_path, attempts FROM jobs
+                    WHERE state = ? AND next_attempt_at <= ?
+                    ORDER BY next_attempt_at, id
+                    LIMIT 1
+                """, (PENDING, now)).fetchone()
+
+                if row is not None:
+                    self._connection.execute("""
+                        UPDATE jobs SET state = ?, attempts = attempts + 1, worker = ?, lease_expires_at = ?,
+                            updated_at = ?
+                        WHERE id = ?
+                    """, (RUNNING, self.worker_id, now + self.lease_seconds, now, row[0]))
+            except Exception:
+                self._connection.execute('ROLLBACK')
+                raise
+
+            self._connection.execute('COMMIT')
+
+        if row is None:
+            return None
+
+        job_id, url, title, target_format, output_path, attempts = row
+
+        return Job(job_id, url, title, target_format, output_path, attempts + 1)
+
+    def complete(self, job: Job, result: Optional[dict] = None) -> bool:
+        """
+        :param job: Job. The finished job
+        :param result: dict, optional. The description of the result, e.g. DownloadResult.as_dict, recorded for the
+        other processes sharing the queue
+        :return: boolean. False if the lease of the job expired, and another worker took it over
+        """
+
+        return self._finish(job, DONE, None, time.time(), result)
+
+    def fail(self, job: Job, error: Exception, result: Optional[dict] = None) -> bool:
+        """
+        :param job: Job. The failed job
+        :param error: Exception. The error of the failed attempt
+        :param result: dict, optional. The description of the result, see complete
+        :return: boolean. True if the job will be retried. False if it failed too many times, or if its lease expired,
+        and another worker took it over
+        """
+
+        now = time.time()
+        retry = self.will_retry(job)
+        owned = self._finish(job, PENDING if retry else FAILED, str(error), now + self.get_delay(job.attempts), result)
+
+        return retry and owned
+
+    def will_retry(self, job: Job) -> bool:
+        """
+        :param job: Job. A running job
+        :return: boolean. True if the job is retried, if its current attempt fails
+        """
+
+        return job.attempts < self.max_attempts
+
+    def _finish(self, job: Job, state: str, error: Optional[str], next_attempt_at: float,
+                result: Optional[dict]) -> bool:
+        now = time.time()
+
+        with self._lock:
+            self._connection.execute('BEGIN IMMEDIATE')
+
+            try:
+                # Only the worker, which holds the lease, finishes the job
+                owned = self._connection.execute("""
+                    UPDATE jobs SET state = ?, last_error = ?, next_attempt_at = ?, worker = NULL,
+                        lease_expires_at = NULL, updated_at = ?
+                    WHERE id = ? AND state = ? AND (worker = ? OR worker IS NULL)
+                """, (state, error, next_attempt_at, now, job.id, RUNNING, self.worker_id)).rowcount > 0
+
+                if owned:
+                    # The failed attempts are counted, including the ones, which are retried later
+                    column = 'completed' if state == DONE else 'failed'
+                    self._connection.execute(
+                        'INSERT INTO results (job_id, worker, result, created_at) VALUES (?, ?, ?, ?)',
+                        (job.id, self.worker_id, json.dumps(result or {}), now)
+                    )
+                    self._connection.execute(
+                        f'UPDATE workers SET {column} = {column} + 1 WHERE id = ?', (self.worker_id,)
+                    )
+            except Exception:
+                self._connection.execute('ROLLBACK')
+                raise
+
+            self._connection.execute('COMMIT')
+
+        job.lease_lost = not owned
+
+        return owned
+
+    def heartbeat(self, running: int = 0) -> int:
+        """
+        Renews the leases of the jobs of this worker, and records that it is alive. Called periodically, more often
+        than every lease_seconds, while the worker is running.
+
+        :param running: int. The number of jobs, which the worker is processing
+        :return: int. The number of renewed leases
+        """
+
+        now = time.time()
+
+        with self._lock:
+            self._connection.execute('BEGIN IMMEDIATE')
+
+            try:
+                self._connection.execute("""
+                    INSERT INTO workers (id, started_at, heartbeat_at, running) VALUES (?, ?, ?, ?)
+                    ON CONFLICT (id) DO UPDATE SET heartbeat_at = excluded.heartbeat_at, running = excluded.running
+                """, (self.worker_id, now, now, running))
+                renewed = self._connection.execute(
+                    'UPDATE jobs SET lease_expires_at = ? WHERE state = ? AND worker = ?',
+                    (now + self.lease_seconds, RUNNING, self.worker_id)
+                ).rowcount
+            except Exception:
+                self._connection.execute('ROLLBACK')
+                raise
+
+            self._connection.execute('COMMIT')
+
+        return renewed
+
+    def results(self, after: int = 0, exclude_worker: Optional[str] = None) -> List[Tuple[int, str, dict]]:
+        """
+        :param after: int. The id of the last result, which was already read. 0 reads all of them
+        :param exclude_worker: str, optional. Skip the results of this worker, e.g. the ones already reported by this
+        process
+        :return: list of tuples of the id of the result, the id of its worker and the result dictionary, in the order
+        they were recorded
+        """
+
+        with self._lock:
+            rows = self._connection.execute(
+                'SELECT id, worker, result FROM results WHERE id > ? AND worker IS NOT ? ORDER BY id',
+                (after, exclude_worker)
+            ).fetchall()
+
+        return [(row_id, worker, json.loads(result)) for row_id, worker, result in rows]
+
+    def last_result_id(self) -> int:
+        """
+        :return: int. The id of the last recorded result, or 0 if there are no results
+        """
+
+        with self._lock:
+            return self._connection.execute('SELECT COALESCE(MAX(id), 0) FROM results').fetchone()[0]
+
+    def workers(self) -> List[dict]:
+        """
+        :return: list of dictionaries with the id, the number of running jobs, completed jobs and failed attempts, and
+        the seconds since the last heartbeat of every worker, which ever processed this queue. A worker is alive, while
+        its heartbeats are more recent than lease_seconds
+        """
+
+        now = time.time()
+
+        with self._lock:
+            rows = self._connection.execute(
+                'SELECT id, heartbeat_at, running, completed, failed FROM workers ORDER BY started_at'
+            ).fetchall()
+
+        return [{
+            'id': worker_id,
+            'alive': now - heartbeat_at <= self.lease_seconds,
+            'seconds_since_heartbeat': round(now - heartbeat_at, 1),
+            'running': running,
+            'completed': completed,
+            'failed': failed,
+        } for worker_id, heartbeat_at, running, completed, failed in rows]
+
+    def get_delay(self, attempts: int) -> float:
+        """
+        :param attempts: int. The number of failed attempts
+        :return: float. The seconds before the next attempt
+        """
+
+        # Exponential backoff with jitter, so the jobs, which failed together, e.g. when the network was down,
+        # are not retried all at the same moment
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def next_due_in(self) -> Optional[float]:
+        """
+        :return: float. The seconds until the next pending job is due, or None if there are no pending jobs
+        """
+
+        with self._lock:
+            next_attempt_at = self._connection.execute(
+                'SELECT MIN(next_attempt_at) FROM jobs WHERE state = ?', (PENDING,)
+            ).fetchone()[0]
+
+        if next_attempt_at is None:
+            return None
+
+        return max(0.0, next_attempt_at - time.time())
+
+    def counts(self) -> Dict[str, int]:
+        """
+        :return: dict. The number of jobs in every state
+        """
+
+        with self._lock:
+            rows = self._connection.execute('SELECT state, COUNT(*) FROM jobs GROUP BY state').fetchall()
+
+        counts = {state: 0 for state in (PENDING, RUNNING, DONE, FAILED)}
+        counts.update(rows)
+
+        return counts
+
+    def is_finished(self) -> bool:
+        """
+        :return: boolean. True if no job is pending or running
+        """
+
+        counts = self.counts()
+
+        return counts[PENDING] == 0 and counts[RUNNING] == 0
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
@@ -1,11 +1,32 @@
+import configparser
+import heapq
 import sqlite3
 import os
 import json
+import re
+import shutil
+import sys
+import tempfile
+import threading
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import List, Tuple
+from itertools import chain, islice
+from typing import Dict, Iterable, Iterator, List, Optional, TextIO, Tuple, Type
+from urllib.parse import quote
 
-from bookmark import Bookmark
+from bookmark import YOUTUBE_HOSTS, Bookmark, is_youtube_url
+from bookmark_cache import BookmarkCache, get_file_state, select_page, select_rows, sort_rows
+
+
+# Matches everything up to the next bracket outside of a string, and captures the bracket
+STRUCTURAL_TOKEN = re.compile(r'[^"{}\[\]]*(?:"[^"\\]*(?:\\.[^"\\]*)*"[^"{}\[\]]*)*([{}\[\]])', re.DOTALL)
+
+# Matches the start of a Chrome bookmarks folder, as "children" is its first key
+FOLDER_START = re.compile(r'\{\s*"children"\s*:')
+
+# Matches the checksum of the Chrome bookmarks, e.g. "checksum": "0123456789abcdef0123456789abcdef"
+CHECKSUM = re.compile(r'"checksum"\s*:\s*"([0-9a-fA-F]+)"')
 
 
 class BookmarkLoader(ABC):
@@ -26,8 +47,233 @@ class BookmarkLoader(ABC):
 
         pass
 
+    def load_page(self, search: str = '', ascending=False, page_size: int = 100,
+                  after: Optional[object] = None) -> Tuple[List[Bookmark], Optional[object]]:
+        """
+        Loads a single page of bookmarks. The inheritors, which can read a page without reading the bookmarks before
+        it, override it.
+
+        :param search: string, optional. The same as in load_bookmarks
+        :param ascending: boolean, optional. The same as in load_bookmarks
+        :param page_size: integer. The maximum number of bookmarks in the page
+        :param after: optional. The cursor returned with the previous page. If it is not filled, the first page is
+        loaded
+        :return: tuple of the list of Bookmark objects and the cursor of the next page, or None if it is the last page
+        """
+
+        # The cursor is the offset of the page. One more bookmark is loaded to find out if there is a next page
+        start = after or 0
+        bookmarks = self.load_bookmarks(search, ascending, start + page_size + 1)
+
+        return bookmarks[start:start + page_size], start + page_size if len(bookmarks) > start + page_size else None
+
+    def iter_pages(self, search: str = '', ascending=False, page_size: int = 100) -> Iterator[List[Bookmark]]:
+        """
+        :param search: string, optional. The same as in load_bookmarks
+        :param ascending: boolean, optional. The same as in load_bookmarks
+        :param page_size: integer. The maximum number of bookmarks in a page
+        :return: generator of the pages of bookmarks. Every page is loaded when it is requested, so the first one
+        doesn't wait for the rest
+        """
+
+        after = None
+
+        while True:
+            page, after = self.load_page(search, ascending, page_size, after)
+
+            if page:
+                yield page
+
+            if after is None:
+                return
+
+    @classmethod
+    def discover_profiles(cls) -> List[str]:
+        """
+        :return: list of the directories of the browser profiles on this computer, which have a bookmarks file
+        """
+
+        return []
+
+
+def get_home_paths(windows: str, mac: str, linux: Iterable[str]) -> List[str]:
+    """
+    :param windows: str. The path relative to the roaming or the local application data directory on Windows
+    :param mac: str. The path relative to ~/Library/Application Support on macOS
+    :param linux: iterable of str. The paths relative to the home directory on Linux
+    :return: list of the absolute paths for the current platform
+    """
+
+    if sys.platform.startswith('win'):
+        return [os.path.join(os.environ[v], windows) for v in ('APPDATA', 'LOCALAPPDATA') if os.environ.get(v)]
+
+    if sys.platform == 'darwin':
+        return [os.path.expanduser(os.path.join('~/Library/Application Support', mac))]
+
+    return [os.path.expanduser(os.path.join('~', p)) for p in linux]
+
+
+# The reversed hosts, as stored in the indexed moz_places.rev_host column, e.g. 'moc.ebutuoy.www.' for
+# www.youtube.com. All subdomains of a host start with its reversed host
+YOUTUBE_REV_HOSTS = tuple(host[::-1] + '.' for host in YOUTUBE_HOSTS)
+
+
+def get_host_condition(alias: str) -> Tuple[str, list]:
+    """
+    :param alias: str. The alias of the moz_places table in the query
+    :return: tuple of the SQL condition, which matches the YouTube hosts, and its parameters
+    """
+
+    # Filter the hosts by ranges of the indexed rev_host column: the host itself and all of its subdomains are
+    # between 'moc.ebutuoy.' and 'moc.ebutuoy/', as '/' is the character after '.'
+    conditions = []
+    params = []
+
+    for rev_host in YOUTUBE_REV_HOSTS:
+        conditions.append(f'({alias}.rev_host >= ? AND {alias}.rev_host < ?)')
+        params.extend([rev_host, rev_host[:-1] + '/'])
+
+    return f"({' OR '.join(conditions)})", params
+
+
+class PlacesSnapshot:
+    """
+    An in-memory copy of the YouTube bookmarks in a Firefox places.sqlite file. Firefox keeps the file open and locked
+    while it is running, so the file is read once, without taking any locks, and the following searches run in memory.
+    When the file changes, only the bookmarks modified since the last read are copied again.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        # The state of the database and its write-ahead log at the moment of the last copy
+        self.file_state = None
+        # The greatest moz_bookmarks.lastModified at the moment of the last copy
+        self.watermark: Optional[int] = None
+        self.lock = threading.Lock()
+
+        # A short busy timeout, so a locked database falls back to a copy quickly
+        self.connection = sqlite3.connect('file::memory:', uri=True, check_same_thread=False, timeout=0.5)
+        self.connection.executescript("""
+            CREATE TABLE moz_places (id INTEGER PRIMARY KEY, url TEXT, rev_host TEXT);
+            CREATE TABLE moz_bookmarks (
+                id INTEGER PRIMARY KEY, fk INTEGER, title TEXT, dateAdded INTEGER, lastModified INTEGER
+            );
+            CREATE INDEX moz_places_hostindex ON moz_places (rev_host);
+            CREATE INDEX moz_bookmarks_itemindex ON moz_bookmarks (fk);
+            CREATE INDEX moz_bookmarks_dateaddedindex ON moz_bookmarks (dateAdded);
+        """)
+
+    @staticmethod
+    def get_file_state(db_path: str) -> tuple:
+        """
+        :param db_path: str. The path to the places.sqlite file
+        :return: tuple of the modification times and sizes of the database and its write-ahead log
+        """
+
+        return get_file_state(db_path), get_file_state(db_path + '-wal')
+
+    def is_stale(self) -> bool:
+        return self.get_file_state(self.db_path) != self.file_state
+
+    def update(self):
+        """
+        Reads the file, unless it didn't change since the last read. The snapshots of different files are read at
+        the same time, while the readers of the same one wait for it.
+
+        :return: None
+        """
+
+        with self.lock:
+            # Read by another loader in the meantime
+            if self.file_state is not None and not self.is_stale():
+                return
+
+            self._refresh()
+
+    def refresh(self):
+        with self.lock:
+            self._refresh()
+
+    def _refresh(self):
+        # Take the state before reading, so changes made during the read are picked up by the next refresh
+        file_state = self.get_file_state(self.db_path)
+
+        try:
+            # Read-only mode doesn't block Firefox, and sees the latest changes in the write-ahead log
+            self._copy(f'file:{quote(self.db_path)}?mode=ro')
+        except sqlite3.OperationalError:
+            # Firefox holds an exclusive lock, so copy the files and read the copy instead
+            with tempfile.TemporaryDirectory() as directory:
+                copy_path = os.path.join(directory, 'places.sqlite')
+                shutil.copyfile(self.db_path, copy_path)
+
+                if os.path.exists(self.db_path + '-wal'):
+                    shutil.copyfile(self.db_path + '-wal', copy_path + '-wal')
+
+                self._copy(f'file:{quote(copy_path)}')
+
+        self.file_state = file_state
+
+    def _copy(self, source_uri: str):
+        # Copy only the YouTube places and the bookmarks pointing to them
+        host_condition, params = get_host_condition('mp')
+
+        self.connection.execute('ATTACH DATABASE ? AS source', (source_uri,))
+
+        try:
+            with self.connection:
+                watermark = self.connection.execute('SELECT MAX(lastModified) FROM source.moz_bookmarks').fetchone()[0]
+
+                if self.watermark is None:
+                    # The first read copies all bookmarks
+                    self.connection.execute('DELETE FROM moz_bookmarks')
+                    self.connection.execute('DELETE FROM moz_places')
+                    self.connection.execute(
+                        f'INSERT INTO moz_places SELECT mp.id, mp.url, mp.rev_host FROM source.moz_places AS mp '
+                        f'WHERE {host_condition}',
+                        params
+                    )
+                    modified_condition, modified_params = '', ()
+                else:
+                    # Drop the bookmarks, which were deleted or modified since the last read
+                    self.connection.execute("""
+                        DELETE FROM moz_bookmarks
+                        WHERE id NOT IN (SELECT id FROM source.moz_bookmarks)
+                        OR id IN (SELECT id FROM source.moz_bookmarks WHERE lastModified > ?)
+                    """, (self.watermark,))
+                    # Add the places of the modified bookmarks
+                    self.connection.execute(
+                        f'INSERT OR REPLACE INTO moz_places SELECT mp.id, mp.url, mp.rev_host FROM source.moz_places '
+                        f'AS mp WHERE {host_condition} AND mp.id IN '
+                        f'(SELECT fk FROM source.moz_bookmarks WHERE lastModified > ?)',
+                        (*params, self.watermark)
+                    )
+                    modified_condition, modified_params = 'AND mb.lastModified > ?', (self.watermark,)
+
+                self.connection.execute(f"""
+                    INSERT INTO moz_bookmarks
+                    SELECT mb.id, mb.fk, mb.title, mb.dateAdded, mb.lastModified
+                    FROM source.moz_bookmarks AS mb
+                    WHERE mb.fk IN (SELECT id FROM moz_places) {modified_condition}
+                """, modified_params)
+
+                self.watermark = watermark or 0
+        finally:
+            self.connection.execute('DETACH DATABASE source')
+
 
 class FirefoxLoader(BookmarkLoader):
+    # The directories with the profiles.ini file of Firefox
+    profile_roots = get_home_paths(
+        'Mozilla/Firefox', 'Firefox', ['.mozilla/firefox', 'snap/firefox/common/.mozilla/firefox']
+    )
+    # The number of rows fetched from the database at once
+    fetch_size = 500
+    # If it is True, the bookmarks are read from an in-memory snapshot of places.sqlite
+    use_snapshot = True
+    # The snapshots by database path. They are shared by all loaders, as a new loader is created for every search
+    _snapshots: Dict[str, PlacesSnapshot] = {}
+    _snapshots_lock = threading.Lock()
 
     def load_bookmarks(self, search: str = '', ascending=False, limit: int = None) -> List[Bookmark]:
         """
@@ -39,25 +285,140 @@ class FirefoxLoader(BookmarkLoader):
         :return: list of Bookmark objects
         """
 
+        return list(self.iter_bookmarks(search, ascending, limit))
+
+    def iter_bookmarks(self, search: str = '', ascending=False, limit: int = None,
+                       after: Optional[Tuple[int, int]] = None) -> Iterator[Bookmark]:
+        """
+        Yields the bookmarks one by one, as they are read from the database.
+
+        :param search: string, optional. The same as in load_bookmarks
+        :param ascending: boolean, optional. The same as in load_bookmarks
+        :param limit: integer, optional. The same as in load_bookmarks
+        :param after: tuple, optional. The cursor returned by load_page. Only the bookmarks after it are yielded
+        :return: generator of Bookmark objects
+        """
+
+        for title, url, date_added, _ in self._iter_rows(search, ascending, limit, after):
+            yield Bookmark.from_raw(title, url, date_added, self._convert_date)
+
+    def load_page(self, search: str = '', ascending=False, page_size: int = 100,
+                  after: Optional[Tuple[int, int]] = None) -> Tuple[List[Bookmark], Optional[Tuple[int, int]]]:
+        """
+        Loads a single page of bookmarks. The pages are found by the date the bookmarks were added (keyset
+        pagination), so loading a page doesn't read the pages before it.
+
+        :param search: string, optional. The same as in load_bookmarks
+        :param ascending: boolean, optional. The same as in load_bookmarks
+        :param page_size: integer. The maximum number of bookmarks in the page
+        :param after: tuple, optional. The cursor of the previous page. If it is not filled, the first page is loaded
+        :return: tuple of the list of Bookmark objects and the cursor of the next page, or None if it is the last page
+        """
+
+        bookmarks = []
+        cursor = None
+
+        for title, url, date_added, bookmark_id in self._iter_rows(search, ascending, page_size, after):
+            bookmarks.append(Bookmark.from_raw(title, url, date_added, self._convert_date))
+            cursor = (date_added, bookmark_id)
+
+        # A page shorter than the page size is the last one
+        if len(bookmarks) < page_size:
+            cursor = None
+
+        return bookmarks, cursor
+
+    @classmethod
+    def discover_profiles(cls) -> List[str]:
+        """
+        Reads the profiles from the profiles.ini files of Firefox.
+
+        :return: list of the directories of the Firefox profiles, which have a places.sqlite file
+        """
+
+        profiles = []
+
+        for root in cls.profile_roots:
+            parser = configparser.ConfigParser(interpolation=None)
+
+            if not parser.read(os.path.join(root, 'profiles.ini'), encoding='utf-8'):
+                continue
+
+            for section in parser.sections():
+                path = parser.get(section, 'Path', fallback=None)
+
+                # The other sections are the installations and the general settings
+                if not section.startswith('Profile') or not path:
+                    continue
+
+                if parser.get(section, 'IsRelative', fallback='1') == '1':
+                    path = os.path.join(root, path)
+
+                path = os.path.normpath(path)
+
+                if path not in profiles and os.path.isfile(os.path.join(path, 'places.sqlite')):
+                    profiles.append(path)
+
+        return profiles
+
+    def get_snapshot(self) -> PlacesSnapshot:
+        """
+        :return: PlacesSnapshot. The snapshot of the places.sqlite file, which is refreshed only if the file or its
+        write-ahead log changed since the last read
+        """
+
+        db_path = self._get_db_path()
+
+        # The lock of all snapshots guards only the dictionary, so the profiles are read at the same time
+        with self._snapshots_lock:
+            snapshot = self._snapshots.get(db_path)
+
+            if snapshot is None:
+                snapshot = PlacesSnapshot(db_path)
+                self._snapshots[db_path] = snapshot
+
+        snapshot.update()
+
+        return snapshot
+
+    def _get_db_path(self) -> str:
         firefox_profile_dir = os.path.expanduser(self.path_to_bookmarks)
         # Path to the bookmarks SQLite database file
-        bookmarks_db_path = os.path.join(firefox_profile_dir, 'places.sqlite')
+        return os.path.join(firefox_profile_dir, 'places.sqlite')
+
+    def _iter_rows(self, search: str, ascending: bool, limit: Optional[int],
+                   after: Optional[Tuple[int, int]]) -> Iterator[tuple]:
+        query, params = self._get_query(search, ascending, limit, after)
+
+        if self.use_snapshot:
+            snapshot = self.get_snapshot()
+
+            # The snapshot is in memory, so all rows are fetched at once, and the connection is released immediately
+            with snapshot.lock:
+                rows = snapshot.connection.execute(query, params).fetchall()
+
+            yield from rows
+            return
 
         # Connect to the SQLite database
-        connection = sqlite3.connect(bookmarks_db_path)
-        cursor = connection.cursor()
+        connection = sqlite3.connect(self._get_db_path())
 
-        # Query the bookmarks
-        query, params = self._get_query(search, ascending, limit)
-        cursor.execute(query, params)
-        bookmarks_data = cursor.fetchall()
+        try:
+            cursor = connection.cursor()
 
-        # Load the bookmarks as list of Bookmark objects
-        bookmarks = [Bookmark(title, url, self._convert_date(date_added)) for title, url, date_added in bookmarks_data]
+            # Query the bookmarks
+            cursor.execute(query, params)
 
-        connection.close()
+            # Stream the rows instead of loading all of them in memory
+            while True:
+                rows = cursor.fetchmany(self.fetch_size)
 
-        return bookmarks
+                if not rows:
+                    break
+
+                yield from rows
+        finally:
+            connection.close()
 
     @staticmethod
     def _convert_date(epoch_time: int) -> datetime:
@@ -68,16 +429,37 @@ class FirefoxLoader(BookmarkLoader):
         return datetime(1970, 1, 1) + timedelta(microseconds=epoch_time)
 
     @staticmethod
-    def _get_query(search: str, ascending: bool, limit: int) -> Tuple[str, tuple]:
-        # Prepare the search pattern with wildcards
-        search_pattern = f'%{search.lower()}%' if search else '%'
-
-        # Create the base query
+    def _get_query(search: str, ascending: bool, limit: Optional[int],
+                   after: Optional[Tuple[int, int]] = None) -> Tuple[str, tuple]:
+        host_condition, params = get_host_condition('mp')
+
+        # Bookmarks without a title are skipped, as before
+        conditions = [host_condition, 'mb.title IS NOT NULL']
+
+        if search:
+            # LIKE is case insensitive in SQLite. Escape the wildcards, so they are searched literally
+            escaped = search.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            conditions.append("mb.title LIKE ? ESCAPE '\\'")
+            params.append(f'%{escaped}%')
+
+        # Continue after the last bookmark of the previous page. The id breaks the ties between equal dates
+        if after is not None:
+            date_added, bookmark_id = after
+            operator = '>' if ascending else '<'
+            conditions.append(
+                f'(mb.dateAdded {operator} ? OR (mb.dateAdded = ? AND mb.id {operator} ?))'
+            )
+            params.extend([date_added, date_added, bookmark_id])
+
+        order = 'ASC' if ascending else 'DESC'
+
+        # Create the query
         query = f"""
         SELECT
             mb.title,
             mp.url,
-            mb.dateAdded
+            mb.dateAdded,
+            mb.id
         FROM
             moz_bookmarks AS mb
         JOIN
@@ -85,21 +467,31 @@ class FirefoxLoader(BookmarkLoader):
         ON 
             mb.fk = mp.id
         WHERE
-            LOWER(mp.url) LIKE '%youtube.com%'
-            AND LOWER(mb.title) LIKE ?
+            {' AND '.join(conditions)}
         ORDER BY
-            mb.dateAdded {'ASC' if ascending else 'DESC'}
-        {f'LIMIT {limit}' if limit else ''}
+            mb.dateAdded {order},
+            mb.id {order}
+        {'LIMIT ?' if limit else ''}
         ;
         """
 
-        return query, (search_pattern,)
+        if limit:
+            params.append(limit)
+
+        return query, tuple(params)
 
     def __str__(self):
         return 'Mozilla Firefox'
 
 
 class ChromeLoader(BookmarkLoader):
+    # The user data directories of the browser, with the Local State file and a directory for every profile
+    user_data_roots = get_home_paths('Google/Chrome/User Data', 'Google/Chrome', ['.config/google-chrome'])
+    # If it is True, the parsed bookmarks are kept in memory and the file is read again only if it changed
+    use_cache = True
+    # The caches by file path. They are shared by all loaders, as a new loader is created for every search
+    _caches: Dict[str, BookmarkCache] = {}
+    _caches_lock = threading.Lock()
 
     def load_bookmarks(self, search: str = '', ascending=False, limit: int = None) -> List[Bookmark]:
         """
@@ -114,23 +506,112 @@ class ChromeLoader(BookmarkLoader):
         # The path to the bookmarks file
         path_to_bookmarks = os.path.join(self.path_to_bookmarks, 'Bookmarks')
 
-        # Load the bookmarks data as a dictionary
-        with open(path_to_bookmarks, encoding='utf-8') as file:
-            data = json.load(file)
+        # Answer from the parsed bookmarks, unless the file changed since the last time
+        if self.use_cache:
+            cache = self.get_cache(path_to_bookmarks)
 
-        bookmarks = []
+            with cache.lock:
+                self._refresh_cache(cache, path_to_bookmarks)
+                return cache.select(search, ascending, limit, self._convert_date)
 
-        # Extract the bookmarks from the dictionary as a list of Bookmark objects
-        bookmarks = self._walk_json(bookmarks, data['roots'], search)
+        # The raw (date_added, title, url) tuples of the matching bookmarks
+        rows = (row for _, row in self._iter_rows(path_to_bookmarks, search))
+        rows = select_rows(rows, '', ascending, limit)
 
-        # Sort the bookmarks by time created
-        bookmarks = sorted(bookmarks, key=lambda x: x.time_created, reverse=not ascending)
+        # Create the Bookmark objects only for the returned bookmarks. Their dates are converted on first access
+        return [Bookmark.from_raw(title, url, date_added, self._convert_date) for date_added, title, url in rows]
 
-        # Apply the limit if there is such
-        if limit:
-            bookmarks = bookmarks[:limit]
+    def load_page(self, search: str = '', ascending=False, page_size: int = 100,
+                  after: Optional[Tuple[int, str]] = None) -> Tuple[List[Bookmark], Optional[Tuple[int, str]]]:
+        """
+        Loads a single page of bookmarks. The pages are found by the date the bookmarks were added and their node
+        ids, so a page is found by a binary search in the sorted bookmarks, and only its Bookmark objects are created.
+
+        :param search: string, optional. The same as in load_bookmarks
+        :param ascending: boolean, optional. The same as in load_bookmarks
+        :param page_size: integer. The maximum number of bookmarks in the page
+        :param after: tuple, optional. The cursor of the previous page. If it is not filled, the first page is loaded
+        :return: tuple of the list of Bookmark objects and the cursor of the next page, or None if it is the last page
+        """
+
+        path_to_bookmarks = os.path.join(self.path_to_bookmarks, 'Bookmarks')
+
+        if self.use_cache:
+            cache = self.get_cache(path_to_bookmarks)
+
+            with cache.lock:
+                self._refresh_cache(cache, path_to_bookmarks)
+                return cache.select_page(search, ascending, page_size, after, self._convert_date)
+
+        rows, cursor = select_page(
+            *sort_rows(dict(self._iter_rows(path_to_bookmarks, ''))), search, ascending, page_size, after
+        )
+        bookmarks = [Bookmark.from_raw(title, url, date_added, self._convert_date) for date_added, title, url in rows]
+
+        return bookmarks, cursor
+
+    @classmethod
+    def discover_profiles(cls) -> List[str]:
+        """
+        Reads the profiles from the Local State files of the browser. If a Local State file can't be read, the
+        profile directories are found by their names, 'Default' and 'Profile 1', 'Profile 2' etc.
+
+        :return: list of the directories of the profiles, which have a Bookmarks file
+        """
+
+        profiles = []
+
+        for root in cls.user_data_roots:
+            try:
+                with open(os.path.join(root, 'Local State'), encoding='utf-8') as file:
+                    names = list(json.load(file).get('profile', {}).get('info_cache', {}))
+            except (OSError, ValueError, AttributeError):
+                names = []
+
+            if not names and os.path.isdir(root):
+                names = sorted(n for n in os.listdir(root) if n == 'Default' or n.startswith('Profile '))
+
+            for name in names:
+                path = os.path.join(root, name)
+
+                if path not in profiles and os.path.isfile(os.path.join(path, 'Bookmarks')):
+                    profiles.append(path)
 
-        return bookmarks
+        return profiles
+
+    def get_cache(self, path_to_bookmarks: str) -> BookmarkCache:
+        with self._caches_lock:
+            return self._caches.setdefault(path_to_bookmarks, BookmarkCache())
+
+    def _refresh_cache(self, cache: BookmarkCache, path_to_bookmarks: str):
+        # Take the state before reading, so changes made during the read are picked up by the next refresh
+        file_state = get_file_state(path_to_bookmarks)
+
+        if file_state is not None and file_state == cache.file_state:
+            return
+
+        # Chrome rewrites the whole file on every change, and writes the checksum of the bookmarks at its beginning.
+        # If the checksum is the same, the file was rewritten without changes
+        checksum = self._read_checksum(path_to_bookmarks)
+
+        if checksum is not None and checksum == cache.content_hash:
+            cache.file_state = file_state
+            return
+
+        # The file is rewritten as a whole, so it is read again, and the cached rows are replaced by node id
+        cache.update(file_state, checksum, dict(self._iter_rows(path_to_bookmarks, '')))
+
+    @staticmethod
+    def _read_checksum(path_to_bookmarks: str) -> Optional[str]:
+        """
+        :param path_to_bookmarks: str. The path to the Chrome Bookmarks file
+        :return: str. The checksum, as written by Chrome, or None if it is not at the beginning of the file
+        """
+
+        with open(path_to_bookmarks, encoding='utf-8') as file:
+            match = CHECKSUM.search(file.read(4096))
+
+        return match.group(1) if match else None
 
     @staticmethod
     def _convert_date(chrome_time) -> datetime:
@@ -141,45 +622,223 @@ class ChromeLoader(BookmarkLoader):
 
         return datetime(1601, 1, 1) + timedelta(microseconds=chrome_time)
 
-    def _walk_json(self, bookmarks: List[Bookmark], dictionary: dict, search: str) -> List[Bookmark]:
+    @classmethod
+    def _iter_rows(cls, path_to_bookmarks: str, search: str) -> Iterator[Tuple[str, Tuple[int, str, str]]]:
         """
-        :param bookmarks: List of Bookmark objects. Empty
-        :param dictionary: dict. All bookmarks and folders in the Chrome bookmarks
+        :param path_to_bookmarks: str. The path to the Chrome Bookmarks file
         :param search: str. Search by a keyword. If not filled, all YouTube bookmarks are returned
-        :return: list of Bookmark objects
+        :return: generator of the node ids and (date_added, title, url) tuples of the YouTube bookmarks, in the order
+        of the file
         """
-        # Iterate through the data
-        for key, value in dictionary.items():
-            if key in ['bookmark_bar', 'other', 'synced']:  # The three main folders in the Chrome bookmarks
-                bookmarks = self._walk_json(bookmarks, value, search)
 
-            elif key == 'children':  # If it is a list, iterate through its elements
-                for child in value:
-                    if child['type'] == 'folder':  # If the child is a folder, call the method recursively
-                        bookmarks = self._walk_json(bookmarks, child, search)
-                    elif child['type'] == 'url':  # If the child is an url, take its data
-                        title = child['name']
-                        url = child['url']
-                        time_created = int(child['date_added'])
-                        time_created = self._convert_date(time_created)
+        search = search.lower()
 
-                        if 'youtube.com' not in url.lower():  # If the bookmark does not lead to YouTube
-                            continue
+        with open(path_to_bookmarks, encoding='utf-8') as file:
+            for node in cls._iter_url_nodes(file):
+                url = node.get('url', '')
+                # If the bookmark does not lead to YouTube. Only the urls, which contain a YouTube host, are matched
+                if 'youtu' not in url.lower() or not is_youtube_url(url):
+                    continue
 
-                        # Case insensitively search for a keyword. Allways true if the keyword is an empty string
-                        if search.lower() not in title.lower():
-                            continue
+                title = node.get('name', '')
+                # Case insensitively search for a keyword. Allways true if the keyword is an empty string
+                if search not in title.lower():
+                    continue
 
-                        # Create the Bookmark object and append it to the list
-                        bookmark = Bookmark(title, url, time_created)
-                        bookmarks.append(bookmark)
+                # Keep the raw date, it is converted only if the bookmark is returned
+                yield node.get('id'), (int(node['date_added']), title, url)
 
-        return bookmarks
+    @staticmethod
+    def _iter_url_nodes(file: TextIO, chunk_size: int = 1 << 20) -> Iterator[dict]:
+        """
+        Reads the file in chunks and yields the url nodes one by one, so neither the whole file nor the whole tree
+        is kept in memory. The folders are walked by their brackets, while every url node is decoded on its own.
+
+        :param file: The opened Bookmarks file
+        :param chunk_size: int. The number of characters read at once
+        :return: generator of dict
+        """
+
+        decoder = json.JSONDecoder()
+        # The brackets of the folders and the other objects, which are open at the current position
+        stack = []
+        text = ''
+        position = 0
+        end_of_file = False
+
+        while True:
+            # Scan up to the next bracket outside of a string. A match fails at an unfinished string at the end of
+            # the text, which is scanned again with more text
+            match = STRUCTURAL_TOKEN.match(text, position)
+
+            if match is not None:
+                bracket = match.group(1)
+                index = match.end() - 1
+
+                # An object in an array is either a url node or a folder
+                if bracket == '{' and stack and stack[-1] == '[':
+                    folder_start = FOLDER_START.match(text, index)
+
+                    if folder_start is not None:
+                        # A folder, walk into its "children" array
+                        stack.append(bracket)
+                        position = match.end()
+                        continue
+
+                    try:
+                        node, position = decoder.raw_decode(text, index)
+                    except json.JSONDecodeError:
+                        # The node is not read completely yet
+                        if end_of_file:
+                            raise
+                        match = None
+                    else:
+                        # A folder, which doesn't start with its "children", is walked in memory
+                        nodes = [node]
+                        while nodes:
+                            node = nodes.pop()
+                            if node.get('type') == 'url':
+                                yield node
+                            nodes.extend(reversed(node.get('children', [])))
+                        continue
+
+                elif bracket in '{[':
+                    stack.append(bracket)
+                    position = match.end()
+                    continue
+                else:
+                    stack.pop()
+                    position = match.end()
+                    continue
+
+            if end_of_file:
+                break
+
+            # Drop the scanned text and read more
+            chunk = file.read(chunk_size)
+            end_of_file = not chunk
+            text = text[position:] + chunk
+            position = 0
 
     def __str__(self):
         return 'Google Chrome'
 
 
+# The browsers based on Chromium keep the bookmarks in the same format as Chrome, in their own user data directories
+class ChromiumLoader(ChromeLoader):
+    user_data_roots = get_home_paths(
+        'Chromium/User Data', 'Chromium', ['.config/chromium', 'snap/chromium/common/chromium']
+    )
+
+    def __str__(self):
+        return 'Chromium'
+
+
+class EdgeLoader(ChromeLoader):
+    user_data_roots = get_home_paths('Microsoft/Edge/User Data', 'Microsoft Edge', ['.config/microsoft-edge'])
+
+    def __str__(self):
+        return 'Microsoft Edge'
+
+
+class BraveLoader(ChromeLoader):
+    user_data_roots = get_home_paths(
+        'BraveSoftware/Brave-Browser/User Data', 'BraveSoftware/Brave-Browser', ['.config/BraveSoftware/Brave-Browser']
+    )
+
+    def __str__(self):
+        return 'Brave'
+
+
+class MultiProfileLoader(BookmarkLoader):
+    """
+    Loads the bookmarks of several browser profiles concurrently, and merges them into a single timeline.
+    """
+
+    def __init__(self, loaders: List[BookmarkLoader]):
+        """
+        :param loaders: list of BookmarkLoader objects, each one with the path to a profile
+        """
+
+        super().__init__()
+        self.loaders = loaders
+        # The directories of all profiles, separated as in the PATH variable
+        self.path_to_bookmarks = os.pathsep.join(loader.path_to_bookmarks for loader in loaders)
+
+    @classmethod
+    def discover(cls, loader_classes: Iterable[Type[BookmarkLoader]]) -> 'MultiProfileLoader':
+        """
+        :param loader_classes: iterable of the inheritors of BookmarkLoader, whose profiles are loaded
+        :return: MultiProfileLoader of all profiles of the browsers, which are found on this computer
+        """
+
+        loaders = []
+
+        for loader_class in loader_classes:
+            for path in loader_class.discover_profiles():
+                loader = loader_class()
+                loader.path_to_bookmarks = path
+                loaders.append(loader)
+
+        return cls(loaders)
+
+    def load_bookmarks(self, search: str = '', ascending=False, limit: int = None) -> List[Bookmark]:
+        """
+        :param search: string, optional. The same as in BookmarkLoader.load_bookmarks
+        :param ascending: boolean, optional. The same as in BookmarkLoader.load_bookmarks
+        :param limit: integer, optional. The same as in BookmarkLoader.load_bookmarks. Every profile returns at most
+        as many bookmarks, as only its first ones can be in the merged result
+        :return: list of Bookmark objects of all profiles, ordered by creation date
+        """
+
+        if not self.loaders:
+            return []
+
+        # Every profile is a separate file, so they are read at the same time
+        with ThreadPoolExecutor(max_workers=len(self.loaders)) as executor:
+            results = list(executor.map(lambda loader: loader.load_bookmarks(search, ascending, limit), self.loaders))
+
+        # The results are already sorted, so they are merged without sorting them again
+        merged = heapq.merge(*results, key=lambda bookmark: bookmark.time_created, reverse=not ascending)
+
+        return list(islice(merged, limit)) if limit else list(merged)
+
+    def iter_pages(self, search: str = '', ascending=False, page_size: int = 100) -> Iterator[List[Bookmark]]:
+        """
+        Merges the pages of all profiles. A profile loads its next page only when the merge reaches its end.
+
+        :param search: string, optional. The same as in BookmarkLoader.load_bookmarks
+        :param ascending: boolean, optional. The same as in BookmarkLoader.load_bookmarks
+        :param page_size: integer. The maximum number of bookmarks in a page
+        :return: generator of the pages of bookmarks of all profiles, ordered by creation date
+        """
+
+        if not self.loaders:
+            return
+
+        page_iterators = [loader.iter_pages(search, ascending, page_size) for loader in self.loaders]
+
+        # The first pages of the profiles are read at the same time, as every profile is a separate file
+        with ThreadPoolExecutor(max_workers=len(self.loaders)) as executor:
+            first_pages = list(executor.map(lambda pages: next(pages, []), page_iterators))
+
+        streams = [
+            chain(first_page, chain.from_iterable(pages)) for first_page, pages in zip(first_pages, page_iterators)
+        ]
+        merged = heapq.merge(*streams, key=lambda bookmark: bookmark.time_created, reverse=not ascending)
+
+        while True:
+            page = list(islice(merged, page_size))
+
+            if not page:
+                return
+
+            yield page
+
+    def __str__(self):
+        return ', '.join(sorted({str(loader) for loader in self.loaders})) or 'browser'
+
+
 # Test code
 if __name__ == '__main__':
     loader = FirefoxLoader()
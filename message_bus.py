@@ -0,0 +1,205 @@
+import queue
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Iterable, Optional, Tuple
+
+
+class ProgressEvent:
+    """
+    The progress of a single download in one of its stages, as reported by the yt_dlp progress and postprocessor hooks
+    or by the CPU stage of the pipeline.
+    """
+
+    def __init__(self, key: str, stage: str, status: str, title: Optional[str] = None,
+                 downloaded_bytes: Optional[int] = None, total_bytes: Optional[int] = None,
+                 speed: Optional[float] = None, eta: Optional[float] = None):
+        """
+        :param key: str. Identifies the download, e.g. the url of the video
+        :param stage: str. 'download', 'postprocess' or 'transcode'
+        :param status: str. 'started', 'downloading', 'finished' or 'error'
+        :param title: str, optional. The title of the video
+        :param downloaded_bytes: int, optional
+        :param total_bytes: int, optional. Exact or estimated
+        :param speed: float, optional. Bytes per second
+        :param eta: float, optional. Seconds until the stage is finished
+        """
+
+        self.key = key
+        self.stage = stage
+        self.status = status
+        self.title = title
+        self.downloaded_bytes = downloaded_bytes
+        self.total_bytes = total_bytes
+        self.speed = speed
+        self.eta = eta
+
+    @classmethod
+    def from_progress_hook(cls, key: str, data: dict) -> 'ProgressEvent':
+        """
+        :param key: str. Identifies the download
+        :param data: dict. The argument of a yt_dlp progress hook
+        :return: ProgressEvent
+        """
+
+        info_dict = data.get('info_dict') or {}
+
+        return cls(
+            key,
+            'download',
+            data.get('status', 'downloading'),
+            title=info_dict.get('title'),
+            downloaded_bytes=data.get('downloaded_bytes'),
+            total_bytes=data.get('total_bytes') or data.get('total_bytes_estimate'),
+            speed=data.get('speed'),
+            eta=data.get('eta'),
+        )
+
+    @classmethod
+    def from_postprocessor_hook(cls, key: str, data: dict) -> 'ProgressEvent':
+        """
+        :param key: str. Identifies the download
+        :param data: dict. The argument of a yt_dlp postprocessor hook
+        :return: ProgressEvent
+        """
+
+        info_dict = data.get('info_dict') or {}
+
+        return cls(key, 'postprocess', data.get('status', 'started'), title=info_dict.get('title'))
+
+    @property
+    def percent(self) -> Optional[float]:
+        if not self.total_bytes or self.downloaded_bytes is None:
+            return None
+
+        return 100 * self.downloaded_bytes / self.total_bytes
+
+    @property
+    def is_final(self) -> bool:
+        return self.status in ('finished', 'error')
+
+    def __str__(self):
+        text = f'{self.title or self.key}: {self.stage} {self.status}'
+
+        if self.percent is not None:
+            text += f' {self.percent:.0f}%'
+        if self.speed:
+            text += f' {self.speed / 2 ** 20:.1f} MiB/s'
+        if self.eta is not None:
+            text += f' ETA {self.eta:.0f}s'
+
+        return text
+
+
+class MessageBus:
+    """
+    Carries the messages and the progress events of the downloads from the worker threads to the Tk main loop,
+    which drains them in batches.
+    """
+
+    def __init__(self, channel=None, progress_interval: float = 0.5):
+        """
+        :param channel: optional. The underlying queue. Defaults to a queue.Queue, which is shared between threads.
+        To post from other processes, pass a queue of a multiprocessing.Manager
+        :param progress_interval: float. The minimum number of seconds between two progress events of the same
+        download. The events which change the status are always posted
+        """
+
+        self._channel = channel if channel is not None else queue.Queue()
+        self.progress_interval = progress_interval
+
+    def post(self, message):
+        """
+        :param message: Any picklable object, e.g. a str, a DownloadResult or a ProgressEvent
+        :return: None
+        """
+
+        self._channel.put(message)
+
+    def progress_hook(self, key: str) -> Callable[[dict], None]:
+        """
+        :param key: str. Identifies the download, e.g. the url of the video
+        :return: function to pass in the 'progress_hooks' option of yt_dlp
+        """
+
+        # yt_dlp calls the hook many times per second, so only the status changes and one event per interval are posted
+        last = {'status': None, 'posted_at': 0.0}
+
+        def hook(data: dict):
+            now = time.monotonic()
+            status = data.get('status')
+
+            if status == last['status'] and now - last['posted_at'] < self.progress_interval:
+                return
+
+            last['status'] = status
+            last['posted_at'] = now
+            self.post(ProgressEvent.from_progress_hook(key, data))
+
+        return hook
+
+    def postprocessor_hook(self, key: str) -> Callable[[dict], None]:
+        """
+        :param key: str. Identifies the download, e.g. the url of the video
+        :return: function to pass in the 'postprocessor_hooks' option of yt_dlp
+        """
+
+        return lambda data: self.post(ProgressEvent.from_postprocessor_hook(key, data))
+
+    def drain(self, max_messages: int = 1000) -> Tuple[list, Dict[str, ProgressEvent]]:
+        """
+        Takes the waiting messages without blocking. Called from the Tk main loop.
+
+        :param max_messages: int. The maximum number of messages taken at once, so the main loop is not blocked by
+        a flood of them. The rest are taken on the next call
+        :return: tuple of the other messages in the order they were posted, and the latest progress event of every
+        download, by key
+        """
+
+        messages = []
+        progress: Dict[str, ProgressEvent] = {}
+
+        for _ in range(max_messages):
+            try:
+                message = self._channel.get_nowait()
+            except queue.Empty:
+                break
+
+            # Coalesce the progress events, so only the latest one of every download is shown
+            if isinstance(message, ProgressEvent):
+                progress[message.key] = message
+            else:
+                messages.append(message)
+
+        return messages, progress
+
+
+class MessageLog:
+    """
+    A ring buffer of the last messages shown to the user.
+    """
+
+    def __init__(self, max_lines: int = 500):
+        """
+        :param max_lines: int. The maximum number of kept messages. The oldest ones are dropped first
+        """
+
+        self.max_lines = max_lines
+        self.lines: Deque[str] = deque(maxlen=max_lines)
+
+    def extend(self, messages: Iterable[str]) -> int:
+        """
+        :param messages: iterable of str
+        :return: int. The number of dropped messages
+        """
+
+        before = len(self.lines)
+        messages = list(messages)
+        self.lines.extend(messages)
+
+        return before + len(messages) - len(self.lines)
+
+    def __len__(self):
+        return len(self.lines)
+
+    def __iter__(self):
+        return iter(self.lines)
@@ -0,0 +1,122 @@
+import json
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+
+class MetadataCache:
+    def __init__(self, path='metadata_cache.sqlite', ttl: float = 5 * 60 * 60, max_entries: int = 5000):
+        """
+        :param path: str. The path to the SQLite database file
+        :param ttl: float. The number of seconds an entry is valid. The format urls of YouTube expire after about six
+        hours, so the default is lower than that
+        :param max_entries: int. The maximum number of entries. The least recently used ones are evicted first
+        """
+
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+
+        # The cache is shared between the download threads, which are serialized by the lock
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS metadata (
+                video_id TEXT PRIMARY KEY,
+                info TEXT NOT NULL,
+                formats TEXT,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self._connection.execute('CREATE INDEX IF NOT EXISTS metadata_last_used ON metadata (last_used)')
+        self._connection.commit()
+
+    def get(self, video_id: str) -> Optional[dict]:
+        """
+        :param video_id: str. The id of the YouTube video
+        :return: dict. The cached info dictionary, or None if it is not cached or it has expired
+        """
+
+        now = time.time()
+
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT info, created_at FROM metadata WHERE video_id = ?', (video_id,)
+            ).fetchone()
+
+            if row is None:
+                return None
+
+            info, created_at = row
+
+            # Remove the expired entry, so it is extracted again
+            if now - created_at > self.ttl:
+                self._connection.execute('DELETE FROM metadata WHERE video_id = ?', (video_id,))
+                self._connection.commit()
+                return None
+
+            self._connection.execute('UPDATE metadata SET last_used = ? WHERE video_id = ?', (now, video_id))
+            self._connection.commit()
+
+        return json.loads(info)
+
+    def put(self, video_id: str, info: dict):
+        """
+        :param video_id: str. The id of the YouTube video
+        :param info: dict. A JSON serializable info dictionary, as returned by YoutubeDL.sanitize_info
+        :return: None
+        """
+
+        now = time.time()
+        # The ids of the formats chosen by yt_dlp, e.g. '313+251'
+        formats = info.get('format_id')
+
+        with self._lock:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO metadata (video_id, info, formats, created_at, last_used) VALUES (?, ?, ?, ?, ?)',
+                (video_id, json.dumps(info), formats, now, now)
+            )
+            self._evict()
+            self._connection.commit()
+
+    def get_formats(self, video_id: str) -> Optional[str]:
+        """
+        :param video_id: str. The id of the YouTube video
+        :return: str. The ids of the formats chosen when the entry was cached, or None if it is not cached
+        """
+
+        with self._lock:
+            row = self._connection.execute('SELECT formats FROM metadata WHERE video_id = ?', (video_id,)).fetchone()
+
+        return row[0] if row else None
+
+    def delete(self, video_id: str):
+        with self._lock:
+            self._connection.execute('DELETE FROM metadata WHERE video_id = ?', (video_id,))
+            self._connection.commit()
+
+    def __contains__(self, video_id: str) -> bool:
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT 1 FROM metadata WHERE video_id = ? AND created_at >= ?', (video_id, time.time() - self.ttl)
+            ).fetchone()
+
+        return row is not None
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute('SELECT COUNT(*) FROM metadata').fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def _evict(self):
+        # Remove the expired entries first, and then the least recently used ones above the limit
+        self._connection.execute('DELETE FROM metadata WHERE created_at < ?', (time.time() - self.ttl,))
+        self._connection.execute("""
+            DELETE FROM metadata WHERE video_id IN (
+                SELECT video_id FROM metadata ORDER BY last_used DESC LIMIT -1 OFFSET ?
+            )
+        """, (self.max_entries,))
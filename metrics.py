@@ -0,0 +1,332 @@
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+# The prefix of the names of the exported Prometheus metrics
+PROMETHEUS_PREFIX = 'youtube_downloader'
+# The minimum seconds between two writes of the Prometheus file during a batch
+PROMETHEUS_INTERVAL = 10.0
+
+
+class StageTotals:
+    """
+    The totals of all measured jobs of a stage, e.g. 'load_bookmarks', 'extract_info', 'download' or 'postprocess'.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.completed = 0
+        self.failed = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.bytes = 0
+
+    @property
+    def throughput(self) -> float:
+        """
+        :return: float. Bytes per second of the time spent in the stage
+        """
+
+        return self.bytes / self.seconds if self.seconds > 0 else 0.0
+
+    def as_dict(self) -> dict:
+        jobs = self.completed + self.failed
+
+        return {
+            'name': self.name,
+            'completed': self.completed,
+            'failed': self.failed,
+            'seconds': round(self.seconds, 3),
+            'mean_seconds': round(self.seconds / jobs, 3) if jobs else 0.0,
+            'max_seconds': round(self.max_seconds, 3),
+            'bytes': self.bytes,
+            'throughput': round(self.throughput, 1),
+        }
+
+    def __str__(self):
+        jobs = self.completed + self.failed
+        mean = self.seconds / jobs if jobs else 0.0
+        text = f'{self.name}: {jobs} jobs ({self.failed} failed), {self.seconds:.2f} s, {mean:.2f} s per job'
+
+        if self.bytes:
+            text += f', {self.bytes / 2 ** 20:.1f} MiB at {self.throughput / 2 ** 20:.2f} MiB/s'
+
+        return text
+
+
+class Metrics:
+    """
+    Records the duration, the bytes and the outcome of every job in every stage of the downloads. Every record is
+    appended to a JSON lines file, and the totals of the stages are written to a file in the Prometheus text format,
+    which the textfile collector of the node exporter reads.
+    """
+
+    def __init__(self, jsonl_path: Optional[str] = 'metrics.jsonl', prometheus_path: Optional[str] = 'metrics.prom'):
+        """
+        :param jsonl_path: str, optional. The file, where every record is appended. If it is None, the records are
+        only added to the totals
+        :param prometheus_path: str, optional. The file with the totals of the stages. If it is None, it is not written
+        """
+
+        self.jsonl_path = jsonl_path
+        self.prometheus_path = prometheus_path
+        self._stages: Dict[str, StageTotals] = {}
+        self._lock = threading.Lock()
+        self._file = None
+        self._written_at = 0.0
+
+    @contextmanager
+    def measure(self, stage: str, key: Optional[str] = None, **fields) -> Iterator[dict]:
+        """
+        Records the time of the block. If it raises, the job is recorded as failed.
+
+        :param stage: str. The name of the stage
+        :param key: str, optional. Identifies the job, e.g. the url of the video
+        :param fields: The extra fields of the record
+        :return: context manager, which gives a dictionary of the extra fields, e.g. the bytes, filled by the block
+        """
+
+        record = dict(fields)
+        started_at = time.perf_counter()
+
+        try:
+            yield record
+        except BaseException as e:
+            record['error'] = str(e) or type(e).__name__
+            self.record(stage, time.perf_counter() - started_at, key, failed=True, **record)
+            raise
+
+        self.record(stage, time.perf_counter() - started_at, key, **record)
+
+    def record(self, stage: str, seconds: float, key: Optional[str] = None, failed=False, bytes: int = 0, **fields):
+        """
+        :param stage: str. The name of the stage
+        :param seconds: float. The duration of the job in the stage
+        :param key: str, optional. Identifies the job
+        :param failed: boolean. True if the job failed in the stage
+        :param bytes: int. The bytes downloaded or written by the job
+        :param fields: The extra fields of the record, e.g. the number of loaded bookmarks
+        :return: None
+        """
+
+        line = json.dumps({
+            'time': round(time.time(), 3),
+            'stage': stage,
+            'key': key,
+            'seconds': round(seconds, 4),
+            'bytes': bytes,
+            'throughput': round(bytes / seconds, 1) if bytes and seconds > 0 else None,
+            'failed': failed,
+            **fields,
+        }, default=str)
+
+        with self._lock:
+            totals = self._stages.setdefault(stage, StageTotals(stage))
+            totals.seconds += seconds
+            totals.max_seconds = max(totals.max_seconds, seconds)
+            totals.bytes += bytes
+
+            if failed:
+                totals.failed += 1
+            else:
+                totals.completed += 1
+
+            if self.jsonl_path is not None:
+                # Opened once and kept open, as every job appends a few lines
+                if self._file is None:
+                    self._file = open(self.jsonl_path, 'a', encoding='utf-8')
+
+                self._file.write(line + '\n')
+                self._file.flush()
+
+            write_prometheus = time.monotonic() - self._written_at >= PROMETHEUS_INTERVAL
+
+        # Keep the exported totals fresh during a long batch
+        if write_prometheus:
+            self.write_prometheus()
+
+    def totals(self) -> Dict[str, dict]:
+        """
+        :return: dict. A snapshot of the totals of every stage, by stage name
+        """
+
+        with self._lock:
+            return {name: totals.as_dict() for name, totals in self._stages.items()}
+
+    def summary(self) -> List[str]:
+        """
+        :return: list of str. A line with the totals of every stage
+        """
+
+        with self._lock:
+            return [str(totals) for totals in self._stages.values()]
+
+    def format_prometheus(self) -> str:
+        """
+        :return: str. The totals of the stages in the Prometheus text format
+        """
+
+        metrics = [
+            ('stage_jobs_total', 'counter', 'Jobs finished by the stage'),
+            ('stage_seconds_total', 'counter', 'Seconds spent in the stage by all jobs'),
+            ('stage_seconds_max', 'gauge', 'Seconds of the slowest job of the stage'),
+            ('stage_bytes_total', 'counter', 'Bytes downloaded or written by the stage'),
+            ('stage_throughput_bytes', 'gauge', 'Bytes per second of the time spent in the stage'),
+        ]
+        lines = []
+
+        with self._lock:
+            stages = [totals.as_dict() for totals in self._stages.values()]
+
+        for name, metric_type, description in metrics:
+            lines.append(f'# HELP {PROMETHEUS_PREFIX}_{name} {description}')
+            lines.append(f'# TYPE {PROMETHEUS_PREFIX}_{name} {metric_type}')
+
+            for stage in stages:
+                label = f'stage="{stage["name"]}"'
+
+                if name == 'stage_jobs_total':
+                    lines.append(f'{PROMETHEUS_PREFIX}_{name}{{{label},status="completed"}} {stage["completed"]}')
+                    lines.append(f'{PROMETHEUS_PREFIX}_{name}{{{label},status="failed"}} {stage["failed"]}')
+                    continue
+
+                value = {
+                    'stage_seconds_total': stage['seconds'],
+                    'stage_seconds_max': stage['max_seconds'],
+                    'stage_bytes_total': stage['bytes'],
+                    'stage_throughput_bytes': stage['throughput'],
+                }[name]
+                lines.append(f'{PROMETHEUS_PREFIX}_{name}{{{label}}} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self):
+        if self.prometheus_path is None:
+            return
+
+        with self._lock:
+            self._written_at = time.monotonic()
+
+        # The collector may read the file at any time, so it is replaced at once and never seen half written.
+        # Every writer has its own temporary file, as the worker threads may write at the same time
+        descriptor, temporary_path = tempfile.mkstemp(
+            prefix=os.path.basename(self.prometheus_path) + '.', suffix='.tmp',
+            dir=os.path.dirname(os.path.abspath(self.prometheus_path))
+        )
+
+        try:
+            with open(descriptor, 'w', encoding='utf-8') as file:
+                file.write(self.format_prometheus())
+
+            os.replace(temporary_path, self.prometheus_path)
+        except BaseException:
+            os.remove(temporary_path)
+            raise
+
+    def close(self):
+        self.write_prometheus()
+
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+@contextmanager
+def measure(metrics: Optional[Metrics], stage: str, key: Optional[str] = None, **fields) -> Iterator[dict]:
+    """
+    :param metrics: Metrics, optional. If it is None, nothing is recorded
+    :return: context manager, the same as Metrics.measure
+    """
+
+    if metrics is None:
+        yield dict(fields)
+        return
+
+    with metrics.measure(stage, key, **fields) as record:
+        yield record
+
+
+class _ProfileSnapshot:
+    """
+    The calls collected so far by the profiler of another thread. pstats takes the statistics of a profiler with
+    create_stats, which disables the profiler of the calling thread, not of the profiled one.
+    """
+
+    def __init__(self, profile):
+        profile.snapshot_stats()
+        self.stats = profile.stats
+
+    def create_stats(self):
+        pass
+
+
+@contextmanager
+def profile_batch(path: str) -> Iterator[None]:
+    """
+    Profiles the block with cProfile, in the calling thread and in the threads started by it, e.g. the download
+    workers, and saves the merged statistics for pstats or snakeviz. The ffmpeg processes are not profiled.
+
+    Since Python 3.12, cProfile is built on sys.monitoring, so a single profiler sees the calls of all threads, and no
+    other profiler may be active at the same time. It keeps a single call stack, so the times of the calls, which
+    overlap in several threads, are approximate, while the call counts are exact. Before 3.12, every thread started
+    in the block gets its own profiler. A profiler can only be stopped by its own thread, so the threads, which outlive
+    the block, keep collecting until they exit, and only their calls made before the end of the block are saved.
+    The pipeline joins its threads before it returns, so this only affects the background threads, e.g. the
+    prewarming of the sessions.
+
+    :param path: str. The file of the statistics
+    :return: context manager
+    """
+
+    # cProfile is only imported when a batch is profiled
+    import cProfile
+    import pstats
+
+    main_profile = cProfile.Profile()
+
+    if sys.version_info >= (3, 12):
+        main_profile.enable()
+
+        try:
+            yield
+        finally:
+            main_profile.disable()
+            main_profile.dump_stats(path)
+
+        return
+
+    profiles = []
+    lock = threading.Lock()
+
+    def start_thread_profile(frame, event, arg):
+        # Replace the hook with a profiler of the new thread, at its first call
+        sys.setprofile(None)
+        profile = cProfile.Profile()
+
+        with lock:
+            profiles.append(profile)
+
+        profile.enable()
+
+    threading.setprofile(start_thread_profile)
+    main_profile.enable()
+
+    try:
+        yield
+    finally:
+        main_profile.disable()
+        threading.setprofile(None)
+
+        stats = pstats.Stats(main_profile)
+
+        with lock:
+            for profile in profiles:
+                stats.add(_ProfileSnapshot(profile))
+
+        stats.dump_stats(path)
@@ -0,0 +1,860 @@
+import os
+import queue
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, Future
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import resource
+except ImportError:
+    # Windows has no resource module, so the CPU time of the transcodes is not measured there
+    resource = None
+
+from batch_downloader import (
+    DownloadResult, extract_info, get_output_path, iter_playlist_entries, prefetch_metadata, resolve_info
+)
+from bookmark import Bookmark, is_collection_url
+from download_archive import DownloadArchive
+from job_queue import PENDING, Job, JobQueue
+from message_bus import MessageBus, ProgressEvent
+from metadata_cache import MetadataCache
+from metrics import Metrics
+from range_downloader import RangeDownloader
+from scheduler import AdaptiveScheduler
+from session_pool import SessionPool, borrow_downloader
+
+if TYPE_CHECKING:
+    import yt_dlp
+
+# The ffmpeg arguments for every supported target format
+TRANSCODE_ARGUMENTS = {
+    'mp3': ['-vn', '-codec:a', 'libmp3lame', '-q:a', '0'],  # '-q:a 0' is the best possible VBR quality
+    'mkv': [],  # Let ffmpeg choose the default codecs of the container
+}
+# The ffmpeg arguments, which copy the audio stream into another container without re-encoding it
+COPY_AUDIO_ARGUMENTS = ['-vn', '-codec:a', 'copy']
+# The container of every audio codec, which it is copied into by the 'audio' target format, by the yt_dlp codec name
+AUDIO_CONTAINERS = {
+    'mp4a': 'm4a',
+    'opus': 'opus',
+    'vorbis': 'ogg',
+    'mp3': 'mp3',
+    'flac': 'flac',
+}
+# The ffmpeg arguments for the audio, whose codec has no container in AUDIO_CONTAINERS
+FALLBACK_AUDIO_ARGUMENTS = ('m4a', ['-vn', '-codec:a', 'aac', '-b:a', '192k'])
+# The best audio, which can be copied into its own container, and any audio if there is none
+AUDIO_FORMAT = 'bestaudio[acodec~=\'^({})\']/bestaudio/best'.format('|'.join(AUDIO_CONTAINERS))
+# The number of listed videos of a playlist, which are added to the job queue at once
+PLAYLIST_PAGE_SIZE = 20
+# The yt_dlp protocols of the progressive formats, which are single files, so they can be downloaded in ranges
+RANGE_PROTOCOLS = ('http', 'https')
+
+
+def get_fetch_options(target_format: str, output_path='Downloads', connections: int = 1) -> dict:
+    """
+    :param target_format: str. 'mp3', 'audio' or 'mkv'
+    :param output_path: str. The directory where the downloaded files are saved
+    :param connections: int. The number of parallel fragment downloads of the DASH and HLS formats
+    :return: dict. The yt_dlp options for downloading the raw streams only, without any postprocessing
+    """
+
+    options = {
+        'outtmpl': output_path + '/%(title)s.%(ext)s',  # Template for output filename
+        'noplaylist': True,  # Do not download the entire playlist, only the video
+        'playlist_items': '1',  # Only download the first video if it's a playlist
+        'continuedl': True,  # Resume the partially downloaded .part files of the interrupted downloads
+    }
+
+    if target_format == 'mp3':
+        options['format'] = 'bestaudio/best'
+    elif target_format == 'audio':
+        options['format'] = AUDIO_FORMAT
+    else:
+        # Merging the separate video and audio streams is a stream copy, so it stays in the network stage
+        options['format'] = 'bestvideo[height<=2160]+bestaudio/best'
+        options['merge_output_format'] = 'mkv'
+
+    if connections > 1:
+        options['concurrent_fragment_downloads'] = connections
+
+    return options
+
+
+def fetch(url: str, target_format: str, output_path='Downloads', cache: Optional[MetadataCache] = None,
+          bus: Optional[MessageBus] = None, ratelimit: Optional[int] = None, connections: int = 1,
+          pool: Optional[SessionPool] = None, metrics: Optional[Metrics] = None) -> Tuple[dict, str]:
+    """
+    :param url: str. The url of the YouTube video
+    :param target_format: str. 'mp3', 'audio' or 'mkv'
+    :param output_path: str. The directory where the downloaded files are saved
+    :param cache: MetadataCache, optional. The cache of the extracted metadata
+    :param bus: MessageBus, optional. If it is filled, the progress of the download is posted to it, keyed by the url
+    :param ratelimit: int, optional. The maximum bytes per second of the download
+    :param connections: int. The number of connections of the download. With more than one, the progressive formats
+    are downloaded in ranges, and the fragments of the DASH and HLS formats are downloaded in parallel
+    :param pool: SessionPool, optional. If it is filled, a session of yt_dlp is borrowed from it, instead of creating
+    a new one
+    :param metrics: Metrics, optional. If it is filled, the extraction and the download are recorded in it
+    :return: tuple of the info dictionary and the path to the downloaded file
+    """
+
+    options = get_fetch_options(target_format, output_path, connections)
+
+    if ratelimit:
+        options['ratelimit'] = ratelimit
+
+    if bus is not None:
+        options['progress_hooks'] = [bus.progress_hook(url)]
+        options['postprocessor_hooks'] = [bus.postprocessor_hook(url)]
+
+    with borrow_downloader(options, pool) as ydl:
+        if connections > 1:
+            info_dict = resolve_info(ydl, url, cache, metrics)
+            hook = bus.progress_hook(url) if bus is not None else None
+
+            started_at = time.perf_counter()
+            path = fetch_ranges(ydl, info_dict, connections, ratelimit, hook)
+
+            if path is not None:
+                if metrics is not None:
+                    metrics.record(
+                        'download', time.perf_counter() - started_at, url, bytes=os.path.getsize(path), ranges=True
+                    )
+
+                return info_dict, path
+
+        # Without ranges, or if they failed, yt_dlp downloads the file
+        info_dict = extract_info(ydl, url, cache, metrics)
+        path = get_output_path(ydl, info_dict)
+
+    return info_dict, path
+
+
+def fetch_ranges(ydl: 'yt_dlp.YoutubeDL', info_dict: dict, connections: int, ratelimit: Optional[int] = None,
+                 progress_hook: Optional[Callable[[dict], None]] = None) -> Optional[str]:
+    """
+    Downloads the requested progressive formats of the video over several connections each, and merges them into the
+    output file, as yt_dlp does.
+
+    :param ydl: yt_dlp.YoutubeDL. The configured downloader
+    :param info_dict: dict. The resolved info dictionary of the video, without downloading
+    :param connections: int. The maximum number of connections per file
+    :param ratelimit: int, optional. The maximum bytes per second of the download
+    :param progress_hook: function, optional. Called with the progress of the download, as a yt_dlp progress hook
+    :return: str. The path to the downloaded file, or None if the formats can't be downloaded in ranges, or it failed
+    """
+
+    formats = info_dict.get('requested_formats') or [info_dict]
+
+    # The fragmented formats are left to yt_dlp, which downloads their fragments in parallel
+    if any(f.get('protocol') not in RANGE_PROTOCOLS or not f.get('url') for f in formats):
+        return None
+
+    path = ydl.prepare_filename(info_dict)
+
+    if os.path.isfile(path):
+        return path
+
+    # The formats of the video and the audio are downloaded next to the output file, as yt_dlp names them
+    base = os.path.splitext(path)[0]
+    format_paths = [path] if len(formats) == 1 else [f'{base}.f{f["format_id"]}.{f["ext"]}' for f in formats]
+    # The files are renamed only when they are complete, so an interrupted download is never taken for a finished one
+    temporary_paths = [p + '.ranges' for p in format_paths]
+
+    def hook(data: dict):
+        progress_hook({**data, 'info_dict': info_dict})
+
+    try:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+        for f, temporary_path in zip(formats, temporary_paths):
+            downloader = RangeDownloader(
+                connections, f.get('http_headers'), ratelimit, hook if progress_hook is not None else None
+            )
+            downloader.download(f['url'], temporary_path)
+
+        if len(formats) == 1:
+            os.replace(temporary_paths[0], path)
+        else:
+            merge(temporary_paths, path)
+    except Exception:
+        return None
+    finally:
+        for p in temporary_paths:
+            if os.path.isfile(p):
+                os.remove(p)
+
+    return path
+
+
+def merge(source_paths: List[str], target_path: str):
+    """
+    Merges the video and the audio streams into one file, without transcoding them.
+
+    :param source_paths: list of str. The paths to the downloaded formats
+    :param target_path: str. The path to the merged file
+    """
+
+    command = ['ffmpeg', '-y', '-loglevel', 'error']
+
+    for p in source_paths:
+        command += ['-i', p]
+    for i in range(len(source_paths)):
+        command += ['-map', str(i)]
+
+    command += ['-c', 'copy', target_path]
+    subprocess.run(command, check=True, capture_output=True)
+
+
+def get_transcode_arguments(target_format: str, acodec: Optional[str] = None) -> Tuple[str, List[str]]:
+    """
+    :param target_format: str. 'mp3', 'audio' or 'mkv'. 'audio' keeps the codec of the downloaded audio
+    :param acodec: str, optional. The audio codec of the downloaded file, as reported by yt_dlp, e.g. 'mp4a.40.2'
+    :return: tuple of the extension of the target file and the ffmpeg arguments of the conversion
+    """
+
+    codec = (acodec or '').split('.')[0]
+
+    # The audio is copied, when it is already in the requested codec
+    if target_format == 'audio':
+        if codec in AUDIO_CONTAINERS:
+            return AUDIO_CONTAINERS[codec], COPY_AUDIO_ARGUMENTS
+
+        return FALLBACK_AUDIO_ARGUMENTS
+
+    if target_format == 'mp3' and codec == 'mp3':
+        return 'mp3', COPY_AUDIO_ARGUMENTS
+
+    return target_format, TRANSCODE_ARGUMENTS[target_format]
+
+
+def get_children_cpu_seconds() -> Optional[float]:
+    """
+    :return: float. The user and system CPU seconds of the finished child processes, or None if it is not available
+    """
+
+    if resource is None:
+        return None
+
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def transcode(source_path: str, target_format: str, acodec: Optional[str] = None,
+              threads: Optional[int] = None) -> Tuple[str, Optional[float]]:
+    """
+    Runs in a worker process of the CPU stage.
+
+    :param source_path: str. The path to the downloaded file
+    :param target_format: str. 'mp3', 'audio' or 'mkv'
+    :param acodec: str, optional. The audio codec of the downloaded file. If the target allows it, the audio is copied
+    instead of re-encoded
+    :param threads: int, optional. The threads of a single ffmpeg. Defaults to the choice of ffmpeg
+    :return: tuple of the path to the transcoded file and the CPU seconds of ffmpeg, if they are known
+    """
+
+    extension, arguments = get_transcode_arguments(target_format, acodec)
+    target_path = os.path.splitext(source_path)[0] + '.' + extension
+
+    # Nothing to do if the file is already in the target format
+    if target_path == source_path:
+        return target_path, 0.0
+
+    command = ['ffmpeg', '-y', '-loglevel', 'error']
+
+    # The threads of the decoder and of the encoder
+    thread_arguments = ['-threads', str(threads)] if threads else []
+    command += [*thread_arguments, '-i', source_path, *arguments, *thread_arguments, target_path]
+
+    # Every worker process runs one ffmpeg at a time, so the difference is the CPU time of this one
+    cpu_seconds = get_children_cpu_seconds()
+    subprocess.run(command, check=True, capture_output=True)
+
+    if cpu_seconds is not None:
+        cpu_seconds = get_children_cpu_seconds() - cpu_seconds
+
+    # Remove the original file, as the yt_dlp postprocessors do
+    os.remove(source_path)
+
+    return target_path, cpu_seconds
+
+
+class StageStats:
+    def __init__(self, name: str):
+        self.name = name
+        # Jobs waiting in front of the stage
+        self.queue_depth = 0
+        # Jobs being processed by the stage
+        self.in_progress = 0
+        self.completed = 0
+        self.failed = 0
+        # Sum of the processing times of all finished jobs, in seconds
+        self.busy_seconds = 0.0
+        # Sum of the CPU times of the child processes of the finished jobs, in seconds, if they are measured
+        self.cpu_seconds = 0.0
+        self.started_at = time.monotonic()
+
+    @property
+    def throughput(self) -> float:
+        """
+        :return: float. Finished jobs per second since the stage was started
+        """
+
+        elapsed = time.monotonic() - self.started_at
+        return (self.completed + self.failed) / elapsed if elapsed > 0 else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            'name': self.name,
+            'queue_depth': self.queue_depth,
+            'in_progress': self.in_progress,
+            'completed': self.completed,
+            'failed': self.failed,
+            'busy_seconds': round(self.busy_seconds, 3),
+            'cpu_seconds': round(self.cpu_seconds, 3),
+            'cpu_seconds_per_job': round(self.cpu_seconds / self.completed, 3) if self.completed else 0.0,
+            'throughput': round(self.throughput, 3),
+        }
+
+    def __str__(self):
+        return (f'{self.name}: {self.queue_depth} queued, {self.in_progress} running, '
+                f'{self.completed} done, {self.failed} failed, {self.throughput:.2f} jobs/s')
+
+
+class DownloadPipeline:
+    def __init__(self, network_workers: int = 4, cpu_workers: Optional[int] = None, queue_size: Optional[int] = None,
+                 cache: Optional[MetadataCache] = None, prefetch=False, archive: Optional[DownloadArchive] = None,
+                 bus: Optional[MessageBus] = None, scheduler: Optional[AdaptiveScheduler] = None, connections: int = 1,
+                 expand_playlists=False, pool: Optional[SessionPool] = None, transcode_threads: Optional[int] = None,
+                 metrics: Optional[Metrics] = None):
+        """
+        :param network_workers: int. The number of downloads running at the same time
+        :param cpu_workers: int, optional. The number of ffmpeg processes. Defaults to the number of cores
+        :param queue_size: int, optional. The maximum number of downloaded files waiting for ffmpeg. When it is reached,
+        the network stage waits, so finished downloads don't pile up on the disk. Defaults to twice the cpu_workers
+        :param cache: MetadataCache, optional. The cache of the extracted metadata
+        :param prefetch: boolean, optional. If it is True, the metadata of all bookmarks is resolved in parallel and
+        cached, before any downloads start. It requires a cache
+        :param archive: DownloadArchive, optional. If it is filled, the videos which are already downloaded in the
+        target format are skipped, and the new downloads are added to it
+        :param bus: MessageBus, optional. If it is filled, the progress of every job in both stages is posted to it,
+        keyed by the canonical url of the bookmark
+        :param scheduler: AdaptiveScheduler, optional. If it is filled, it sets the number of concurrent downloads
+        instead of network_workers, and it limits their bandwidth and the downloads per host
+        :param connections: int. The number of connections of every download, see fetch
+        :param expand_playlists: boolean, optional. If it is True, the bookmarks of playlists and channels are replaced
+        by all of their videos, which start downloading while the rest of the playlist is listed. Else only the first
+        video of a playlist is downloaded
+        :param pool: SessionPool, optional. If it is filled, the downloads reuse its sessions of yt_dlp, and the
+        sessions for the batch are created in the background, before the first download needs them
+        :param transcode_threads: int, optional. The threads of every ffmpeg process. Defaults to the choice of ffmpeg,
+        which may use all cores in each of the cpu_workers processes
+        :param metrics: Metrics, optional. If it is filled, the duration and the bytes of every job in the
+        'extract_info', 'download' and 'postprocess' stages are recorded in it, and so is the whole 'batch'
+        """
+
+        self.network_workers = max(1, network_workers)
+        self.cpu_workers = max(1, cpu_workers or os.cpu_count() or 1)
+        self.queue_size = queue_size or 2 * self.cpu_workers
+        self.cache = cache
+        self.prefetch = prefetch and cache is not None
+        self.archive = archive
+        self.bus = bus
+        self.scheduler = scheduler
+        self.connections = max(1, connections)
+        self.expand_playlists = expand_playlists
+        self.pool = pool
+        self.transcode_threads = transcode_threads
+        self.metrics = metrics
+
+        self.network_stats = StageStats('network')
+        self.cpu_stats = StageStats('cpu')
+        self._lock = threading.Lock()
+
+    def stats(self) -> Dict[str, dict]:
+        """
+        :return: dict. A snapshot of the statistics of both stages, by stage name
+        """
+
+        with self._lock:
+            return {s.name: s.as_dict() for s in (self.network_stats, self.cpu_stats)}
+
+    def run(self, bookmarks: Iterable[Bookmark], target_format: str, on_result: Callable[[DownloadResult], None],
+            output_path='Downloads') -> List[DownloadResult]:
+        """
+        Downloads the bookmarks and transcodes them to the target format and blocks until all of them are done.
+
+        :param bookmarks: iterable of Bookmark objects to download
+        :param target_format: str. 'mp3', 'audio' or 'mkv'
+        :param on_result: function, called from a worker thread with the DownloadResult of every job as it finishes
+        :param output_path: str. The directory where the downloaded files are saved
+        :return: list of DownloadResult objects in order of completion
+        """
+
+        results = []
+        # The downloaded files, waiting for the CPU stage. None marks the end of the network stage
+        downloaded = queue.Queue(maxsize=self.queue_size)
+
+        self.network_stats = StageStats('network')
+        self.cpu_stats = StageStats('cpu')
+        batch_started_at = time.perf_counter()
+
+        def report(result: DownloadResult):
+            with self._lock:
+                results.append(result)
+            on_result(result)
+
+        if self.pool is not None:
+            options = get_fetch_options(target_format, output_path, self.connections)
+            threading.Thread(target=self._prewarm, args=(options,), daemon=True).start()
+
+        videos = self._iter_videos(bookmarks, target_format, report)
+
+        if self.prefetch:
+            # The metadata of the whole batch is resolved first, so the playlists are listed before it
+            videos = list(videos)
+            prefetch_metadata(
+                videos, get_fetch_options(target_format, output_path, self.connections), self.cache,
+                self.network_workers, self.pool, self.metrics
+            )
+
+        def network_job(bookmark: Bookmark):
+            if self.scheduler is not None:
+                self.scheduler.acquire()
+
+            self._update(self.network_stats, queue_depth=-1, in_progress=1)
+            started_at = time.monotonic()
+
+            try:
+                info_dict, path = self._fetch(bookmark.canonical_url, target_format, output_path)
+            except Exception as e:
+                self._finish(self.network_stats, started_at, failed=True)
+                report(DownloadResult(bookmark, error=e))
+                return
+
+            self._finish(self.network_stats, started_at)
+
+            title = info_dict.get('title', None)
+
+            def on_transcoded(path: Optional[str], cpu_seconds: Optional[float], error: Optional[Exception]):
+                if error is not None:
+                    report(DownloadResult(bookmark, title=title, error=error))
+                    return
+
+                if self.archive is not None:
+                    self.archive.add(bookmark.video_id, target_format, path)
+
+                report(DownloadResult(bookmark, title=title, path=path, cpu_seconds=cpu_seconds))
+
+            # Blocks while the CPU stage is behind
+            downloaded.put((bookmark, title, path, target_format, info_dict.get('acodec'), on_transcoded))
+            self._update(self.cpu_stats, queue_depth=1)
+
+        with ProcessPoolExecutor(max_workers=self.cpu_workers) as process_pool:
+            cpu_stage = threading.Thread(target=self._run_cpu_stage, args=(downloaded, process_pool))
+            cpu_stage.start()
+
+            with ThreadPoolExecutor(max_workers=self._get_max_network_workers()) as thread_pool:
+                # The videos of the playlists are submitted as they are listed, so they download in the meantime
+                for b in videos:
+                    self._update(self.network_stats, queue_depth=1)
+                    thread_pool.submit(network_job, b)
+
+            downloaded.put(None)
+            cpu_stage.join()
+
+        self._record_batch(batch_started_at, results)
+
+        return results
+
+    def run_queue(self, job_queue: JobQueue, on_result: Callable[[DownloadResult], None],
+                  poll_interval: float = 1.0, idle_timeout: float = 0.0) -> List[DownloadResult]:
+        """
+        Downloads the jobs of the queue and blocks until no job is pending or running. The failed jobs are retried
+        after their backoff delay, and the interrupted downloads are resumed from their partially downloaded files.
+
+        Other processes may download from the same queue at the same time. The claimed jobs are kept leased with
+        heartbeats, and the results of the other processes are passed to on_result too, but they are not returned.
+
+        :param job_queue: JobQueue. The durable queue of the jobs
+        :param on_result: function, called from a worker thread with the DownloadResult of every attempt as it finishes
+        :param poll_interval: float. The maximum seconds an idle worker waits, before it checks the queue again
+        :param idle_timeout: float. The seconds to keep waiting for new jobs after the queue is finished, e.g. in
+        a worker process, which is started before the jobs are added
+        :return: list of DownloadResult objects of this process in order of completion
+        """
+
+        results = []
+        downloaded = queue.Queue(maxsize=self.queue_size)
+        # The ids of the jobs claimed by this process and not finished yet
+        claimed = set()
+        stopped = threading.Event()
+
+        self.network_stats = StageStats('network')
+        self.cpu_stats = StageStats('cpu')
+        batch_started_at = time.perf_counter()
+        self.network_stats.queue_depth = job_queue.counts()[PENDING]
+        # Only the results of the other workers, which are recorded from now on, are reported
+        last_result_id = job_queue.last_result_id()
+
+        def finish(job: Job, result: DownloadResult):
+            if result.succeeded:
+                job_queue.complete(job, result.as_dict())
+            else:
+                # The recorded result has the status, which the job gets, unless its lease was lost
+                result.retrying = job_queue.will_retry(job)
+                result.retrying = job_queue.fail(job, result.error, result.as_dict())
+
+                if result.retrying:
+                    self._update(self.network_stats, queue_depth=1)
+
+            with self._lock:
+                claimed.discard(job.id)
+
+            # The worker, which took the job over, reports its own result
+            if job.lease_lost:
+                return
+
+            with self._lock:
+                results.append(result)
+            on_result(result)
+
+        def heartbeat():
+            nonlocal last_result_id
+
+            while True:
+                # After the last job, run once more, so the last results are reported, and the worker is shown as idle
+                stopping = stopped.is_set()
+
+                with self._lock:
+                    running = len(claimed)
+
+                # Keep the leases of the long downloads, and report the results of the other workers
+                job_queue.heartbeat(running)
+
+                for result_id, worker, result in job_queue.results(last_result_id, job_queue.worker_id):
+                    last_result_id = result_id
+                    on_result(DownloadResult.from_dict(result))
+
+                if stopping:
+                    return
+
+                stopped.wait(job_queue.lease_seconds / 3)
+
+        def expand(job: Job):
+            # The playlist job stays running while it is listed, so the workers don't stop before its last video
+            page = []
+
+            def add_page():
+                added = job_queue.add(page, job.target_format, job.output_path)
+                self._update(self.network_stats, queue_depth=added)
+                page.clear()
+
+            try:
+                for entry in iter_playlist_entries(job.url):
+                    page.append(entry)
+
+                    if len(page) >= PLAYLIST_PAGE_SIZE:
+                        add_page()
+
+                add_page()
+            except Exception as e:
+                finish(job, DownloadResult(job.to_bookmark(), title=job.title, error=e))
+                return
+
+            job_queue.complete(job)
+
+            with self._lock:
+                claimed.discard(job.id)
+
+        def process(job: Job):
+            bookmark = job.to_bookmark()
+            self._update(self.network_stats, queue_depth=-1)
+
+            # The playlist is listed into the queue, where the other workers download its videos in the meantime
+            if self.expand_playlists and is_collection_url(job.url):
+                self._release_slot()
+                expand(job)
+                return
+
+            # Skip the videos, which are already downloaded in the target format
+            if self.archive is not None and self.archive.is_downloaded(bookmark.video_id, job.target_format):
+                self._release_slot()
+                entry = self.archive.get(bookmark.video_id, job.target_format)
+                finish(job, DownloadResult(bookmark, title=job.title, path=entry.path, skipped=True))
+                return
+
+            self._update(self.network_stats, in_progress=1)
+            started_at = time.monotonic()
+
+            try:
+                info_dict, path = self._fetch(job.url, job.target_format, job.output_path)
+            except Exception as e:
+                self._finish(self.network_stats, started_at, failed=True)
+                finish(job, DownloadResult(bookmark, error=e))
+                return
+
+            self._finish(self.network_stats, started_at)
+
+            title = info_dict.get('title', None)
+
+            def on_transcoded(path: Optional[str], cpu_seconds: Optional[float], error: Optional[Exception]):
+                if error is None and self.archive is not None:
+                    self.archive.add(bookmark.video_id, job.target_format, path)
+
+                finish(job, DownloadResult(bookmark, title=title, path=path, error=error, cpu_seconds=cpu_seconds))
+
+            # Blocks while the CPU stage is behind
+            downloaded.put((bookmark, title, path, job.target_format, info_dict.get('acodec'), on_transcoded))
+            self._update(self.cpu_stats, queue_depth=1)
+
+        def network_worker():
+            idle_since = None
+
+            while True:
+                # Claim a job only when the scheduler allows another download
+                if self.scheduler is not None:
+                    self.scheduler.acquire()
+
+                job = job_queue.claim()
+
+                if job is not None:
+                    idle_since = None
+
+                    with self._lock:
+                        claimed.add(job.id)
+
+                    process(job)
+                    continue
+
+                if self.scheduler is not None:
+                    self.scheduler.cancel()
+
+                if job_queue.is_finished():
+                    idle_since = idle_since or time.monotonic()
+
+                    if time.monotonic() - idle_since >= idle_timeout:
+                        return
+
+                # Wait for the retries, which are not due yet, and for the jobs in the CPU stage, which may fail
+                due_in = job_queue.next_due_in()
+                time.sleep(poll_interval if due_in is None else min(poll_interval, due_in))
+
+        heartbeat_thread = threading.Thread(target=heartbeat, daemon=True)
+        heartbeat_thread.start()
+
+        with ProcessPoolExecutor(max_workers=self.cpu_workers) as process_pool:
+            cpu_stage = threading.Thread(target=self._run_cpu_stage, args=(downloaded, process_pool))
+            cpu_stage.start()
+
+            workers = [threading.Thread(target=network_worker) for _ in range(self._get_max_network_workers())]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+
+            downloaded.put(None)
+            cpu_stage.join()
+
+        stopped.set()
+        heartbeat_thread.join()
+
+        self._record_batch(batch_started_at, results)
+
+        return results
+
+    def start(self, bookmarks: Iterable[Bookmark], target_format: str, on_result: Callable[[DownloadResult], None],
+              on_finish: Callable[[], None] = lambda: None, output_path='Downloads') -> threading.Thread:
+        """
+        Runs the pipeline in a background thread, so the caller (the Tk main loop) is not blocked.
+        The parameters are the same as in run. on_finish is called from the background thread after the last job.
+
+        :return: threading.Thread. The started background thread
+        """
+
+        # Take a snapshot of the bookmarks, so later changes of the selection do not affect the running batch
+        bookmarks = list(bookmarks)
+
+        return self._start(lambda: self.run(bookmarks, target_format, on_result, output_path), on_finish)
+
+    def start_queue(self, job_queue: JobQueue, on_result: Callable[[DownloadResult], None],
+                    on_finish: Callable[[], None] = lambda: None) -> threading.Thread:
+        """
+        Runs run_queue in a background thread. on_finish is called from the background thread after the last job.
+
+        :return: threading.Thread. The started background thread
+        """
+
+        return self._start(lambda: self.run_queue(job_queue, on_result), on_finish)
+
+    @staticmethod
+    def _start(run: Callable[[], object], on_finish: Callable[[], None]) -> threading.Thread:
+        def target():
+            try:
+                run()
+            finally:
+                on_finish()
+
+        thread = threading.Thread(target=target, daemon=True)
+        thread.start()
+
+        return thread
+
+    def _run_cpu_stage(self, downloaded: queue.Queue, process_pool: ProcessPoolExecutor):
+        # Do not submit more jobs than there are processes, so the rest of them wait in the bounded queue,
+        # and the network stage is throttled
+        free_workers = threading.Semaphore(self.cpu_workers)
+        pending: List[Future] = []
+
+        while True:
+            item = downloaded.get()
+
+            if item is None:
+                break
+
+            # on_transcoded is called with the path to the transcoded file and the CPU seconds of ffmpeg, or the error
+            bookmark, title, path, target_format, acodec, on_transcoded = item
+            free_workers.acquire()
+            self._update(self.cpu_stats, queue_depth=-1, in_progress=1)
+            started_at = time.monotonic()
+            self._post_progress(bookmark, title, 'started')
+
+            def done(future: Future, bookmark=bookmark, title=title, started_at=started_at,
+                     target_format=target_format, on_transcoded=on_transcoded):
+                free_workers.release()
+                error = future.exception()
+                path, cpu_seconds = future.result() if error is None else (None, None)
+                self._finish(self.cpu_stats, started_at, failed=error is not None, cpu_seconds=cpu_seconds)
+
+                if self.metrics is not None:
+                    self.metrics.record(
+                        'postprocess', time.monotonic() - started_at, bookmark.canonical_url, failed=error is not None,
+                        bytes=os.path.getsize(path) if path is not None and os.path.isfile(path) else 0,
+                        cpu_seconds=cpu_seconds, target_format=target_format
+                    )
+
+                self._post_progress(bookmark, title, 'error' if error is not None else 'finished')
+                on_transcoded(path, cpu_seconds, error)
+
+            future = process_pool.submit(transcode, path, target_format, acodec, self.transcode_threads)
+            future.add_done_callback(done)
+            pending.append(future)
+
+        # Wait for the last transcodes, so the callbacks run before the pool is shut down
+        for future in pending:
+            future.exception()
+
+    def _iter_videos(self, bookmarks: Iterable[Bookmark], target_format: str,
+                     report: Callable[[DownloadResult], None]) -> Iterator[Bookmark]:
+        """
+        :param bookmarks: iterable of Bookmark objects of the batch
+        :param target_format: str. 'mp3', 'audio' or 'mkv'
+        :param report: function, called with the DownloadResult of the skipped videos and of the playlists, which
+        couldn't be listed
+        :return: generator of the Bookmark objects of the videos to download. Every video is yielded once, even if it
+        is bookmarked under different urls, in more than one browser or in more than one playlist
+        """
+
+        seen = set()
+
+        for bookmark in bookmarks:
+            if self.expand_playlists and is_collection_url(bookmark.url):
+                entries = iter_playlist_entries(bookmark.url)
+            else:
+                entries = [bookmark]
+
+            try:
+                for b in entries:
+                    # Bookmarks which are not videos are compared by url
+                    key = b.video_id or b.url
+
+                    if key in seen:
+                        continue
+
+                    seen.add(key)
+
+                    # Skip the videos, which are already downloaded in the target format
+                    if self.archive is not None and self.archive.is_downloaded(b.video_id, target_format):
+                        entry = self.archive.get(b.video_id, target_format)
+                        report(DownloadResult(b, title=b.title, path=entry.path, skipped=True))
+                        continue
+
+                    yield b
+            except Exception as e:
+                # The playlist couldn't be listed, or only a part of it
+                report(DownloadResult(bookmark, error=e))
+
+    def _record_batch(self, started_at: float, results: List[DownloadResult]):
+        if self.metrics is None:
+            return
+
+        self.metrics.record(
+            'batch', time.perf_counter() - started_at, jobs=len(results),
+            failed_jobs=sum(r.status == 'failed' for r in results), **self.stats()
+        )
+        self.metrics.write_prometheus()
+
+    def _prewarm(self, options: dict):
+        try:
+            self.pool.prewarm(options, self._get_max_network_workers())
+        except Exception:
+            # The downloads create their sessions themselves, and report the errors
+            pass
+
+    def _release_slot(self):
+        # Give back the slot of the scheduler, when the claimed job doesn't download anything
+        if self.scheduler is not None:
+            self.scheduler.cancel()
+
+    def _get_max_network_workers(self) -> int:
+        # With a scheduler, the threads for its maximum are started, and it decides how many of them download
+        return self.scheduler.max_workers if self.scheduler is not None else self.network_workers
+
+    def _fetch(self, url: str, target_format: str, output_path: str) -> Tuple[dict, str]:
+        """
+        Calls fetch, and reports the finished download to the scheduler, which must be acquired before.
+        """
+
+        if self.scheduler is None:
+            return fetch(
+                url, target_format, output_path, self.cache, self.bus, None, self.connections, self.pool, self.metrics
+            )
+
+        self.scheduler.wait_for_host(url)
+
+        try:
+            ratelimit = self.scheduler.get_ratelimit()
+            info_dict, path = fetch(
+                url, target_format, output_path, self.cache, self.bus, ratelimit, self.connections, self.pool,
+                self.metrics
+            )
+        except Exception as e:
+            self.scheduler.release(error=e)
+            raise
+
+        self.scheduler.release(os.path.getsize(path) if os.path.isfile(path) else 0)
+
+        return info_dict, path
+
+    def _post_progress(self, bookmark: Bookmark, title: Optional[str], status: str):
+        if self.bus is not None:
+            self.bus.post(ProgressEvent(bookmark.canonical_url, 'transcode', status, title=title))
+
+    def _update(self, stats: StageStats, queue_depth: int = 0, in_progress: int = 0):
+        with self._lock:
+            stats.queue_depth += queue_depth
+            stats.in_progress += in_progress
+
+    def _finish(self, stats: StageStats, started_at: float, failed=False, cpu_seconds: Optional[float] = None):
+        with self._lock:
+            stats.in_progress -= 1
+            stats.busy_seconds += time.monotonic() - started_at
+            stats.cpu_seconds += cpu_seconds or 0.0
+
+            if failed:
+                stats.failed += 1
+            else:
+                stats.completed += 1
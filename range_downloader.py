@@ -0,0 +1,225 @@
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+CONTENT_RANGE_PATTERN = re.compile(r'bytes\s+(\d+)-(\d+)/(\d+|\*)')
+# The bytes read from a response at once
+CHUNK_SIZE = 256 * 1024
+# Smaller parts are not worth a connection of their own
+MIN_PART_SIZE = 4 * 2 ** 20
+
+
+class RangesNotSupported(Exception):
+    pass
+
+
+def split(size: int, connections: int, min_part_size: int = MIN_PART_SIZE) -> List[Tuple[int, int]]:
+    """
+    :param size: int. The size of the file in bytes
+    :param connections: int. The maximum number of parts
+    :param min_part_size: int. The minimum bytes of a part
+    :return: list of the (first byte, last byte) tuples of the parts
+    """
+
+    parts = max(1, min(connections, size // min_part_size))
+    part_size = -(-size // parts)
+
+    return [(start, min(start + part_size, size) - 1) for start in range(0, size, part_size)]
+
+
+def preallocate(path: str, size: int):
+    """
+    Creates the file with its final size, so the parts are written in place, without growing or fragmenting it.
+    """
+
+    with open(path, 'wb') as file:
+        if hasattr(os, 'posix_fallocate'):
+            try:
+                os.posix_fallocate(file.fileno(), 0, size)
+                return
+            except OSError:
+                # Not every file system supports it
+                pass
+
+        file.truncate(size)
+
+
+class RangeDownloader:
+    """
+    Downloads a file over several connections at the same time, each one requesting a byte range of it and writing it
+    at its offset in the preallocated file. If the server doesn't support ranges, or the file is too small to be split,
+    it is downloaded over a single connection.
+    """
+
+    def __init__(self, connections: int = 4, headers: Optional[Dict[str, str]] = None,
+                 ratelimit: Optional[int] = None, progress_hook: Optional[Callable[[dict], None]] = None,
+                 min_part_size: int = MIN_PART_SIZE, timeout: float = 30):
+        """
+        :param connections: int. The maximum number of connections per file
+        :param headers: dict, optional. The HTTP headers of the requests, e.g. the http_headers of a yt_dlp format
+        :param ratelimit: int, optional. The maximum bytes per second of the file, split between its connections
+        :param progress_hook: function, optional. Called with dictionaries like the ones of the yt_dlp progress hooks
+        :param min_part_size: int. The minimum bytes of a part
+        :param timeout: float. The seconds to wait for the server
+        """
+
+        self.connections = max(1, connections)
+        self.headers = dict(headers or {})
+        self.ratelimit = ratelimit
+        self.progress_hook = progress_hook
+        self.min_part_size = min_part_size
+        self.timeout = timeout
+
+        self._lock = threading.Lock()
+        self._downloaded_bytes = 0
+        self._total_bytes: Optional[int] = None
+        self._started_at = 0.0
+
+    def open(self, url: str, byte_range: Optional[Tuple[int, int]] = None):
+        """
+        :param url: str
+        :param byte_range: tuple of the first and the last byte, optional
+        :return: the response of urllib.request.urlopen
+        """
+
+        # urllib.request imports http.client, ssl and email, so it is imported with the first download, not at startup
+        import urllib.request
+
+        request = urllib.request.Request(url, headers=self.headers)
+
+        if byte_range is not None:
+            request.add_header('Range', f'bytes={byte_range[0]}-{byte_range[1]}')
+
+        return urllib.request.urlopen(request, timeout=self.timeout)
+
+    def probe(self, url: str) -> Tuple[Optional[int], bool]:
+        """
+        Requests the first byte of the file.
+
+        :return: tuple of the size of the file, if it is known, and a boolean, which is True if the server supports
+        ranges
+        """
+
+        with self.open(url, (0, 0)) as response:
+            match = CONTENT_RANGE_PATTERN.match(response.headers.get('Content-Range', ''))
+
+            # A server without ranges answers with the whole file
+            if response.status != 206 or match is None or match.group(3) == '*':
+                length = response.headers.get('Content-Length')
+                return (int(length) if length else None), False
+
+            return int(match.group(3)), True
+
+    def download(self, url: str, path: str) -> int:
+        """
+        :param url: str. The url of the file
+        :param path: str. The path where the file is written
+        :return: int. The size of the file
+        """
+
+        size, supports_ranges = self.probe(url)
+        parts = split(size, self.connections, self.min_part_size) if supports_ranges and size else []
+
+        self._downloaded_bytes = 0
+        self._total_bytes = size
+        self._started_at = time.monotonic()
+
+        if len(parts) < 2:
+            return self._download_single(url, path)
+
+        preallocate(path, size)
+
+        try:
+            with ThreadPoolExecutor(max_workers=len(parts)) as executor:
+                futures = [executor.submit(self._download_part, url, path, part, len(parts)) for part in parts]
+
+                # Raise the first error of the parts
+                for future in futures:
+                    future.result()
+        except RangesNotSupported:
+            # Some servers answer only part of the range requests, e.g. behind a load balancer
+            self._downloaded_bytes = 0
+            return self._download_single(url, path)
+
+        self._report('finished')
+
+        return size
+
+    def _download_part(self, url: str, path: str, byte_range: Tuple[int, int], parts: int):
+        start, end = byte_range
+
+        with self.open(url, byte_range) as response:
+            if response.status != 206:
+                raise RangesNotSupported(f'The server answered {response.status} to a range request')
+
+            # Every part has its own file object, so the parts don't share the position in the file
+            with open(path, 'r+b') as file:
+                file.seek(start)
+                self._copy(response, file, end - start + 1, parts)
+
+    def _download_single(self, url: str, path: str) -> int:
+        with self.open(url) as response, open(path, 'wb') as file:
+            self._copy(response, file, None, 1)
+
+        self._report('finished')
+
+        return os.path.getsize(path)
+
+    def _copy(self, response, file, length: Optional[int], connections: int):
+        """
+        Writes the response to the file.
+
+        :param length: int, optional. The bytes of the range. If it is not filled, the response is read to the end
+        :param connections: int. The number of connections of the file, which share its ratelimit
+        """
+
+        remaining = length
+        received = 0
+        started_at = time.monotonic()
+
+        while remaining is None or remaining > 0:
+            chunk = response.read(CHUNK_SIZE if remaining is None else min(CHUNK_SIZE, remaining))
+
+            if not chunk:
+                if remaining is None:
+                    break
+
+                raise IOError(f'The connection was closed with {remaining} bytes of the range left')
+
+            file.write(chunk)
+            received += len(chunk)
+
+            if remaining is not None:
+                remaining -= len(chunk)
+
+            with self._lock:
+                self._downloaded_bytes += len(chunk)
+                self._report('downloading')
+
+            # Limit the rate, as yt_dlp does with the ratelimit option
+            if self.ratelimit:
+                delay = received / (self.ratelimit / connections) - (time.monotonic() - started_at)
+                if delay > 0:
+                    time.sleep(delay)
+
+    def _report(self, status: str):
+        if self.progress_hook is None:
+            return
+
+        elapsed = time.monotonic() - self._started_at
+        speed = self._downloaded_bytes / elapsed if elapsed > 0 else None
+        eta = None
+
+        if speed and self._total_bytes:
+            eta = round((self._total_bytes - self._downloaded_bytes) / speed)
+
+        self.progress_hook({
+            'status': status,
+            'downloaded_bytes': self._downloaded_bytes,
+            'total_bytes': self._total_bytes,
+            'speed': speed,
+            'eta': eta,
+        })
@@ -0,0 +1,214 @@
+import threading
+import time
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+# The parts of the error messages, which mean that the server throttles the downloads
+THROTTLING_MESSAGES = ('429', 'too many requests', 'rate limit', 'rate-limit')
+
+
+def is_throttled(error: Optional[Exception]) -> bool:
+    """
+    :param error: Exception, optional. The error of a download
+    :return: boolean. True if the error means that the server throttles the downloads
+    """
+
+    if error is None:
+        return False
+
+    message = str(error).lower()
+
+    return any(m in message for m in THROTTLING_MESSAGES)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        """
+        :param rate: float. The number of tokens added per second
+        :param burst: int. The maximum number of saved tokens
+        """
+
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+
+    def take(self) -> float:
+        """
+        Takes a token, even if there is none yet. Not thread-safe.
+
+        :return: float. The seconds to wait before the token is available
+        """
+
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        self.tokens -= 1
+
+        return max(0.0, -self.tokens / self.rate)
+
+
+class AdaptiveScheduler:
+    """
+    Adjusts the number of concurrent downloads by additive increase and multiplicative decrease (AIMD). The limit
+    grows by one after every round of successful downloads, as long as it increases the total throughput, and it is
+    halved when the server starts throttling or too many downloads fail.
+    """
+
+    def __init__(self, initial_workers: int = 4, min_workers: int = 1, max_workers: int = 16,
+                 bandwidth_limit: Optional[float] = None, host_rate: Optional[float] = None, host_burst: int = 5,
+                 decrease_factor: float = 0.5, min_gain: float = 0.05, max_error_rate: float = 0.5):
+        """
+        :param initial_workers: int. The number of concurrent downloads at the start
+        :param min_workers: int. The lower bound of the limit
+        :param max_workers: int. The upper bound of the limit
+        :param bandwidth_limit: float, optional. The total bytes per second of all downloads. It is split evenly
+        between the running downloads, through the ratelimit option of yt_dlp
+        :param host_rate: float, optional. The maximum number of started downloads per second and host
+        :param host_burst: int. The number of downloads a host can start at once, before host_rate applies
+        :param decrease_factor: float. The limit is multiplied by it, when the server throttles
+        :param min_gain: float. The minimum relative gain of the throughput of a round, so the limit keeps growing
+        :param max_error_rate: float. The share of failed downloads in a round, above which the limit is decreased
+        """
+
+        self.min_workers = max(1, min_workers)
+        self.max_workers = max(self.min_workers, max_workers)
+        self.limit = min(self.max_workers, max(self.min_workers, initial_workers))
+        self.bandwidth_limit = bandwidth_limit
+        self.host_rate = host_rate
+        self.host_burst = host_burst
+        self.decrease_factor = decrease_factor
+        self.min_gain = min_gain
+        self.max_error_rate = max_error_rate
+
+        self.running = 0
+        self._condition = threading.Condition()
+        self._host_buckets: Dict[str, TokenBucket] = {}
+
+        # The measurements of the current round. A round ends after as many finished downloads as the limit
+        self._round_started_at = time.monotonic()
+        self._round_bytes = 0
+        self._round_jobs = 0
+        self._round_errors = 0
+        # The total throughput of the previous round in bytes per second
+        self._last_throughput = 0.0
+        # The downloads, which were running at the last decrease. Their throttling errors are caused by the previous
+        # limit, so they don't decrease the limit again
+        self._throttled_in_flight = 0
+
+    def acquire(self):
+        """
+        Blocks until a download can start.
+
+        :return: None
+        """
+
+        with self._condition:
+            while self.running >= self.limit:
+                self._condition.wait()
+
+            self.running += 1
+
+    def wait_for_host(self, url: str):
+        """
+        Blocks until the budget of the host of the url allows another download.
+
+        :param url: str. The url of the download
+        :return: None
+        """
+
+        if not self.host_rate:
+            return
+
+        host = urlparse(url).hostname or ''
+
+        with self._condition:
+            bucket = self._host_buckets.get(host)
+            if bucket is None:
+                bucket = self._host_buckets[host] = TokenBucket(self.host_rate, self.host_burst)
+
+            delay = bucket.take()
+
+        if delay > 0:
+            time.sleep(delay)
+
+    def cancel(self):
+        """
+        Gives back a slot taken by acquire, without a finished download, e.g. when there was no job to start.
+
+        :return: None
+        """
+
+        with self._condition:
+            self.running -= 1
+            self._condition.notify_all()
+
+    def get_ratelimit(self) -> Optional[int]:
+        """
+        :return: int. The bytes per second of a single download, or None if the bandwidth is not limited
+        """
+
+        if not self.bandwidth_limit:
+            return None
+
+        with self._condition:
+            return int(self.bandwidth_limit / max(self.limit, self.running, 1))
+
+    def release(self, downloaded_bytes: int = 0, error: Optional[Exception] = None):
+        """
+        Records a finished download and adjusts the limit.
+
+        :param downloaded_bytes: int. The size of the downloaded file
+        :param error: Exception, optional. The error of the download, if it failed
+        :return: None
+        """
+
+        with self._condition:
+            self.running -= 1
+            self._round_jobs += 1
+            self._round_bytes += downloaded_bytes
+
+            if error is not None:
+                self._round_errors += 1
+
+            if self._throttled_in_flight > 0:
+                self._throttled_in_flight -= 1
+            elif is_throttled(error):
+                self._decrease()
+            elif self._round_jobs >= self.limit:
+                self._end_round()
+
+            self._condition.notify_all()
+
+    def _end_round(self):
+        elapsed = time.monotonic() - self._round_started_at
+        throughput = self._round_bytes / elapsed if elapsed > 0 else 0.0
+
+        if self._round_errors / self._round_jobs > self.max_error_rate:
+            self._decrease()
+            return
+
+        # Keep adding downloads only while they add throughput. When the uplink is saturated, more of them only
+        # split the same bandwidth
+        if throughput > self._last_throughput * (1 + self.min_gain):
+            self.limit = min(self.max_workers, self.limit + 1)
+
+        self._last_throughput = throughput
+        self._start_round()
+
+    def _decrease(self):
+        self.limit = max(self.min_workers, int(self.limit * self.decrease_factor))
+        self._throttled_in_flight = self.running
+        # The throughput of the smaller limit is measured from the start
+        self._last_throughput = 0.0
+        self._start_round()
+
+    def _start_round(self):
+        self._round_started_at = time.monotonic()
+        self._round_bytes = 0
+        self._round_jobs = 0
+        self._round_errors = 0
+
+    def stats(self) -> dict:
+        with self._condition:
+            return {'limit': self.limit, 'running': self.running, 'throughput': round(self._last_throughput)}
@@ -1,5 +1,6 @@
 import tkinter as tk
 from tkinter import ttk
+from typing import Callable, List, Optional, Sequence
 
 
 class ScrollableFrame(tk.Frame):
@@ -49,6 +50,183 @@ class ScrollableFrame(tk.Frame):
         self.canvas.xview_scroll((event.delta // 80), "units")
 
 
+class VirtualScrollableFrame(ScrollableFrame):
+    """
+    A ScrollableFrame for long lists of selectable rows. Only enough rows to fill the visible area are created, and
+    they are reused to show different items while scrolling. The selection of the items is kept in a bytearray,
+    instead of one Tk variable per item, so rendering any number of items takes the same time and memory.
+    """
+
+    def __init__(self, container, row_height: int = 24, on_toggle: Callable[[int, bool], None] = None,
+                 *args, on_near_end: Callable[[], None] = None, near_end_rows: int = 20, **kwargs):
+        """
+        :param container: The parent widget
+        :param row_height: int. The height of a row in pixels
+        :param on_toggle: function, optional. Called with the index of the item and its new selection state, when the
+        user checks or unchecks a row
+        :param on_near_end: function, optional. Called when the user scrolls near the end of the items, e.g. to append
+        the next page of them. It is called once for every length of the items
+        :param near_end_rows: int. The number of items below the visible rows, at which on_near_end is called
+        """
+
+        super().__init__(container, *args, **kwargs)
+
+        self.row_height = row_height
+        self.on_toggle = on_toggle or (lambda index, is_selected: None)
+        self.on_near_end = on_near_end
+        self.near_end_rows = near_end_rows
+        # The length of the items, when on_near_end was last called
+        self._near_end_length: Optional[int] = None
+
+        self.items: Sequence = []
+        self.get_text: Callable[[object], str] = str
+        # The selection state of every item, 1 for selected
+        self.selected = bytearray()
+        # The index of the item in the first row
+        self.offset = 0
+
+        # The reusable row widgets: the frame, the checkbutton's variable and the label of every row
+        self.rows: List[tuple] = []
+
+        # The vertical scrolling is done by changing the items shown in the rows, not by moving the canvas
+        self.canvas.configure(yscrollcommand='')
+        self.scrollbar_y.configure(command=self.yview)
+        self.canvas.bind('<Configure>', lambda e: self.render(), add='+')
+
+    def set_items(self, items: Sequence, get_text: Callable[[object], str] = str,
+                  is_selected: Optional[Callable[[object], bool]] = None):
+        """
+        :param items: sequence of the items. They are read only when they are shown
+        :param get_text: function, which returns the text shown for an item
+        :param is_selected: function, optional. Returns the initial selection state of an item. If it is not filled,
+        no items are selected
+        :return: None
+        """
+
+        self.items = items
+        self.get_text = get_text
+
+        if is_selected is None:
+            self.selected = bytearray(len(items))
+        else:
+            self.selected = bytearray(int(is_selected(item)) for item in items)
+
+        self.offset = 0
+        self._near_end_length = None
+
+        self.render()
+
+    def append_items(self, items: Sequence, is_selected: Optional[Callable[[object], bool]] = None):
+        """
+        :param items: sequence of the items, which are added to the end of the list. The list passed to set_items
+        must be extendable
+        :param is_selected: function, optional. Returns the initial selection state of an item, as in set_items
+        :return: None
+        """
+
+        self.items.extend(items)
+
+        if is_selected is None:
+            self.selected.extend(bytes(len(items)))
+        else:
+            self.selected.extend(int(is_selected(item)) for item in items)
+
+        self.render()
+
+    def update_selection(self, is_selected: Callable[[object], bool]):
+        """
+        :param is_selected: function. Returns the new selection state of an item
+        :return: None
+        """
+
+        self.selected = bytearray(int(is_selected(item)) for item in self.items)
+        self.render()
+
+    def set_all(self, is_selected: bool):
+        self.selected = bytearray([int(is_selected)]) * len(self.items)
+        self.render()
+
+    def visible_rows(self) -> int:
+        # One more row than fits, so a partially visible row at the bottom is rendered too
+        height = max(self.canvas.winfo_height(), self.row_height)
+        return height // self.row_height + 1
+
+    def render(self):
+        # Create more rows if the visible area has grown
+        while len(self.rows) < self.visible_rows():
+            self._create_row(len(self.rows))
+
+        self.offset = max(0, min(self.offset, len(self.items) - self.visible_rows() + 1))
+
+        # Show the visible items in the rows and hide the unused rows
+        for row_index, (frame, is_selected, label) in enumerate(self.rows):
+            index = self.offset + row_index
+
+            if index < len(self.items):
+                is_selected.set(bool(self.selected[index]))
+                label.configure(text=self.get_text(self.items[index]))
+                frame.grid(row=row_index, column=0, sticky='we')
+            else:
+                frame.grid_remove()
+
+        self._update_scrollbar()
+
+        # Ask for more items once, when the last of them are about to be shown
+        remaining = len(self.items) - self.offset - self.visible_rows()
+        if self.on_near_end is not None and remaining < self.near_end_rows and \
+                self._near_end_length != len(self.items):
+            self._near_end_length = len(self.items)
+            # After the rendering, as the callback may append the items and render again
+            self.after_idle(self.on_near_end)
+
+    def yview(self, *args):
+        # Handle the commands of the vertical scrollbar: ('moveto', fraction) and ('scroll', number, 'units'/'pages')
+        if args[0] == 'moveto':
+            self.offset = int(float(args[1]) * len(self.items))
+        elif args[0] == 'scroll':
+            step = self.visible_rows() - 1 if args[2] == 'pages' else 1
+            self.offset += int(args[1]) * step
+
+        self.render()
+
+    def on_mouse_wheel(self, event):
+        # Use the sign of event.delta to determine scroll direction
+        self.yview('scroll', -1 * (event.delta // 80), 'units')
+
+    def _create_row(self, row_index: int):
+        frame = tk.Frame(self.scrollable_frame, height=self.row_height)
+        is_selected = tk.BooleanVar()
+
+        ttk.Checkbutton(
+            frame,
+            variable=is_selected,
+            command=lambda: self._toggle(row_index, is_selected.get()),
+        ).grid(row=0, column=0, sticky='w')
+
+        label = ttk.Label(frame)
+        label.grid(row=0, column=1, sticky='we')
+
+        # Use the real height of the row, if it is greater, so the visible rows are counted correctly
+        frame.update_idletasks()
+        self.row_height = max(self.row_height, frame.winfo_reqheight())
+
+        self.rows.append((frame, is_selected, label))
+
+    def _toggle(self, row_index: int, is_selected: bool):
+        index = self.offset + row_index
+        self.selected[index] = int(is_selected)
+        self.on_toggle(index, is_selected)
+
+    def _update_scrollbar(self):
+        total = len(self.items)
+
+        if total == 0:
+            self.scrollbar_y.set(0, 1)
+            return
+
+        self.scrollbar_y.set(self.offset / total, min(1.0, (self.offset + self.visible_rows()) / total))
+
+
 # Test code
 if __name__ == "__main__":
     root = tk.Tk()
@@ -0,0 +1,184 @@
+import re
+from array import array
+from bisect import bisect_right
+from collections import Counter, defaultdict
+from typing import Callable, Dict, Generic, List, Optional, Sequence, Set, TypeVar
+
+T = TypeVar('T')
+
+WORD_PATTERN = re.compile(r'\w+')
+# The minimum trigram similarity of a word to be counted as a fuzzy match of a searched word
+FUZZY_CUTOFF = 0.25
+# The maximum number of similar words taken for every searched word
+FUZZY_WORDS = 20
+
+
+def get_trigrams(word: str) -> Set[str]:
+    # Pad the word, so short words have trigrams, and the beginning and the end of the word weigh more
+    padded = f'  {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TitleIndex(Generic[T]):
+    """
+    An in-memory index of the titles of the loaded bookmarks, for searching while the user types. The results are in
+    the order of the indexed items, so the ordering of the loaded bookmarks is preserved.
+    """
+
+    def __init__(self, items: Sequence[T], get_text: Callable[[T], str]):
+        """
+        :param items: sequence of the items, e.g. Bookmark objects, in the order the results are returned
+        :param get_text: function, which returns the indexed text of an item, e.g. the title of a bookmark
+        """
+
+        self.items = items
+
+        # All lowercase titles in a single string, one per line, so a substring search is a single str.find
+        # running in C, instead of a loop over the titles
+        lower_texts = [get_text(item).lower().replace('\n', ' ') for item in items]
+        self.text = '\n'.join(lower_texts)
+
+        # The position of every title in the text
+        self.starts = array('q')
+        position = 0
+        for text in lower_texts:
+            self.starts.append(position)
+            position += len(text) + 1
+
+        # The word index for the fuzzy search is built on its first use
+        self._word_items: Optional[Dict[str, array]] = None
+        self._word_trigrams: Optional[Dict[str, List[str]]] = None
+
+    def __len__(self):
+        return len(self.items)
+
+    def search(self, query: str, limit: Optional[int] = None) -> List[T]:
+        """
+        :param query: str. The items, whose text contains it case insensitively, are returned. If it is empty, all
+        items are returned
+        :param limit: int, optional. The maximum number of items returned
+        :return: list of the items in the indexed order
+        """
+
+        query = query.lower()
+
+        if not query:
+            return list(self.items[:limit] if limit else self.items)
+
+        # A title can't contain a new line
+        if '\n' in query:
+            return []
+
+        results = []
+        text = self.text
+        starts = self.starts
+        position = 0
+
+        while True:
+            position = text.find(query, position)
+
+            if position < 0:
+                break
+
+            index = bisect_right(starts, position) - 1
+            results.append(self.items[index])
+
+            if limit and len(results) >= limit:
+                break
+
+            # Continue from the next title, so every item is returned once
+            position = starts[index + 1] if index + 1 < len(starts) else len(text)
+
+        return results
+
+    def fuzzy_search(self, query: str, limit: Optional[int] = None) -> List[T]:
+        """
+        Finds the items with words similar to the words of the query, e.g. with typos, and ranks them by similarity.
+
+        :param query: str. The searched words
+        :param limit: int, optional. The maximum number of items returned
+        :return: list of the items, the most similar first. Equally similar items are in the indexed order
+        """
+
+        query_words = [w for w in WORD_PATTERN.findall(query.lower()) if not w.isdigit()]
+
+        if not query_words:
+            return self.search('', limit)
+
+        self._build_word_index()
+
+        scores: Dict[int, float] = defaultdict(float)
+
+        for query_word in query_words:
+            # The similar words are the most similar first, so every item is scored once by its best word
+            scored: Set[int] = set()
+
+            for word, similarity in self._similar_words(query_word):
+                new = set(self._word_items[word]) - scored
+                scored |= new
+
+                for index in new:
+                    scores[index] += similarity
+
+        ranked = sorted(scores, key=lambda index: (-scores[index], index))
+
+        if limit:
+            ranked = ranked[:limit]
+
+        return [self.items[index] for index in ranked]
+
+    def _similar_words(self, query_word: str) -> List[tuple]:
+        """
+        :param query_word: str. A lowercase word of the query
+        :return: list of (word, similarity) tuples of the indexed words most similar to the query word
+        """
+
+        query_trigrams = get_trigrams(query_word)
+        shared = Counter()
+
+        # Count the trigrams, which every indexed word shares with the query word
+        for trigram in query_trigrams:
+            for word in self._word_trigrams.get(trigram, ()):
+                shared[word] += 1
+
+        similar = []
+        for word, count in shared.items():
+            # Jaccard similarity of the trigram sets
+            similarity = count / (len(query_trigrams) + len(get_trigrams(word)) - count)
+
+            # A word starting with the query word is always a match, so the results don't disappear while typing
+            if word.startswith(query_word):
+                similarity = max(similarity, 0.9 if word != query_word else 1.0)
+
+            if similarity >= FUZZY_CUTOFF:
+                similar.append((word, similarity))
+
+        similar.sort(key=lambda x: -x[1])
+
+        return similar[:FUZZY_WORDS]
+
+    def _build_word_index(self):
+        if self._word_items is not None:
+            return
+
+        word_items: Dict[str, array] = {}
+
+        for index, text in enumerate(self.text.split('\n')):
+            for word in set(WORD_PATTERN.findall(text)):
+                # Numbers are not matched fuzzily
+                if word.isdigit():
+                    continue
+
+                items = word_items.get(word)
+                if items is None:
+                    items = word_items[word] = array('q')
+                items.append(index)
+
+        # The trigrams of the distinct words only, so the index is much smaller than a trigram index of the titles
+        word_trigrams: Dict[str, List[str]] = defaultdict(list)
+        for word in word_items:
+            for trigram in get_trigrams(word):
+                word_trigrams[trigram].append(word)
+
+        self._word_items = word_items
+        self._word_trigrams = dict(word_trigrams)
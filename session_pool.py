@@ -0,0 +1,214 @@
+import json
+import threading
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, List, Optional
+
+if TYPE_CHECKING:
+    import yt_dlp
+
+# The options, which change with every download, so they are not part of the profile of a session
+PER_DOWNLOAD_OPTIONS = ('ratelimit', 'progress_hooks', 'postprocessor_hooks')
+
+
+def create_downloader(options: dict) -> 'yt_dlp.YoutubeDL':
+    """
+    yt_dlp loads hundreds of extractor modules, so it is imported with the first download, not at startup.
+
+    :param options: dict. The yt_dlp options
+    :return: yt_dlp.YoutubeDL
+    """
+
+    import yt_dlp
+
+    return yt_dlp.YoutubeDL(options)
+
+
+def get_profile(options: dict) -> str:
+    """
+    :param options: dict. The yt_dlp options of a download
+    :return: str. The key of the sessions, which can be reused for the options
+    """
+
+    return json.dumps({k: v for k, v in options.items() if k not in PER_DOWNLOAD_OPTIONS}, sort_keys=True, default=str)
+
+
+class DownloadSession:
+    """
+    A long-lived yt_dlp.YoutubeDL, which keeps its extractors, cookies and HTTP connections between the downloads.
+    It is used by a single thread at a time.
+    """
+
+    def __init__(self, options: dict):
+        """
+        :param options: dict. The yt_dlp options of the profile
+        """
+
+        # yt_dlp takes the hooks only when it is created, so they are set once and forward to the current download
+        self.progress_hooks: List[Callable[[dict], None]] = []
+        self.postprocessor_hooks: List[Callable[[dict], None]] = []
+
+        self.ydl = create_downloader({
+            **options,
+            'progress_hooks': [lambda data: self._forward(self.progress_hooks, data)],
+            'postprocessor_hooks': [lambda data: self._forward(self.postprocessor_hooks, data)],
+        })
+
+    def warm_up(self):
+        # Create the YouTube extractor, which is otherwise created by the first download
+        self.ydl.get_info_extractor('Youtube')
+
+    def configure(self, options: dict):
+        """
+        Sets the options of the next download.
+
+        :param options: dict. The yt_dlp options of the download. Only the ones in PER_DOWNLOAD_OPTIONS are applied
+        """
+
+        self.progress_hooks = list(options.get('progress_hooks', []))
+        self.postprocessor_hooks = list(options.get('postprocessor_hooks', []))
+
+        # yt_dlp reads the ratelimit from its params at the start of every download
+        if options.get('ratelimit'):
+            self.ydl.params['ratelimit'] = options['ratelimit']
+        else:
+            self.ydl.params.pop('ratelimit', None)
+
+    def close(self):
+        self.ydl.close()
+
+    @staticmethod
+    def _forward(hooks: List[Callable[[dict], None]], data: dict):
+        for hook in hooks:
+            hook(data)
+
+
+class SessionPool:
+    """
+    Keeps a few idle sessions for every option profile (e.g. mp3 or mkv and the output directory). The workers borrow
+    a session for a download and return it afterwards, so the setup of yt_dlp is paid once per session, not once per
+    download.
+    """
+
+    def __init__(self, max_idle: int = 4):
+        """
+        :param max_idle: int. The maximum number of idle sessions per profile. The sessions above it are closed when
+        they are returned
+        """
+
+        self.max_idle = max_idle
+        self._idle: Dict[str, List[DownloadSession]] = {}
+        # The number of borrowed sessions of every profile
+        self._borrowed: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._closed = False
+        # The number of created sessions and of the downloads, which reused a session
+        self.created = 0
+        self.reused = 0
+
+    def prewarm(self, options: dict, count: int = 1):
+        """
+        Creates and warms up idle sessions for the options, e.g. in a background thread before a batch starts.
+
+        :param options: dict. The yt_dlp options of the following downloads
+        :param count: int. The number of sessions. The idle and the borrowed sessions of the profile count too
+        :return: None
+        """
+
+        profile = get_profile(options)
+
+        # The sessions are created one by one, as the downloads, which start meanwhile, create their own
+        while True:
+            with self._lock:
+                if self._closed or len(self._idle.get(profile, [])) + self._borrowed.get(profile, 0) >= \
+                        min(count, self.max_idle):
+                    return
+
+            session = self._create(options)
+            session.warm_up()
+            self._return(profile, session)
+
+    @contextmanager
+    def borrow(self, options: dict) -> Iterator['yt_dlp.YoutubeDL']:
+        """
+        :param options: dict. The yt_dlp options of the download
+        :return: context manager, which gives a configured yt_dlp.YoutubeDL, and takes it back at the exit
+        """
+
+        profile = get_profile(options)
+
+        with self._lock:
+            idle = self._idle.get(profile)
+            session = idle.pop() if idle else None
+
+            if session is not None:
+                self.reused += 1
+
+            self._borrowed[profile] = self._borrowed.get(profile, 0) + 1
+
+        if session is None:
+            session = self._create(options)
+
+        session.configure(options)
+
+        try:
+            yield session.ydl
+        finally:
+            # Don't keep the hooks of the finished download
+            session.configure({})
+
+            with self._lock:
+                self._borrowed[profile] -= 1
+
+            self._return(profile, session)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            sessions = [s for idle in self._idle.values() for s in idle]
+            self._idle.clear()
+
+        for session in sessions:
+            session.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'created': self.created,
+                'reused': self.reused,
+                'idle': sum(len(idle) for idle in self._idle.values()),
+            }
+
+    def _create(self, options: dict) -> DownloadSession:
+        session = DownloadSession({k: v for k, v in options.items() if k not in PER_DOWNLOAD_OPTIONS})
+
+        with self._lock:
+            self.created += 1
+
+        return session
+
+    def _return(self, profile: str, session: DownloadSession):
+        with self._lock:
+            idle = self._idle.setdefault(profile, [])
+
+            if not self._closed and len(idle) < self.max_idle:
+                idle.append(session)
+                return
+
+        session.close()
+
+
+@contextmanager
+def borrow_downloader(options: dict, pool: Optional[SessionPool] = None) -> Iterator['yt_dlp.YoutubeDL']:
+    """
+    :param options: dict. The yt_dlp options of the download
+    :param pool: SessionPool, optional. If it is not filled, a new yt_dlp.YoutubeDL is created and closed
+    :return: context manager, which gives a configured yt_dlp.YoutubeDL
+    """
+
+    if pool is None:
+        with create_downloader(options) as ydl:
+            yield ydl
+        return
+
+    with pool.borrow(options) as ydl:
+        yield ydl
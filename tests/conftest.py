@@ -0,0 +1,45 @@
+import os
+import sys
+import time
+import types
+
+import pytest
+
+# The modules are at the root of the repository
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fake_yt_dlp import FakeYoutubeDL
+
+
+class StubYoutubeDL(FakeYoutubeDL):
+    """
+    A fast stand-in for yt_dlp.YoutubeDL. The videos, whose url contains 'unavailable', fail to extract, and the ones,
+    whose url contains 'slow', take five times longer.
+    """
+
+    latency = 0.1
+    bandwidth = 100 * 2 ** 20
+    file_size = 2 ** 20
+
+    def extract_info(self, url: str, download=True, process=True) -> dict:
+        if 'unavailable' in url:
+            raise Exception(f'ERROR: [youtube] {url}: Video unavailable')
+
+        if 'slow' in url:
+            time.sleep(4 * self.latency)
+
+        return super().extract_info(url, download, process)
+
+
+@pytest.fixture
+def stub_yt_dlp(monkeypatch):
+    """
+    :return: the stub class, which 'import yt_dlp' returns as yt_dlp.YoutubeDL during the test
+    """
+
+    module = types.ModuleType('yt_dlp')
+    module.YoutubeDL = StubYoutubeDL
+    monkeypatch.setitem(sys.modules, 'yt_dlp', module)
+
+    return StubYoutubeDL
@@ -0,0 +1,229 @@
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+
+import pytest
+
+from bookmark import Bookmark
+from job_queue import DONE, FAILED, PENDING, RUNNING, JobQueue
+
+# Short leases, so the tests don't wait for the default 30 seconds
+LEASE_SECONDS = 0.3
+
+# A worker process, which downloads the jobs of the queue with the fake yt_dlp and ffmpeg of the benchmarks
+WORKER_SCRIPT = '''
+import sys
+
+sys.path.insert(0, {root!r})
+
+from benchmarks import fake_yt_dlp
+
+fake_yt_dlp.install({shims!r}, 0.0)
+fake_yt_dlp.FakeYoutubeDL.latency = 0.02
+fake_yt_dlp.FakeYoutubeDL.file_size = 2 ** 20
+fake_yt_dlp.FakeYoutubeDL.bandwidth = 100 * 2 ** 20
+
+from job_queue import JobQueue
+from pipeline import DownloadPipeline
+
+if __name__ == '__main__':
+    job_queue = JobQueue({path!r}, worker_id=sys.argv[1])
+    DownloadPipeline(network_workers=2, cpu_workers=1).run_queue(job_queue, lambda result: None, poll_interval=0.1)
+    job_queue.close()
+'''
+
+
+def get_bookmarks(count: int):
+    return [Bookmark(f'Video {i}', f'https://www.youtube.com/watch?v=video{i:06}', None) for i in range(count)]
+
+
+def get_state(path: str, job_id: int) -> str:
+    with sqlite3.connect(path) as connection:
+        return connection.execute('SELECT state FROM jobs WHERE id = ?', (job_id,)).fetchone()[0]
+
+
+@pytest.fixture
+def queue_path(tmp_path):
+    return str(tmp_path / 'job_queue.sqlite')
+
+
+@pytest.fixture
+def two_workers(queue_path):
+    worker_a = JobQueue(queue_path, lease_seconds=LEASE_SECONDS, worker_id='A', base_delay=0.0)
+    worker_b = JobQueue(queue_path, lease_seconds=LEASE_SECONDS, worker_id='B', base_delay=0.0)
+
+    yield worker_a, worker_b
+
+    worker_a.close()
+    worker_b.close()
+
+
+def test_every_job_is_claimed_once(two_workers):
+    worker_a, worker_b = two_workers
+
+    assert worker_a.add(get_bookmarks(3), 'mp3') == 3
+    # The same urls in the same format are not added again
+    assert worker_b.add(get_bookmarks(3), 'mp3') == 0
+
+    jobs = [worker_a.claim(), worker_b.claim(), worker_a.claim()]
+
+    assert sorted(job.id for job in jobs) == [1, 2, 3]
+    assert worker_b.claim() is None
+    assert worker_a.counts()[RUNNING] == 3
+
+
+def test_heartbeat_keeps_the_lease(two_workers):
+    worker_a, worker_b = two_workers
+    worker_a.add(get_bookmarks(1), 'mp3')
+    job = worker_a.claim()
+
+    for _ in range(4):
+        time.sleep(LEASE_SECONDS / 3)
+        assert worker_a.heartbeat(running=1) == 1
+
+    assert worker_b.claim() is None
+    assert worker_a.complete(job, {'status': 'downloaded'})
+    assert worker_a.counts()[DONE] == 1
+
+
+def test_expired_lease_is_taken_over(two_workers):
+    worker_a, worker_b = two_workers
+    worker_a.add(get_bookmarks(1), 'mp3')
+    job_a = worker_a.claim()
+
+    # A stops sending heartbeats, so B takes over the job after its lease expired
+    assert worker_b.claim() is None
+    time.sleep(LEASE_SECONDS * 1.5)
+    job_b = worker_b.claim()
+
+    assert job_b.id == job_a.id
+    assert job_b.attempts == 2
+
+    assert not worker_a.complete(job_a, {'status': 'downloaded', 'worker': 'A'})
+    assert job_a.lease_lost
+    assert get_state(worker_a.path, job_a.id) == RUNNING
+
+    assert worker_b.complete(job_b, {'status': 'downloaded', 'worker': 'B'})
+    assert not job_b.lease_lost
+    assert get_state(worker_a.path, job_a.id) == DONE
+
+    # Only the result of the worker, which held the lease, is recorded
+    assert [(worker, result['worker']) for _, worker, result in worker_a.results()] == [('B', 'B')]
+
+
+def test_fail_after_the_lease_expired(two_workers):
+    worker_a, worker_b = two_workers
+    worker_a.add(get_bookmarks(1), 'mp3')
+    job_a = worker_a.claim()
+
+    time.sleep(LEASE_SECONDS * 1.5)
+    job_b = worker_b.claim()
+
+    assert worker_a.will_retry(job_a)
+    assert not worker_a.fail(job_a, Exception('HTTP Error 503'))
+    assert job_a.lease_lost
+    assert get_state(worker_a.path, job_a.id) == RUNNING
+    assert worker_a.results() == []
+
+    assert worker_b.fail(job_b, Exception('HTTP Error 503'))
+    assert get_state(worker_a.path, job_b.id) == PENDING
+
+
+def test_expired_leases_count_as_attempts(queue_path):
+    job_queue = JobQueue(queue_path, max_attempts=2, lease_seconds=LEASE_SECONDS)
+    job_queue.add(get_bookmarks(1), 'mp3')
+
+    # A job, whose workers keep crashing, is not claimed forever
+    for attempt in (1, 2):
+        assert job_queue.claim().attempts == attempt
+        time.sleep(LEASE_SECONDS * 1.5)
+
+    assert job_queue.recover() == 1
+    assert job_queue.claim() is None
+    assert job_queue.counts()[FAILED] == 1
+
+    job_queue.close()
+
+
+def test_failed_finish_is_rolled_back(two_workers):
+    worker_a, _ = two_workers
+    worker_a.add(get_bookmarks(1), 'mp3')
+    job = worker_a.claim()
+
+    # The counters of the worker can't be updated, so the whole transaction fails
+    with sqlite3.connect(worker_a.path) as connection:
+        connection.execute('DROP TABLE workers')
+
+    with pytest.raises(sqlite3.OperationalError):
+        worker_a.complete(job, {'status': 'downloaded'})
+
+    assert get_state(worker_a.path, job.id) == RUNNING
+    assert worker_a.results() == []
+    # The connection is not left in a transaction, so the queue is still usable
+    assert worker_a.counts()[RUNNING] == 1
+
+
+def test_queue_without_leases_is_migrated(queue_path):
+    with sqlite3.connect(queue_path) as connection:
+        connection.execute("""
+            CREATE TABLE jobs (
+                id INTEGER PRIMARY KEY,
+                url TEXT NOT NULL,
+                title TEXT NOT NULL,
+                format TEXT NOT NULL,
+                output_path TEXT NOT NULL,
+                state TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                next_attempt_at REAL NOT NULL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                UNIQUE (url, format)
+            )
+        """)
+        connection.execute(
+            "INSERT INTO jobs (url, title, format, output_path, state, attempts, next_attempt_at, created_at, "
+            "updated_at) VALUES ('https://www.youtube.com/watch?v=video000000', 'Video', 'mp3', 'Downloads', ?, 1, 0, "
+            "0, 0)", (RUNNING,)
+        )
+
+    # The job, which was running without a lease, is returned to the queue at once
+    job_queue = JobQueue(queue_path)
+    job = job_queue.claim()
+
+    assert job.attempts == 2
+    assert job_queue.complete(job)
+
+    job_queue.close()
+
+
+def test_worker_processes_share_the_queue(queue_path, tmp_path):
+    job_queue = JobQueue(queue_path)
+    job_queue.add(get_bookmarks(30), 'audio', str(tmp_path / 'Downloads'))
+
+    script_path = tmp_path / 'worker.py'
+    script_path.write_text(WORKER_SCRIPT.format(
+        root=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), shims=str(tmp_path / 'shims'),
+        path=queue_path
+    ))
+
+    workers = [
+        subprocess.Popen([sys.executable, str(script_path), f'worker-{i}'], cwd=str(tmp_path)) for i in range(3)
+    ]
+
+    for worker in workers:
+        assert worker.wait(120) == 0
+
+    assert job_queue.counts() == {PENDING: 0, RUNNING: 0, DONE: 30, FAILED: 0}
+
+    # Every job was downloaded by a single worker
+    results = job_queue.results()
+    assert len(results) == 30
+    assert all(result['status'] == 'downloaded' for _, _, result in results)
+    assert len(os.listdir(tmp_path / 'Downloads')) == 30
+    assert sorted(worker['id'] for worker in job_queue.workers()) == ['worker-0', 'worker-1', 'worker-2']
+    assert sum(worker['completed'] for worker in job_queue.workers()) == 30
+
+    job_queue.close()
@@ -0,0 +1,45 @@
+import random
+
+from benchmarks import synthetic
+from bookmark import is_youtube_url
+from loaders import ChromeLoader, FirefoxLoader
+
+# The url variants, which the bookmarks of every browser may have
+URLS = [
+    'https://www.youtube.com/watch?v={index:011d}',
+    'https://youtu.be/{index:011d}',
+    'https://m.youtube.com/shorts/{index:011d}',
+    'https://music.youtube.com/watch?v={index:011d}',
+    'https://example.com/articles/{index}',
+    'https://example.com/share?url=https://www.youtube.com/watch?v={index:011d}',
+    'https://notyoutube.com/watch?v={index:011d}',
+]
+
+
+def generate_url(rng: random.Random, index: int) -> str:
+    return URLS[index % len(URLS)].format(index=index)
+
+
+def test_is_youtube_url():
+    assert is_youtube_url('https://youtu.be/dQw4w9WgXcQ')
+    assert is_youtube_url('https://www.YouTube.com:443/watch?v=dQw4w9WgXcQ')
+    assert not is_youtube_url('https://example.com/share?url=https://www.youtube.com/')
+    assert not is_youtube_url('https://youtube.com.example.com/')
+    assert not is_youtube_url('https://notyoutube.com/')
+
+
+def test_browsers_keep_the_same_bookmarks(monkeypatch, tmp_path):
+    monkeypatch.setattr(synthetic, 'generate_url', generate_url)
+    synthetic.generate_chrome_bookmarks(str(tmp_path / 'chrome'), 70, folder_size=10)
+    synthetic.generate_places_sqlite(str(tmp_path / 'firefox'), 70, folder_size=10)
+
+    chrome_loader = ChromeLoader()
+    chrome_loader.path_to_bookmarks = str(tmp_path / 'chrome')
+    firefox_loader = FirefoxLoader()
+    firefox_loader.path_to_bookmarks = str(tmp_path / 'firefox')
+
+    chrome_urls = sorted(b.url for b in chrome_loader.load_bookmarks())
+    firefox_urls = sorted(b.url for b in firefox_loader.load_bookmarks())
+
+    assert chrome_urls == firefox_urls
+    assert chrome_urls == sorted(generate_url(None, i) for i in range(70) if i % len(URLS) < 4)
@@ -0,0 +1,102 @@
+import time
+
+from bookmark import Bookmark
+from download_manager import DownloadManager
+from job_queue import DONE, FAILED, JobQueue
+from pipeline import DownloadPipeline
+
+
+def get_bookmarks(video_ids):
+    return [
+        Bookmark(f'Video {video_id}', f'https://www.youtube.com/watch?v={video_id}', None) for video_id in video_ids
+    ]
+
+
+VIDEO_IDS = [f'video{i:06}' for i in range(8)]
+
+
+def test_run_downloads_in_parallel(stub_yt_dlp, tmp_path):
+    reported = []
+
+    started_at = time.perf_counter()
+    results = DownloadPipeline(network_workers=4, cpu_workers=1).run(
+        get_bookmarks(VIDEO_IDS), 'mkv', reported.append, str(tmp_path)
+    )
+    elapsed = time.perf_counter() - started_at
+
+    assert len(results) == 8
+    assert all(r.status == 'downloaded' for r in results)
+    assert sorted(r.title for r in results) == [f'Video {video_id}' for video_id in VIDEO_IDS]
+    assert sorted(path.name for path in tmp_path.iterdir()) == [f'Video {video_id}.mkv' for video_id in VIDEO_IDS]
+    # Two rounds of four downloads, not eight downloads one after another
+    assert elapsed < 8 * stub_yt_dlp.latency * 0.75
+
+
+def test_results_are_reported_in_order_of_completion(stub_yt_dlp, tmp_path):
+    reported = []
+
+    # The first video takes longer than all the others together
+    results = DownloadPipeline(network_workers=4, cpu_workers=1).run(
+        get_bookmarks(['slowvideo00'] + VIDEO_IDS[:3]), 'mkv', reported.append, str(tmp_path)
+    )
+
+    assert [r.bookmark.video_id for r in results] == [r.bookmark.video_id for r in reported]
+    assert results[-1].bookmark.video_id == 'slowvideo00'
+
+
+def test_failed_download_does_not_stop_the_batch(stub_yt_dlp, tmp_path):
+    video_ids = VIDEO_IDS[:2] + ['unavailable'] + VIDEO_IDS[2:4]
+
+    results = DownloadPipeline(network_workers=2, cpu_workers=1).run(
+        get_bookmarks(video_ids), 'mkv', lambda result: None, str(tmp_path)
+    )
+
+    assert sorted(r.status for r in results) == ['downloaded'] * 4 + ['failed']
+
+    failed = next(r for r in results if not r.succeeded)
+    assert failed.bookmark.video_id == 'unavailable'
+    assert 'Video unavailable' in str(failed)
+
+
+def test_every_video_is_downloaded_once(stub_yt_dlp, tmp_path):
+    bookmarks = get_bookmarks(VIDEO_IDS[:3]) + [
+        Bookmark('Short link', f'https://youtu.be/{VIDEO_IDS[0]}', None),
+        Bookmark('With a timestamp', f'https://www.youtube.com/watch?v={VIDEO_IDS[1]}&t=42', None),
+    ]
+
+    results = DownloadPipeline(network_workers=2, cpu_workers=1).run(
+        bookmarks, 'mkv', lambda result: None, str(tmp_path)
+    )
+
+    assert sorted(r.bookmark.video_id for r in results) == VIDEO_IDS[:3]
+
+
+def test_run_queue_retries_the_failed_jobs(stub_yt_dlp, tmp_path):
+    job_queue = JobQueue(str(tmp_path / 'job_queue.sqlite'), max_attempts=2, base_delay=0.0)
+    job_queue.add(get_bookmarks(VIDEO_IDS[:3] + ['unavailable']), 'mkv', str(tmp_path / 'Downloads'))
+    reported = []
+
+    results = DownloadPipeline(network_workers=2, cpu_workers=1).run_queue(job_queue, reported.append,
+                                                                            poll_interval=0.1)
+
+    assert results == reported
+    assert sorted(r.status for r in results) == ['downloaded'] * 3 + ['failed', 'retrying']
+    assert job_queue.counts()[DONE] == 3
+    assert job_queue.counts()[FAILED] == 1
+    assert len(job_queue.results()) == 5
+
+    job_queue.close()
+
+
+def test_manager_skips_the_downloaded_videos(stub_yt_dlp, tmp_path):
+    manager = DownloadManager(str(tmp_path / 'settings.txt'), data_dir=str(tmp_path / 'data'))
+    output_path = str(tmp_path / 'Downloads')
+
+    first = manager.download(get_bookmarks(VIDEO_IDS[:3]), 'mkv', output_path=output_path, concurrency=2)
+    second = manager.download(get_bookmarks(VIDEO_IDS[:4]), 'mkv', output_path=output_path, concurrency=2)
+
+    manager.close()
+
+    assert [r.status for r in first] == ['downloaded'] * 3
+    assert sorted(r.status for r in second) == ['downloaded'] + ['skipped'] * 3
+    assert sorted(r.bookmark.video_id for r in second if r.skipped) == VIDEO_IDS[:3]
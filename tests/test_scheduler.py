@@ -0,0 +1,113 @@
+import threading
+import urllib.error
+
+import pytest
+
+from benchmarks.scheduler import ThrottlingServer, download, run_batch
+from scheduler import AdaptiveScheduler, TokenBucket, is_throttled
+
+
+@pytest.fixture
+def throttling_server():
+    # 2 downloads at the same time, every one of 256 KiB at 2 MiB/s
+    server = ThrottlingServer(8 * 2 ** 20, 2 * 2 ** 20, 2, 256 * 2 ** 10)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    yield server
+
+    server.shutdown()
+    server.server_close()
+
+
+def test_is_throttled():
+    assert is_throttled(Exception('HTTP Error 429: Too Many Requests'))
+    assert is_throttled(Exception('ERROR: rate-limit reached'))
+    assert not is_throttled(Exception('HTTP Error 404: Not Found'))
+    assert not is_throttled(None)
+
+
+def test_throttling_halves_the_limit():
+    scheduler = AdaptiveScheduler(8, max_workers=8)
+
+    for _ in range(8):
+        scheduler.acquire()
+
+    scheduler.release(error=Exception('HTTP Error 429: Too Many Requests'))
+    assert scheduler.limit == 4
+
+    # The other downloads were started with the previous limit, so their throttling doesn't decrease it again
+    for _ in range(7):
+        scheduler.release(error=Exception('HTTP Error 429: Too Many Requests'))
+
+    assert scheduler.limit == 4
+    assert scheduler.running == 0
+
+
+def test_limit_stays_within_bounds():
+    scheduler = AdaptiveScheduler(2, min_workers=2, max_workers=3)
+
+    scheduler.acquire()
+    scheduler.release(error=Exception('429'))
+    assert scheduler.limit == 2
+
+    # Every round of successful downloads adds throughput from zero, so the limit grows up to its maximum
+    for _ in range(10):
+        for _ in range(scheduler.limit):
+            scheduler.acquire()
+        for _ in range(scheduler.limit):
+            scheduler.release(2 ** 20)
+
+    assert scheduler.limit == 3
+
+
+def test_too_many_errors_decrease_the_limit():
+    scheduler = AdaptiveScheduler(4, max_workers=4)
+
+    for _ in range(4):
+        scheduler.acquire()
+    for _ in range(3):
+        scheduler.release(error=Exception('HTTP Error 404: Not Found'))
+    scheduler.release(2 ** 20)
+
+    assert scheduler.limit == 2
+
+
+def test_ratelimit_splits_the_bandwidth():
+    assert AdaptiveScheduler(4).get_ratelimit() is None
+
+    scheduler = AdaptiveScheduler(4, bandwidth_limit=8 * 2 ** 20)
+    assert scheduler.get_ratelimit() == 2 * 2 ** 20
+
+    scheduler.acquire()
+    scheduler.release(error=Exception('429'))
+    assert scheduler.running == 0
+    assert scheduler.get_ratelimit() == 4 * 2 ** 20
+
+
+def test_token_bucket_delays_after_the_burst():
+    bucket = TokenBucket(rate=10, burst=2)
+
+    assert bucket.take() == 0
+    assert bucket.take() == 0
+    assert bucket.take() == pytest.approx(0.1, abs=0.01)
+
+
+def test_scheduler_reduces_concurrency_when_the_server_throttles(throttling_server):
+    scheduler = AdaptiveScheduler(8, max_workers=8)
+    url = f'http://127.0.0.1:{throttling_server.server_address[1]}/video'
+
+    result = run_batch(url, 24, scheduler)
+
+    assert throttling_server.throttled > 0
+    assert result['final_limit'] < 8
+    assert scheduler.running == 0
+
+
+def test_download_raises_when_throttled(throttling_server):
+    throttling_server.max_connections = 0
+
+    with pytest.raises(urllib.error.HTTPError) as error:
+        download(f'http://127.0.0.1:{throttling_server.server_address[1]}/video', None)
+
+    assert error.value.code == 429
+    assert is_throttled(error.value)
@@ -1,26 +1,75 @@
-import json
-import yt_dlp
 import tkinter as tk
+from concurrent.futures import Future, ThreadPoolExecutor
 from tkinter import ttk, filedialog
-from typing import Optional, List
+from typing import TYPE_CHECKING, Dict, Iterator, Optional, List, Set, Tuple
 
-from bookmark import Bookmark
-from loaders import BookmarkLoader, FirefoxLoader, ChromeLoader
-from scrollable_frame import ScrollableFrame
+import batch_downloader
+from batch_downloader import DownloadResult
+from bookmark import Bookmark, deduplicate_bookmarks
+from download_manager import DownloadManager
+from job_queue import PENDING, RUNNING
+from message_bus import MessageBus, MessageLog, ProgressEvent
+from scrollable_frame import VirtualScrollableFrame
+from search_index import TitleIndex
+
+if TYPE_CHECKING:
+    from loaders import BookmarkLoader
 
 
 class YoutubeDownloader:
-    supported_browsers = {
-        'Mozilla Firefox': FirefoxLoader,
-        'Google Chrome': ChromeLoader,
-    }
+    supported_browsers = DownloadManager.supported_browsers
+    default_concurrency = DownloadManager.default_concurrency
+    default_connections = DownloadManager.default_connections
+    # Milliseconds after the last key press, before the loaded bookmarks are searched
+    search_delay = 150
+    # The number of bookmarks loaded at once, as the user scrolls down
+    page_size = 200
+    # Milliseconds between two checks, whether the index of all bookmarks is built
+    index_poll_interval = 100
 
     def __init__(self):
-        self.settings = self.load_settings()
-        self.loader: Optional[BookmarkLoader] = None
+        # The download core, which is shared with the headless command line
+        self.manager = DownloadManager()
+        self.settings = self.manager.settings
+        self.loader: Optional['BookmarkLoader'] = None
+        # All bookmarks loaded from the browser, and the index for searching them while the user types
+        self.loaded_bookmarks: List[Bookmark] = []
+        self.title_index: Optional[TitleIndex] = None
+        # All bookmarks and their index are built in the background, after the first page is shown
+        self.index_executor = ThreadPoolExecutor(max_workers=1)
+        self.index_future: Optional[Future] = None
+        # The shown bookmarks, which match the search
         self.bookmarks: List[Bookmark] = []
-        self.bookmarks_state: List[tk.BooleanVar] = []
+        # The pages of the shown bookmarks, which are not loaded yet, and the maximum number of shown bookmarks
+        self.pages: Optional[Iterator[List[Bookmark]]] = None
+        self.pages_limit: Optional[int] = None
+        # The search, the limit and the fuzzy flag of the shown bookmarks
+        self.listing: Optional[Tuple[str, str, bool]] = None
+        # The fuzzy search, which waits for the index, and the downloads, which wait for the selection to be resolved
+        self.pending_search: Optional[Tuple[str, str, bool]] = None
+        self.pending_downloads: List[Tuple[tk.Text, str]] = []
+        self.ascending = False
+        # The selected bookmarks by url. They stay selected when they are loaded again by another search, and they are
+        # downloaded even if they are not shown by the current search
+        self.selected_bookmarks: Dict[str, Bookmark] = {}
+        # The listing, whose bookmarks were all selected before all of its pages were loaded. Its bookmarks are taken
+        # from the index, when it is built, except the ones unselected in the meantime
+        self.select_all_listing: Optional[Tuple[str, str, bool]] = None
+        self.unselected_bookmarks: Set[str] = set()
+        self._search_job: Optional[str] = None
+        # The frame, where the loaded bookmarks are rendered
+        self.loaded_bookmarks_frame: Optional[VirtualScrollableFrame] = None
         self.all_selected = False
+        # Results and progress of the running batch downloads, posted by the workers and drained by the Tk main loop
+        self.message_bus = MessageBus()
+        # The messages shown in the message field. The oldest ones are removed, so the widget doesn't grow without bound
+        self.message_log = MessageLog()
+        # The latest progress of every running download, by url
+        self.progress: Dict[str, ProgressEvent] = {}
+        self.progress_text: Optional[tk.StringVar] = None
+        self.running_batches = 0
+        self.metadata_cache = self.manager.metadata_cache
+        self.download_archive = self.manager.download_archive
         self.root = tk.Tk()
         self.root.title('Youtube Downloader')
 
@@ -31,26 +80,14 @@ class YoutubeDownloader:
         return self.__loader
 
     @loader.setter
-    def loader(self, value: BookmarkLoader):
-        if value is not None:
+    def loader(self, value: 'BookmarkLoader'):
+        # The loaders of the discovered profiles already have their paths
+        if value is not None and not value.path_to_bookmarks:
             value.path_to_bookmarks = self.settings.get(str(value))
         self.__loader = value
 
-    @staticmethod
-    def load_settings():
-        try:
-            with open('settings.txt') as file:
-                # Parse the JSON data as dictionary
-                settings = json.loads(file.read())
-
-                return settings
-        except FileNotFoundError:
-            return {}
-
     def save_settings(self):
-        with open('settings.txt', 'w') as file:
-            # Write the dictionary as JSON
-            file.write(json.dumps(self.settings))
+        self.manager.save_settings()
 
     def render_widgets(self):
         main_tab = ttk.Notebook(self.root)
@@ -62,7 +99,12 @@ class YoutubeDownloader:
 
         self.render_download_tab(main_frame)
 
-        self.render_settings_tab(settings_frame)
+        # The Settings tab is rendered when it is opened for the first time, so it doesn't delay the first window
+        def on_tab_changed(event):
+            if main_tab.select() == str(settings_frame) and not settings_frame.winfo_children():
+                self.render_settings_tab(settings_frame)
+
+        main_tab.bind('<<NotebookTabChanged>>', on_tab_changed)
 
     def render_download_tab(self, main_frame: ttk.Frame):
         download_frame = ttk.LabelFrame(main_frame, text='Download from single URL')
@@ -84,6 +126,12 @@ class YoutubeDownloader:
         message_field.pack()
         message_scroll.config(command=message_field.yview)
 
+        # The progress of the running downloads
+        self.progress_text = tk.StringVar()
+        ttk.Label(download_frame, textvariable=self.progress_text, width=70, justify='left').grid(
+            row=8, columnspan=2, sticky='w', pady=(5, 0)
+        )
+
         ttk.Button(
             download_frame,
             text='Download mp3',
@@ -94,6 +142,11 @@ class YoutubeDownloader:
             text='Download video',
             command=lambda: self.download_video(url_entry.get(), message_field)
         ).grid(row=4, column=1)
+        ttk.Button(
+            download_frame,
+            text='Download audio',
+            command=lambda: self.download_audio(url_entry.get(), message_field)
+        ).grid(row=5, columnspan=2, pady=(5, 0))
 
         ttk.Separator(download_frame).grid(row=6, columnspan=2, pady=10, sticky='we')
 
@@ -106,7 +159,7 @@ class YoutubeDownloader:
             bookmarks_frame,
             textvariable=current_browser,
             width=30,
-            values=list(self.supported_browsers.keys())
+            values=[*self.supported_browsers.keys(), self.manager.all_profiles]
         )
         select_browser_dropdown.grid(row=1, column=1, pady=5, sticky='w')
 
@@ -122,12 +175,34 @@ class YoutubeDownloader:
         )
         ascending_checkbutton.grid(row=3, column=0, pady=5, sticky='w')
 
+        fuzzy = tk.BooleanVar()
+        fuzzy_checkbutton = ttk.Checkbutton(
+            bookmarks_frame,
+            text='Fuzzy search',
+            variable=fuzzy,
+            command=lambda: self.schedule_search(search_field.get(), number_entry.get(), fuzzy.get()),
+        )
+        fuzzy_checkbutton.grid(row=4, column=0, pady=5, sticky='w')
+
         ttk.Label(bookmarks_frame, text='Number of bookmarks: ').grid(row=5, column=0, sticky='w')
         number_entry = ttk.Entry(bookmarks_frame, width=5)
         number_entry.grid(row=5, column=1, sticky='w', pady=5)
 
-        loaded_bookmarks_frame = ScrollableFrame(bookmarks_frame)
+        # Only the visible bookmarks are rendered, so any number of them can be loaded
+        loaded_bookmarks_frame = VirtualScrollableFrame(
+            bookmarks_frame,
+            on_toggle=lambda index, is_selected: self.select_bookmark(self.bookmarks[index], is_selected),
+            on_near_end=self.load_next_page,
+        )
         loaded_bookmarks_frame.grid(row=9, columnspan=2, sticky='nsew')
+        self.loaded_bookmarks_frame = loaded_bookmarks_frame
+
+        # Search the loaded bookmarks while the user types
+        for entry in (search_field, number_entry):
+            entry.bind(
+                '<KeyRelease>',
+                lambda e: self.schedule_search(search_field.get(), number_entry.get(), fuzzy.get()),
+            )
 
         ttk.Button(
             bookmarks_frame,
@@ -138,6 +213,7 @@ class YoutubeDownloader:
                 search_field.get(),
                 ascending.get(),
                 number_entry.get(),
+                fuzzy.get(),
                 loaded_bookmarks_frame,
                 bookmarks_frame
             ),
@@ -145,6 +221,9 @@ class YoutubeDownloader:
 
         ttk.Separator(bookmarks_frame).grid(row=8, columnspan=2, sticky='we', pady=5)
 
+        # Continue the downloads of the previous session, as soon as the main loop starts
+        self.root.after(0, self.resume_downloads, message_field)
+
     def render_settings_tab(self, settings_frame: ttk.Frame):
         ttk.Label(settings_frame, text='Chose a browser: ').grid(row=2, column=0, padx=5, pady=5, sticky='w')
         current_browser = tk.StringVar()
@@ -162,11 +241,92 @@ class YoutubeDownloader:
             command=lambda: self.select_path_to_bookmarks(current_browser.get()),
         ).grid(row=4, column=1, sticky='w')
 
+        ttk.Label(settings_frame, text='Concurrent downloads: ').grid(row=5, column=0, padx=5, pady=5, sticky='w')
+        concurrency_entry = ttk.Entry(settings_frame, width=5)
+        concurrency_entry.insert(0, str(self.settings.get('concurrency', self.default_concurrency)))
+        concurrency_entry.grid(row=5, column=1, pady=5, sticky='w')
+
+        prefetch = tk.BooleanVar(value=self.settings.get('prefetch', False))
+        ttk.Checkbutton(
+            settings_frame,
+            text='Resolve the metadata of all bookmarks before downloading',
+            variable=prefetch,
+        ).grid(row=6, column=0, columnspan=2, padx=5, pady=5, sticky='w')
+
+        adaptive = tk.BooleanVar(value=self.settings.get('adaptive', False))
+        ttk.Checkbutton(
+            settings_frame,
+            text='Adapt the number of concurrent downloads to the connection',
+            variable=adaptive,
+        ).grid(row=7, column=0, columnspan=2, padx=5, pady=5, sticky='w')
+
+        ttk.Label(settings_frame, text='Bandwidth limit (MiB/s): ').grid(row=8, column=0, padx=5, pady=5, sticky='w')
+        bandwidth_entry = ttk.Entry(settings_frame, width=5)
+        bandwidth_entry.insert(0, str(self.settings.get('bandwidth_limit') or ''))
+        bandwidth_entry.grid(row=8, column=1, pady=5, sticky='w')
+
+        ttk.Label(settings_frame, text='Connections per file: ').grid(row=9, column=0, padx=5, pady=5, sticky='w')
+        connections_entry = ttk.Entry(settings_frame, width=5)
+        connections_entry.insert(0, str(self.settings.get('connections_per_file', self.default_connections)))
+        connections_entry.grid(row=9, column=1, pady=5, sticky='w')
+
+        expand_playlists = tk.BooleanVar(value=self.settings.get('expand_playlists', False))
+        ttk.Checkbutton(
+            settings_frame,
+            text='Download all videos of the bookmarked playlists and channels',
+            variable=expand_playlists,
+        ).grid(row=10, column=0, columnspan=2, padx=5, pady=5, sticky='w')
+
+        ttk.Label(settings_frame, text='Threads per transcode: ').grid(row=11, column=0, padx=5, pady=5, sticky='w')
+        threads_entry = ttk.Entry(settings_frame, width=5)
+        threads_entry.insert(0, str(self.settings.get('transcode_threads') or ''))
+        threads_entry.grid(row=11, column=1, pady=5, sticky='w')
+
         ttk.Button(
             settings_frame,
             text='Save',
-            command=self.save_settings
-        ).grid(row=6, column=1, pady=30)
+            command=lambda: self.save_download_settings(
+                concurrency_entry.get(), prefetch.get(), adaptive.get(), bandwidth_entry.get(), connections_entry.get(),
+                expand_playlists.get(), threads_entry.get()
+            )
+        ).grid(row=12, column=1, pady=30)
+
+    def save_download_settings(self, concurrency: str, prefetch: bool, adaptive: bool, bandwidth_limit: str,
+                               connections: str, expand_playlists: bool, transcode_threads: str):
+        # Keep the previous values if the user didn't fill in positive numbers
+        try:
+            concurrency = int(concurrency)
+            if concurrency > 0:
+                self.settings['concurrency'] = concurrency
+        except ValueError:
+            pass
+
+        try:
+            connections = int(connections)
+            if connections > 0:
+                self.settings['connections_per_file'] = connections
+        except ValueError:
+            pass
+
+        # An empty or invalid number of threads lets ffmpeg choose
+        try:
+            transcode_threads = int(transcode_threads)
+        except ValueError:
+            transcode_threads = None
+
+        # An empty or invalid bandwidth limit means no limit
+        try:
+            bandwidth_limit = float(bandwidth_limit)
+        except ValueError:
+            bandwidth_limit = None
+
+        self.settings['prefetch'] = prefetch
+        self.settings['adaptive'] = adaptive
+        self.settings['expand_playlists'] = expand_playlists
+        self.settings['bandwidth_limit'] = bandwidth_limit if bandwidth_limit and bandwidth_limit > 0 else None
+        self.settings['transcode_threads'] = transcode_threads if transcode_threads and transcode_threads > 0 else None
+
+        self.save_settings()
 
     def select_path_to_bookmarks(self, browser: str):
         # If the user didn't select a supported browser, do nothing
@@ -183,18 +343,70 @@ class YoutubeDownloader:
         # Set the path in the settings dictionary
         self.settings[browser] = path
 
-    def load_bookmarks(self, textbox: tk.Text, selected_browser, search, ascending, limit,
-                       parent_frame: ScrollableFrame, grandparent_frame: ttk.LabelFrame):
-        # Get a reference to the relevant inheritor of the BookmarkLoader class
-        loader = self.supported_browsers.get(selected_browser)
+    def load_bookmarks(self, textbox: tk.Text, selected_browser, search, ascending, limit, fuzzy,
+                       parent_frame: VirtualScrollableFrame, grandparent_frame: ttk.LabelFrame):
+        # Set up an instance of the relevant inheritor of the BookmarkLoader class. Without a selected path, it loads
+        # all profiles of the browser
+        loader = self.manager.get_loader(selected_browser)
 
         # If the user didn't select a supported browser, output a message and do nothing
         if not loader:
             self.output_message(textbox, 'Please select a supported browser')
             return
 
-        # Set up an instance of the inheritor of the BookmarkLoader class
-        self.loader = loader()
+        self.loader = loader
+        self.ascending = ascending
+        self.loaded_bookmarks = []
+        self.title_index = None
+        self.index_future = None
+        self.selected_bookmarks.clear()
+        self.select_all_listing = None
+        self.unselected_bookmarks.clear()
+        self.pending_search = None
+        self.pending_downloads = []
+
+        # Try to load the relevant browser's bookmarks, if the user has selected the correct path to the bookmarks file
+        try:
+            self.bookmarks = self.list_bookmarks(search, limit, fuzzy)
+            self.render_bookmarks(parent_frame, grandparent_frame, textbox)
+        except Exception as e:
+            # If an error is raised, output the error's message
+            self.output_message(textbox, str(e))
+            return
+
+        # The first page is shown, so index all bookmarks for the following searches
+        self.start_indexing()
+
+    def list_bookmarks(self, search: str, limit, fuzzy: bool) -> List[Bookmark]:
+        """
+        Returns the first page of the matching bookmarks. The following pages are loaded by load_next_page, when the
+        user scrolls down to them, unless all bookmarks are already loaded and indexed.
+
+        :param search: str. Search the bookmarks by a keyword case insensitively
+        :param limit: str. The maximum number of bookmarks, as filled in by the user
+        :param fuzzy: boolean. If it is True, bookmarks with similar words are found too, the most similar first
+        :return: list of the shown Bookmark objects
+        """
+
+        self.pages = None
+        self.listing = (search, limit, fuzzy)
+        self.pending_search = None
+
+        # The fuzzy search ranks all bookmarks by their similarity, so its results are shown when all of them are
+        # indexed, see check_index
+        if fuzzy and search.strip() and self.title_index is None:
+            self.pending_search = self.listing
+            self.start_indexing()
+            return []
+
+        # Once all bookmarks are indexed, every search is answered from memory
+        if self.title_index is not None:
+            bookmarks = self.search_bookmarks(search, limit, fuzzy)
+
+            for b in bookmarks:
+                b.is_selected = b.url in self.selected_bookmarks
+
+            return bookmarks
 
         # Try to set the limit argument, if the user filled in a number
         try:
@@ -202,46 +414,185 @@ class YoutubeDownloader:
         except ValueError:
             limit = None
 
-        # Try to load the relevant browser's bookmarks, if the user has selected the correct path to the bookmarks file
-        try:
-            self.bookmarks = self.loader.load_bookmarks(search, ascending, limit)
+        self.pages = self.manager.iter_pages(self.loader, search, self.ascending, self.page_size)
+        self.pages_limit = limit
 
-            self.render_bookmarks(parent_frame, grandparent_frame, textbox)
+        return self.next_page(0)
+
+    def start_indexing(self):
+        """
+        Loads all bookmarks and builds their index in a background thread, from the caches of the loader, so the
+        Tk main loop is not blocked. When it is done, the following searches are answered from memory.
+
+        :return: None
+        """
+
+        if self.title_index is not None or self.index_future is not None:
+            return
+
+        loader, ascending = self.loader, self.ascending
+
+        def build_index() -> Tuple[List[Bookmark], TitleIndex]:
+            bookmarks = self.manager.load_bookmarks(loader, '', ascending, None)
+            return bookmarks, TitleIndex(bookmarks, get_text=lambda bookmark: bookmark.title)
+
+        self.index_future = self.index_executor.submit(build_index)
+        self.root.after(self.index_poll_interval, self.check_index, self.index_future)
+
+    def check_index(self, future: Future):
+        # The bookmarks were loaded again in the meantime, so the index is of the previous ones
+        if future is not self.index_future:
+            return
+
+        if not future.done():
+            self.root.after(self.index_poll_interval, self.check_index, future)
+            return
+
+        try:
+            self.loaded_bookmarks, self.title_index = future.result()
         except Exception as e:
-            # If an error is raised, output the error's message
-            self.output_message(textbox, str(e))
+            # The searches keep reading the bookmarks page by page, and the fuzzy search tries to index them again
+            self.index_future = None
+            self.pending_search = None
+            pending_downloads, self.pending_downloads = self.pending_downloads, []
 
-    def render_bookmarks(self, parent_frame: ScrollableFrame, grand_parent_frame: ttk.LabelFrame, textbox: tk.Text):
-        # Clear the rendered bookmarks
-        self.clear_frame(parent_frame.scrollable_frame)
+            for textbox, _ in pending_downloads:
+                self.output_message(textbox, f'The bookmarks could not be loaded: {e}')
 
-        # For every bookmark, render it in the scrollable frame
-        for index, bookmark in enumerate(self.bookmarks):
-            self.render_single_bookmark(parent_frame.scrollable_frame, index, bookmark)
+            return
 
-        # After all bookmarks are rendered, render the footer buttons
-        self.render_footer_buttons(grand_parent_frame, textbox)
+        if self.select_all_listing is not None:
+            self.resolve_select_all()
+
+        # Show the results of the fuzzy search, which waited for the index
+        if self.pending_search is not None:
+            self.apply_search(*self.pending_search)
+
+        pending_downloads, self.pending_downloads = self.pending_downloads, []
+
+        for textbox, target_format in pending_downloads:
+            self.download_selected(textbox, target_format)
+
+    def resolve_select_all(self):
+        """
+        Selects all bookmarks of the listing, on which all bookmarks were selected before all of its pages were loaded,
+        from the index.
+
+        :return: None
+        """
+
+        search, limit, fuzzy = self.select_all_listing
+        self.select_all_listing = None
+
+        for b in self.search_bookmarks(search, limit, fuzzy):
+            if b.url not in self.unselected_bookmarks:
+                self.selected_bookmarks[b.url] = b
+
+        self.unselected_bookmarks.clear()
+
+        # The shown bookmarks of another search may be among them too
+        for b in self.bookmarks:
+            b.is_selected = b.url in self.selected_bookmarks
 
-    def render_single_bookmark(self, parent: tk.Frame, row, bookmark: Bookmark) -> None:
-        # Set up a tk.Frame, and put it in the parent Frame
-        bookmark_frame = tk.Frame(parent)
-        bookmark_frame.grid(row=row, column=0, sticky='we')
-
-        # Set up a tk.BooleanVar, representing the is_selected state of the *rendered* bookmark,
-        # and append it to an instance collection
-        is_selected = tk.BooleanVar()
-        self.bookmarks_state.append(is_selected)
-
-        # Render a ttk.Checkbutton, allowing the user to select and unselect the corresponding bookmark
-        selected_checkbutton = ttk.Checkbutton(
-            bookmark_frame,
-            variable=is_selected,
-            command=lambda: self.select_bookmark(bookmark, is_selected.get()),
+        self.loaded_bookmarks_frame.update_selection(lambda bookmark: bookmark.is_selected)
+
+    def load_next_page(self):
+        # Called by the bookmarks frame, when the user scrolls near the end of the shown bookmarks
+        if self.pages is None:
+            return
+
+        try:
+            page = self.next_page(len(self.bookmarks))
+        except Exception:
+            # The first page was read fine, so the bookmarks file changed meanwhile. Stop loading more
+            self.pages = None
+            return
+
+        # The page is appended to the shown bookmarks too, as they are the items of the frame
+        if page:
+            self.loaded_bookmarks_frame.append_items(page, is_selected=lambda bookmark: bookmark.is_selected)
+
+    def next_page(self, shown: int) -> List[Bookmark]:
+        """
+        :param shown: int. The number of the already shown bookmarks of the listing
+        :return: list of the Bookmark objects of the next page, which is empty if there are no more
+        """
+
+        page = next(self.pages, None) if self.pages_limit is None or shown < self.pages_limit else None
+
+        if page is None:
+            self.pages = None
+            return []
+
+        if self.pages_limit is not None:
+            page = page[:self.pages_limit - shown]
+
+        for b in page:
+            # The pages of the listing, whose bookmarks are all selected, are selected as they are loaded
+            if self.select_all_listing == self.listing and b.url not in self.unselected_bookmarks:
+                self.selected_bookmarks[b.url] = b
+
+            b.is_selected = b.url in self.selected_bookmarks
+
+        return page
+
+    def search_bookmarks(self, search: str, limit, fuzzy: bool) -> List[Bookmark]:
+        """
+        :param search: str. Search the loaded bookmarks by a keyword case insensitively
+        :param limit: str. The maximum number of bookmarks, as filled in by the user
+        :param fuzzy: boolean. If it is True, bookmarks with similar words are found too, the most similar first
+        :return: list of the matching Bookmark objects
+        """
+
+        if self.title_index is None:
+            return []
+
+        # Try to set the limit argument, if the user filled in a number
+        try:
+            limit = int(limit)
+        except ValueError:
+            limit = None
+
+        if fuzzy and search.strip():
+            return self.title_index.fuzzy_search(search, limit)
+
+        return self.title_index.search(search, limit)
+
+    def schedule_search(self, search: str, limit, fuzzy: bool):
+        # Search only after the user stops typing for a moment, so a fast typist doesn't queue up a search per key
+        if self._search_job is not None:
+            self.root.after_cancel(self._search_job)
+
+        self._search_job = self.root.after(self.search_delay, lambda: self.apply_search(search, limit, fuzzy))
+
+    def apply_search(self, search: str, limit, fuzzy: bool):
+        self._search_job = None
+
+        # Nothing to search before the bookmarks are loaded
+        if self.loader is None or self.loaded_bookmarks_frame is None:
+            return
+
+        try:
+            self.bookmarks = self.list_bookmarks(search, limit, fuzzy)
+        except Exception:
+            # The error was shown, when the bookmarks were loaded
+            return
+
+        # Keep the selection of the bookmarks, which were selected before the search changed
+        self.loaded_bookmarks_frame.set_items(
+            self.bookmarks,
+            get_text=lambda bookmark: bookmark.title,
+            is_selected=lambda bookmark: bookmark.is_selected,
         )
-        selected_checkbutton.grid(row=0, column=0, sticky='w')
 
-        # Render a Label with the bookmark's title as text
-        ttk.Label(bookmark_frame, text=bookmark.title).grid(row=0, column=1, sticky='we')
+    def render_bookmarks(self, parent_frame: VirtualScrollableFrame, grand_parent_frame: ttk.LabelFrame,
+                         textbox: tk.Text):
+        # Render the loaded bookmarks. The previous ones are replaced, and the new ones are not selected
+        self.all_selected = False
+        parent_frame.set_items(self.bookmarks, get_text=lambda bookmark: bookmark.title)
+
+        # After all bookmarks are rendered, render the footer buttons
+        self.render_footer_buttons(grand_parent_frame, textbox)
 
     def render_footer_buttons(self, grand_parent_frame: ttk.LabelFrame, textbox: tk.Text):
         # Create a Frame to contain the footer buttons and put it at the bottom of the bookmarks LabelFrame
@@ -269,101 +620,211 @@ class YoutubeDownloader:
             command=lambda: self.download_videos(textbox)
         ).grid(row=0, column=2)
 
-    @staticmethod
-    def select_bookmark(bookmark: Bookmark, is_selected):
+        # Create a button to download the audio of all selected bookmarks in its own codec, without re-encoding it
+        ttk.Button(
+            button_frame,
+            text='Download audio',
+            command=lambda: self.download_audios(textbox)
+        ).grid(row=0, column=3)
+
+    def select_bookmark(self, bookmark: Bookmark, is_selected):
         """
         :param bookmark: 'Bookmark'. An element of the bookmarks instance list
-        :param is_selected: The state of the rendered bookmark's ttk.Checkbutton variable
+        :param is_selected: The state of the rendered bookmark's ttk.Checkbutton
         :return: None
         """
         bookmark.is_selected = is_selected
 
+        if is_selected:
+            self.selected_bookmarks[bookmark.url] = bookmark
+            self.unselected_bookmarks.discard(bookmark.url)
+        else:
+            self.selected_bookmarks.pop(bookmark.url, None)
+
+            # Keep it unselected, when the rest of the selected listing is taken from the index
+            if self.select_all_listing is not None:
+                self.unselected_bookmarks.add(bookmark.url)
+
     def select_unselect_all_bookmarks(self):
         # Switch the state of the instance all_selected variable
         self.all_selected = not self.all_selected
 
+        # The pages, which are not loaded yet, are selected as they are loaded, or from the index, when it is built.
+        # They are not loaded here, as that would block the window until all of them are rendered
+        if self.all_selected and self.pages is not None:
+            self.select_all_listing = self.listing
+            self.unselected_bookmarks.clear()
+        else:
+            self.select_all_listing = None
+
         # Set all loaded bookmarks' is_selected to the state of the instance all_selected variable
         for b in self.bookmarks:
-            b.is_selected = self.all_selected
+            self.select_bookmark(b, self.all_selected)
 
-        # Set all rendered bookmarks' ttk.Checkbutton variables to the state of the instance all_selected variable,
-        # and check/uncheck the buttons
-        for bs in self.bookmarks_state:
-            bs.set(self.all_selected)
+        # Set the selection state of the rendered bookmarks, and check/uncheck the buttons
+        self.loaded_bookmarks_frame.set_all(self.all_selected)
 
-    @staticmethod
-    def output_message(textbox: tk.Text, message: str):
-        textbox.insert(tk.END, message + '\n')
+        # The index is already built, so the rest of the listing is selected or unselected at once
+        if self.select_all_listing is not None and self.title_index is not None:
+            self.resolve_select_all()
+        elif not self.all_selected and self.pages is not None and self.title_index is not None:
+            for b in self.search_bookmarks(*self.listing):
+                self.selected_bookmarks.pop(b.url, None)
 
-    def clear_frame(self, frame: tk.Frame):
-        # Clear the ttk.Checkbutton variables, representing the is_selected state of the *rendered* bookmarks
-        # The loaded bookmarks are rewritten at the press of the 'Load bookmarks' button
-        self.bookmarks_state = []
+    def output_message(self, textbox: tk.Text, message: str):
+        self.output_messages(textbox, [message])
 
-        # Clear the rendered elements in the parent frame
-        for element in frame.grid_slaves():
-            element.destroy()
+    def output_messages(self, textbox: tk.Text, messages: List[str]):
+        if not messages:
+            return
 
-    def download_videos(self, textbox: tk.Text):
-        # All bookmarks where is_selected is True
-        bookmarks_to_download = [b for b in self.bookmarks if b.is_selected]
+        self.message_log.extend(messages)
+
+        # A single insert for the whole batch
+        textbox.insert(tk.END, ''.join(m + '\n' for m in messages))
+
+        # Remove the oldest lines above the size of the log
+        line_count = int(textbox.index('end-1c').split('.')[0]) - 1
+        excess = line_count - self.message_log.max_lines
+        if excess > 0:
+            textbox.delete('1.0', f'{excess + 1}.0')
+
+        textbox.see(tk.END)
+
+    def render_progress(self, max_lines: int = 5):
+        # Show the latest progress of the first few running downloads, and the number of the rest
+        events = list(self.progress.values())
+        lines = [str(e) for e in events[:max_lines]]
 
-        for b in bookmarks_to_download:
-            self.output_message(textbox, message=f'Downloading "{b.title}"')
-            try:
-                self.download_video(b.url, textbox)
-            except Exception as e:
-                self.output_message(textbox, message=str(e))
+        if len(events) > max_lines:
+            lines.append(f'... and {len(events) - max_lines} more')
+
+        self.progress_text.set('\n'.join(lines))
+
+    def download_videos(self, textbox: tk.Text):
+        self.download_selected(textbox, 'mkv')
 
     def download_video(self, url, textbox: tk.Text, output_path='Downloads'):
-        ydl_opts = {
-            'format': 'bestvideo[height<=2160]+bestaudio/best',  # Download the best video and audio separately
-            'outtmpl': output_path + '/%(title)s.%(ext)s',  # Template for output filename
-            'merge_output_format': 'mkv',  # Merge into mp4 format
-            'postprocessors': [{
-                'key': 'FFmpegVideoConvertor',  # Ensures conversion if needed
-                'preferedformat': 'mkv',  # Preferred format for the output file
-            }],
-            'noplaylist': True,  # Do not download the entire playlist, only the video
-            'playlist_items': '1',  # Only download the first video if it's a playlist
-        }
-
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info_dict = ydl.extract_info(url, download=True)
-            title = info_dict.get('title', None)
-
-            self.output_message(textbox, message=f'"{title}" was downloaded successfully')
+        info_dict = batch_downloader.download_video(url, output_path, self.metadata_cache, self.manager.session_pool)
+        title = info_dict.get('title', None)
 
-    def download_mp3s(self, textbox: tk.Text):
-        # All bookmarks where is_selected is True
-        bookmarks_to_download = [b for b in self.bookmarks if b.is_selected]
+        self.output_message(textbox, message=f'"{title}" was downloaded successfully')
 
-        for b in bookmarks_to_download:
-            self.output_message(textbox, message=f'Downloading "{b.title}"')
-            try:
-                self.download_mp3(b.url, textbox)
-            except Exception as e:
-                self.output_message(textbox, message=str(e))
+    def download_mp3s(self, textbox: tk.Text):
+        self.download_selected(textbox, 'mp3')
 
     def download_mp3(self, url, textbox: tk.Text, output_path='Downloads'):
-        ydl_opts = {
-            'format': 'bestaudio/best',
-            'outtmpl': output_path + '/%(title)s.%(ext)s',  # Save as original format first
-            'postprocessors': [{
-                'key': 'FFmpegExtractAudio',
-                'preferredcodec': 'mp3',
-                'preferredquality': '0',  # '0' ensures the best possible quality
-            }],
-            'noplaylist': True,  # Do not download the entire playlist, only the video
-            'playlist_items': '1',  # Only download the first video if it's a playlist
-        }
-
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            # Extract and download the first video only
-            info_dict = ydl.extract_info(url, download=True)
-            title = info_dict.get('title', None)
-
-            self.output_message(textbox, message=f'"{title}" was downloaded successfully')
+        info_dict = batch_downloader.download_mp3(url, output_path, self.metadata_cache, self.manager.session_pool)
+        title = info_dict.get('title', None)
+
+        self.output_message(textbox, message=f'"{title}" was downloaded successfully')
+
+    def download_audios(self, textbox: tk.Text):
+        self.download_selected(textbox, 'audio')
+
+    def download_audio(self, url, textbox: tk.Text, output_path='Downloads'):
+        info_dict = batch_downloader.download_audio(url, output_path, self.metadata_cache, self.manager.session_pool)
+        title = info_dict.get('title', None)
+
+        self.output_message(textbox, message=f'"{title}" was downloaded successfully')
+
+    def download_selected(self, textbox: tk.Text, target_format: str):
+        # All bookmarks of a listing were selected, before all of them were loaded, so the download waits until they
+        # are taken from the index, see check_index
+        if self.select_all_listing is not None:
+            self.pending_downloads.append((textbox, target_format))
+            self.start_indexing()
+            return
+
+        # All selected bookmarks, including the ones not shown by the current search, every video once
+        bookmarks_to_download = deduplicate_bookmarks(self.selected_bookmarks.values())
+
+        if not bookmarks_to_download:
+            return
+
+        # Store the jobs first, so the batch survives a crash or a restart
+        self.manager.job_queue.add(bookmarks_to_download, target_format)
+        self.output_messages(textbox, [f'Downloading "{b.title}"' for b in bookmarks_to_download])
+
+        # Start polling for results, unless a previous batch is already doing it
+        if self.start_downloads():
+            self.root.after(100, self.poll_download_results, textbox)
+
+    def resume_downloads(self, textbox: tk.Text):
+        # Continue the jobs, which were not finished when the application was closed. The running ones are taken over
+        # when their leases expire, unless another worker process is still downloading them
+        counts = self.manager.job_queue.counts()
+        pending = counts[PENDING] + counts[RUNNING]
+
+        if pending == 0:
+            return
+
+        self.output_message(textbox, f'Resuming {pending} unfinished downloads')
+
+        if self.start_downloads():
+            self.root.after(100, self.poll_download_results, textbox)
+
+    def start_downloads(self) -> bool:
+        """
+        Starts downloading the jobs of the queue, unless they are already being downloaded.
+
+        :return: boolean. True if the downloads were started
+        """
+
+        # The running workers take the new jobs from the queue too
+        if self.running_batches > 0:
+            return False
+
+        # Run the batch off the Tk main thread. The downloads and the ffmpeg transcodes run in separate stages,
+        # so the network and the CPU are both kept busy. The workers only post the results and the progress
+        # to the message bus, because the Tk widgets must be accessed from the main thread only
+        pipeline = self.manager.create_pipeline(bus=self.message_bus)
+
+        def on_finish():
+            # Output the statistics of both stages and the timings of all stages in this session, followed by the end
+            # of batch marker
+            self.message_bus.post(str(pipeline.network_stats))
+            self.message_bus.post(str(pipeline.cpu_stats))
+
+            for line in self.manager.metrics.summary():
+                self.message_bus.post(line)
+
+            self.message_bus.post(None)
+
+        pipeline.start_queue(self.manager.job_queue, on_result=self.message_bus.post, on_finish=on_finish)
+        self.running_batches += 1
+
+        return True
+
+    def poll_download_results(self, textbox: tk.Text):
+        # Take all messages, which are ready, with only the latest progress of every download
+        messages, progress = self.message_bus.drain()
+        self.progress.update(progress)
+        lines = []
+
+        for message in messages:
+            # None marks the end of a batch
+            if message is None:
+                self.running_batches -= 1
+                continue
+
+            # A finished job has no progress to show any more
+            if isinstance(message, DownloadResult):
+                self.progress.pop(message.bookmark.canonical_url, None)
+
+            lines.append(str(message))
+
+        # Update the widgets once per tick, however many messages there were
+        self.output_messages(textbox, lines)
+        self.render_progress()
+
+        # Jobs, which were added just as the workers finished, are started again
+        if self.running_batches == 0 and not self.manager.job_queue.is_finished():
+            self.start_downloads()
+
+        # Keep polling while there are running batches
+        if self.running_batches > 0:
+            self.root.after(100, self.poll_download_results, textbox)
 
     def run(self):
         self.root.mainloop()